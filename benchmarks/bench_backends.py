@@ -0,0 +1,107 @@
+"""
+儲存後端效能比較：JSON vs JSON(log 模式) vs SQLite
+
+執行方式：
+    python benchmarks/bench_backends.py [帳戶數] [既有交易數] [操作次數]
+
+量測項目（每項皆為單次平均毫秒數）：
+- deposit：TransactionModule.deposit（讀帳戶 + 更新餘額 + 記錄交易）
+- get_account：單一帳戶查詢
+- get_history：單一帳戶最近 10 筆交易
+"""
+
+import os
+import random
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.data_manager import DataManager
+from modules.account import AccountModule
+from modules.history import HistoryModule
+from modules.transaction import TransactionModule
+
+
+def seed(dm, num_accounts, num_transactions):
+    """直接寫入初始資料（不計時）"""
+    accounts = {
+        f"ACC{i:04d}": {"name": f"user{i}", "balance": 1000.0, "created_date": "2025-10-20T00:00:00"}
+        for i in range(1, num_accounts + 1)
+    }
+    transactions = [
+        {
+            "transaction_id": f"TXN{i:04d}",
+            "account_id": f"ACC{random.randint(1, num_accounts):04d}",
+            "type": "DEPOSIT",
+            "amount": 1.0,
+            "balance_after": 1000.0,
+            "timestamp": f"2025-10-20T00:00:00.{i:06d}"
+        }
+        for i in range(1, num_transactions + 1)
+    ]
+    dm.save_accounts(accounts)
+    dm.save_transactions(transactions)
+    config = {"next_account_id": num_accounts + 1, "next_transaction_id": num_transactions + 1}
+    if dm.backend == "sqlite":
+        with dm.conn:
+            for key, value in config.items():
+                dm.conn.execute("UPDATE config SET value = ? WHERE key = ?", (str(value), key))
+    else:
+        stored = dm._load_json(dm.config_file)
+        stored.update(config)
+        dm._save_json(dm.config_file, stored)
+
+
+def timed(func, ops):
+    """回傳每次操作的平均毫秒數"""
+    start = time.perf_counter()
+    for i in range(ops):
+        func(i)
+    return (time.perf_counter() - start) * 1000 / ops
+
+
+def run(label, make_dm, num_accounts, num_transactions, ops):
+    """對單一後端執行所有量測"""
+    data_dir = f"bench_data_{label}"
+    shutil.rmtree(data_dir, ignore_errors=True)
+    dm = make_dm(data_dir)
+    seed(dm, num_accounts, num_transactions)
+
+    account_mod = AccountModule(dm)
+    history_mod = HistoryModule(dm)
+    transaction_mod = TransactionModule(account_mod, history_mod)
+    ids = [f"ACC{random.randint(1, num_accounts):04d}" for _ in range(ops)]
+
+    result = {
+        "deposit": timed(lambda i: transaction_mod.deposit(ids[i], 1.0), ops),
+        "get_account": timed(lambda i: account_mod.get_account(ids[i]), ops),
+        "get_history": timed(lambda i: history_mod.get_history(ids[i], 10), ops),
+    }
+    if hasattr(dm, "close"):
+        dm.close()
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return result
+
+
+def main():
+    num_accounts = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    num_transactions = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    ops = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    backends = {
+        "json": lambda d: DataManager(d, backend="json"),
+        "json-log": lambda d: DataManager(d, backend="json", transaction_storage="log"),
+        "sqlite": lambda d: DataManager(d, backend="sqlite"),
+    }
+
+    print(f"帳戶數={num_accounts} 既有交易數={num_transactions} 操作次數={ops}")
+    print(f"{'backend':<10} {'deposit(ms)':>12} {'get_account(ms)':>16} {'get_history(ms)':>16}")
+    for label, make_dm in backends.items():
+        r = run(label, make_dm, num_accounts, num_transactions, ops)
+        print(f"{label:<10} {r['deposit']:>12.3f} {r['get_account']:>16.3f} {r['get_history']:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
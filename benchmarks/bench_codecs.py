@@ -0,0 +1,73 @@
+"""
+序列化格式效能比較
+
+執行方式：
+    python benchmarks/bench_codecs.py [筆數 ...]
+
+預設量測 100,000 與 1,000,000 筆交易記錄，每種可用格式輸出：
+- save(s)：DataManager.save_transactions（編碼 + 原子寫入 + fsync）
+- load(s)：冷快取下的 DataManager.load_transactions（讀檔 + 解碼）
+- size(MB)：transactions.json 佔用的磁碟空間
+"""
+
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.data_manager import DataManager
+from modules.serialization import available_codecs
+
+
+def make_transactions(count):
+    """產生測試用交易記錄"""
+    return [
+        {
+            "transaction_id": f"TXN{i:04d}",
+            "account_id": f"ACC{i % 5000:04d}",
+            "type": "DEPOSIT" if i % 3 else "WITHDRAW",
+            "amount": 100.0 + i % 97,
+            "balance_after": 1000.0 + i,
+            "timestamp": f"2025-10-20T12:{i // 60 % 60:02d}:{i % 60:02d}.{i % 1000000:06d}"
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def measure(codec, transactions):
+    """回傳 (save 秒數, load 秒數, 檔案位元組數)"""
+    data_dir = f"bench_codec_{codec}"
+    shutil.rmtree(data_dir, ignore_errors=True)
+    dm = DataManager(data_dir, backend="json", codec=codec)
+
+    start = time.perf_counter()
+    dm.save_transactions(transactions)
+    save_seconds = time.perf_counter() - start
+
+    dm.invalidate_cache()
+    start = time.perf_counter()
+    loaded = dm.load_transactions()
+    load_seconds = time.perf_counter() - start
+    assert len(loaded) == len(transactions)
+
+    size = os.path.getsize(dm.transactions_file)
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return save_seconds, load_seconds, size
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [100000, 1000000]
+    print(f"可用格式: {', '.join(available_codecs())}")
+    for count in counts:
+        transactions = make_transactions(count)
+        print(f"\n筆數={count}")
+        print(f"{'codec':<14} {'save(s)':>9} {'load(s)':>9} {'size(MB)':>10}")
+        for codec in available_codecs():
+            save_seconds, load_seconds, size = measure(codec, transactions)
+            print(f"{codec:<14} {save_seconds:>9.3f} {load_seconds:>9.3f} {size / 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
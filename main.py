@@ -13,12 +13,20 @@ from modules.history import HistoryModule
 from modules.transaction import TransactionModule
 
 
+# 查詢交易記錄時每頁顯示的筆數
+HISTORY_PAGE_SIZE = 20
+
+# 互動式操作量小：每次只預留少量 ID，異常結束時跳過的空號也少
+# （正常結束時 close() 會歸還未用完的 ID）
+CLI_ID_BLOCK_SIZE = 10
+
+
 class BankSystem:
     """銀行系統主程式"""
     
     def __init__(self):
         """初始化系統"""
-        self.data_manager = DataManager()
+        self.data_manager = DataManager(id_block_size=CLI_ID_BLOCK_SIZE)
         self.account_module = AccountModule(self.data_manager)
         self.history_module = HistoryModule(self.data_manager)
         self.transaction_module = TransactionModule(
@@ -124,31 +132,43 @@ class BankSystem:
             print(f"❌ 發生錯誤: {e}")
     
     def query_history_ui(self):
-        """查詢交易記錄 UI"""
+        """查詢交易記錄 UI（分頁顯示）"""
         print("\n--- 查詢交易記錄 ---")
         account_id = input("請輸入帳號: ").strip()
         
         try:
-            limit_str = input("顯示筆數 (按Enter顯示全部): ").strip()
-            limit = int(limit_str) if limit_str else 0
-            
-            history = self.history_module.get_history(account_id, limit)
+            limit_str = input(f"每頁筆數 (按Enter為 {HISTORY_PAGE_SIZE} 筆): ").strip()
+            limit = int(limit_str) if limit_str else HISTORY_PAGE_SIZE
+            if limit <= 0:
+                limit = HISTORY_PAGE_SIZE
             
-            if not history:
+            page = self.history_module.get_history_page(account_id, limit)
+            if not page["transactions"]:
                 print(f"❌ 無交易記錄")
                 return
             
-            print(f"\n✅ 交易記錄 (共 {len(history)} 筆):")
+            shown = 0
+            print(f"\n✅ 交易記錄 (最新的在前):")
             print("-" * 80)
             print(f"{'交易編號':<12} {'類型':<15} {'金額':<12} {'餘額':<12} {'時間'}")
             print("-" * 80)
             
-            for txn in history:
-                print(f"{txn['transaction_id']:<12} "
-                      f"{txn['type']:<15} "
-                      f"${txn['amount']:<11.2f} "
-                      f"${txn['balance_after']:<11.2f} "
-                      f"{txn['timestamp'][:19]}")
+            while True:
+                for txn in page["transactions"]:
+                    print(f"{txn['transaction_id']:<12} "
+                          f"{txn['type']:<15} "
+                          f"${txn['amount']:<11.2f} "
+                          f"${txn['balance_after']:<11.2f} "
+                          f"{txn['timestamp'][:19]}")
+                shown += len(page["transactions"])
+                if page["next_cursor"] is None:
+                    print(f"-- 共 {shown} 筆 --")
+                    return
+                more = input(f"-- 已顯示 {shown} 筆，按Enter顯示下一頁，輸入 q 結束: ").strip()
+                if more.lower() == "q":
+                    return
+                page = self.history_module.get_history_page(account_id, limit,
+                                                            after=page["next_cursor"])
         except Exception as e:
             print(f"❌ 查詢失敗: {e}")
     
@@ -238,6 +258,7 @@ class BankSystem:
 
 
 if __name__ == "__main__":
+    system = None
     try:
         system = BankSystem()
         system.run()
@@ -246,4 +267,7 @@ if __name__ == "__main__":
         sys.exit(0)
     except Exception as e:
         print(f"\n❌ 系統錯誤: {e}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+    finally:
+        if system is not None:
+            system.data_manager.close()
\ No newline at end of file
@@ -15,6 +15,8 @@ Account Module
 from datetime import datetime
 from typing import Dict, Optional
 
+from modules.money import read_minor, to_major, to_minor
+
 
 class AccountModule:
     """帳戶模組"""
@@ -47,37 +49,37 @@ class AccountModule:
             ValueError: 如果名稱為空或餘額 < 0
         
         [設計決策]
-        - 帳號格式：ACC + 4位數字 (ACC0001)
+        - 帳號格式：ACC + 至少4位數字 (ACC0001)
         - 初始餘額必須 >= 0
-        - 建立後自動遞增帳號流水號
+        - 帳號流水號由 DataManager 配發（讀取與遞增為同一個操作）
+        - 餘額以「分」的整數儲存（modules/money.py）
+        - version 從 0 開始，每次更新餘額 +1（樂觀鎖）
         """
         # Step 1: 驗證輸入
         if not name or name.strip() == "":
             raise ValueError("帳戶名稱不能為空")
-        if initial_balance < 0:
+        initial_minor = to_minor(initial_balance)
+        if initial_minor < 0:
             raise ValueError("初始餘額不能為負數")
         
-        # Step 2: 載入現有帳戶
-        accounts = self.data_manager.load_accounts()
-        
-        # Step 3: 生成新帳號 ID
-        next_id = self.data_manager.get_next_account_id()
+        # Step 2: 配發新帳號 ID（超過 9999 時自動加寬）
+        next_id = self.data_manager.allocate_account_id()
         account_id = f"ACC{next_id:04d}"
         
-        # Step 4: 建立帳戶資料
-        accounts[account_id] = {
+        # Step 3: 建立帳戶資料
+        account = {
             "name": name.strip(),
-            "balance": float(initial_balance),
-            "created_date": datetime.now().isoformat()
+            "balance": initial_minor,
+            "created_date": datetime.now().isoformat(),
+            "version": 0
         }
         
-        # Step 5: 儲存回檔案
-        self.data_manager.save_accounts(accounts)
-        self.data_manager.increment_account_id()
+        # Step 4: 儲存（只新增這一筆帳戶）
+        self.data_manager.add_account(account_id, account)
         
         return account_id
     
-    def get_account(self, account_id: str) -> Optional[Dict]:
+    def get_account(self, account_id: str, minor_units: bool = False) -> Optional[Dict]:
         """
         查詢帳戶資訊
         
@@ -85,12 +87,15 @@ class AccountModule:
         
         輸入：
             account_id (str): 帳號 ID
+            minor_units (bool): True 時 balance 為「分」的整數（交易計算、對帳使用），
+                預設為「元」
         
         輸出：
             dict: {
                 "name": "張三",
                 "balance": 1000.0,
-                "created_date": "2025-10-20T10:30:00"
+                "created_date": "2025-10-20T10:30:00",
+                "version": 3          # 每次更新餘額 +1
             }
             或 None (如果帳戶不存在)
         
@@ -101,10 +106,17 @@ class AccountModule:
             else:
                 print("帳戶不存在")
         """
-        accounts = self.data_manager.load_accounts()
-        return accounts.get(account_id)
+        # DataManager 回傳副本，避免呼叫端直接改到快取
+        account = self.data_manager.get_account(account_id)
+        if account is not None:
+            balance = read_minor(account["balance"])
+            account["balance"] = balance if minor_units else to_major(balance)
+            account.setdefault("version", 0)
+        return account
     
-    def update_balance(self, account_id: str, new_balance: float) -> bool:
+    def update_balance(self, account_id: str, new_balance: float,
+                       minor_units: bool = False,
+                       expected_version: Optional[int] = None) -> bool:
         """
         更新帳戶餘額
         
@@ -113,9 +125,12 @@ class AccountModule:
         輸入：
             account_id (str): 帳號 ID
             new_balance (float): 新餘額
+            minor_units (bool): True 時 new_balance 為「分」的整數
+            expected_version (int, optional): get_account() 讀到的 version；
+                給定時只有版本未改變才會更新（compare-and-swap）
         
         輸出：
-            bool: True=成功, False=失敗
+            bool: True=成功, False=失敗（帳戶不存在，或版本已改變需重新讀取）
         
         [討論事項]
         1. 與團隊討論：
@@ -131,11 +146,8 @@ class AccountModule:
         - 需要先檢查帳戶是否存在
         - 需要驗證 new_balance 是否合理
         """
-        # [已提供] 載入帳戶
-        accounts = self.data_manager.load_accounts()
-        
         # [已提供] 檢查帳戶存在
-        if account_id not in accounts:
+        if self.data_manager.get_account(account_id) is None:
             return False
         
         # ========== [留白區域] 驗證新餘額 ==========
@@ -156,11 +168,9 @@ class AccountModule:
         
         
         
-        # [已提供] 更新餘額
-        accounts[account_id]["balance"] = float(new_balance)
-        
-        # [已提供] 儲存
-        return self.data_manager.save_accounts(accounts)
+        # [已提供] 更新餘額並儲存（只寫入單一帳戶，以分為單位）
+        new_minor = new_balance if minor_units else to_minor(new_balance)
+        return self.data_manager.update_balance(account_id, new_minor, expected_version)
     
     def account_exists(self, account_id: str) -> bool:
         """
@@ -0,0 +1,291 @@
+"""
+Analytics Module
+交易分析 - 以欄位式（columnar）NumPy 陣列彙總交易記錄
+
+[完整實作 100%] 由整合者提供，組員直接使用
+
+[設計決策]
+- 交易記錄轉成欄位陣列：amount / balance_after 為 int64（分），
+  timestamp 為 int64（epoch 微秒），type / account 為類別代碼（int32）
+  加上代碼 → 名稱的對照表；分組、加總、計數、百分位數都以向量運算完成，
+  不逐筆走訪 dict
+- 增量更新：記住 DataManager.get_transactions_since 回傳的位置，
+  每次查詢前只讀入之後新增的交易，接到陣列尾端（容量倍增，攤銷 O(1)）；
+  交易記錄被整份覆寫（位置失效，StalePositionError）時自動從頭重建
+- numpy 為選用套件：未安裝時其他模組照常運作，
+  只有建立 TransactionAnalytics 時拋出 ImportError
+- 金額以分的整數加總沒有誤差，回傳時轉回元
+"""
+
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - 依環境而定
+    np = None
+
+from modules.data_manager import StalePositionError
+from modules.money import read_minor, to_major
+
+
+GROUP_KEYS = ("account", "type", "day")
+VALUE_COLUMNS = ("amount", "balance_after")
+MICROS_PER_DAY = 86_400 * 1_000_000
+
+TimeBound = Optional[Union[str, datetime]]
+
+
+class TransactionAnalytics:
+    """
+    交易記錄的欄位式分析檢視
+
+    查詢共用的篩選條件（皆為關鍵字參數，可省略）：
+        transaction_type (str): 只取特定類型
+        account_id (str): 只取單一帳戶
+        start / end (str/datetime): 只取 start <= timestamp < end
+
+    分組方式 by：None（整體）、"account"、"type"、"day"（日期字串 YYYY-MM-DD）
+
+    使用範例：
+        analytics = TransactionAnalytics(history)
+        analytics.sum(by="day", transaction_type="DEPOSIT")       # 每日存款總額
+        analytics.mean(by="account", transaction_type="WITHDRAW")  # 各帳戶平均提款金額
+        analytics.percentile(95, transaction_type="WITHDRAW")      # 提款金額的 P95
+    """
+
+    def __init__(self, history_module):
+        """
+        參數：
+            history_module: HistoryModule 實例（透過它的 DataManager 讀取交易）
+
+        例外：
+            ImportError: 未安裝 numpy
+        """
+        if np is None:
+            raise ImportError("TransactionAnalytics 需要 numpy（pip install numpy）")
+        self.history = history_module
+        self.data_manager = history_module.data_manager
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        """清空所有欄位（呼叫端需持有 _lock 或在初始化中）"""
+        self._position = 0
+        self._size = 0
+        self._columns = {
+            "amount": np.empty(0, dtype=np.int64),
+            "balance_after": np.empty(0, dtype=np.int64),
+            "timestamp": np.empty(0, dtype=np.int64),
+            "type": np.empty(0, dtype=np.int32),
+            "account": np.empty(0, dtype=np.int32),
+        }
+        self.types: List[str] = []
+        self.accounts: List[str] = []
+        self._type_codes: Dict[str, int] = {}
+        self._account_codes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def column(self, name: str) -> "np.ndarray":
+        """
+        取得欄位陣列（唯讀檢視）
+
+        amount / balance_after（分）、timestamp（epoch 微秒）、
+        type / account（類別代碼，對照 self.types / self.accounts）
+        """
+        view = self._columns[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    # ==================== 增量載入 ====================
+
+    def refresh(self) -> int:
+        """
+        讀入上次之後新增的交易
+
+        輸出：
+            int: 新增筆數
+        """
+        with self._lock:
+            return self._refresh_locked()
+
+    def rebuild(self) -> int:
+        """
+        捨棄目前的欄位並從頭載入
+
+        位置失效時查詢會自動重建；偵測不到的覆寫（例如覆寫後的內容恰好更長）可手動呼叫
+
+        輸出：
+            int: 載入筆數
+        """
+        with self._lock:
+            self._reset()
+            return self._refresh_locked()
+
+    def _refresh_locked(self) -> int:
+        """增量載入的實際處理（呼叫端需持有 _lock）"""
+        try:
+            records, position = self.data_manager.get_transactions_since(self._position)
+        except StalePositionError:
+            # save_transactions / clear_all_data 整份覆寫後，舊的欄位與位置都不再對應
+            self._reset()
+            records, position = self.data_manager.get_transactions_since(0)
+        self._position = position
+        if records:
+            self._append(records)
+        return len(records)
+
+    def _append(self, records: List[Dict]):
+        """將交易記錄轉成欄位並接到尾端"""
+        count = len(records)
+        new = {
+            "amount": np.fromiter((read_minor(t["amount"]) for t in records),
+                                  dtype=np.int64, count=count),
+            "balance_after": np.fromiter((read_minor(t["balance_after"]) for t in records),
+                                         dtype=np.int64, count=count),
+            # ISO 字串由 NumPy 一次解析
+            "timestamp": np.array([t["timestamp"] for t in records],
+                                  dtype="datetime64[us]").astype(np.int64),
+            "type": np.fromiter((self._code(self._type_codes, self.types, t["type"])
+                                 for t in records), dtype=np.int32, count=count),
+            "account": np.fromiter((self._code(self._account_codes, self.accounts, t["account_id"])
+                                    for t in records), dtype=np.int32, count=count),
+        }
+        end = self._size + count
+        for name, values in new.items():
+            column = self._columns[name]
+            if end > len(column):
+                # 容量倍增，連續追加時每筆攤銷 O(1)
+                grown = np.empty(max(end, 2 * len(column)), dtype=column.dtype)
+                grown[:self._size] = column[:self._size]
+                column = self._columns[name] = grown
+            column[self._size:end] = values
+        self._size = end
+
+    @staticmethod
+    def _code(codes: Dict[str, int], names: List[str], name: str) -> int:
+        """類別名稱 → 代碼（第一次出現時配發）"""
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    # ==================== 查詢 ====================
+
+    def count(self, by: Optional[str] = None, **filters) -> Union[int, Dict[str, int]]:
+        """交易筆數（by 給定時為 {分組: 筆數}）"""
+        return self._aggregate("count", by, "amount", filters)
+
+    def sum(self, by: Optional[str] = None, column: str = "amount",
+            **filters) -> Union[float, Dict[str, float]]:
+        """金額加總（元）"""
+        return self._aggregate("sum", by, column, filters)
+
+    def mean(self, by: Optional[str] = None, column: str = "amount",
+             **filters) -> Union[Optional[float], Dict[str, float]]:
+        """金額平均（元），沒有符合的交易時為 None"""
+        return self._aggregate("mean", by, column, filters)
+
+    def percentile(self, q: float, by: Optional[str] = None, column: str = "amount",
+                   **filters) -> Union[Optional[float], Dict[str, float]]:
+        """
+        金額百分位數（元，q 為 0~100，線性內插），沒有符合的交易時為 None
+
+        例外：
+            ValueError: q 不在 0~100
+        """
+        if not 0 <= q <= 100:
+            raise ValueError(f"百分位數必須在 0~100: {q}")
+        return self._aggregate("percentile", by, column, filters, q)
+
+    def _aggregate(self, agg: str, by: Optional[str], column: str, filters: Dict,
+                   q: Optional[float] = None):
+        """
+        彙總的共同流程：增量載入 → 篩選遮罩 → 整體或分組計算
+
+        例外：
+            ValueError: 不支援的欄位或分組方式
+        """
+        if column not in VALUE_COLUMNS:
+            raise ValueError(f"不支援的欄位: {column}（可用: {', '.join(VALUE_COLUMNS)}）")
+        if by is not None and by not in GROUP_KEYS:
+            raise ValueError(f"不支援的分組方式: {by}（可用: {', '.join(GROUP_KEYS)}）")
+        with self._lock:
+            self._refresh_locked()
+            mask = self._mask(**filters)
+            values = self.column(column)[mask]
+            if by is None:
+                return self._reduce(agg, values, q)
+
+            keys, label = self._group_keys(by)
+            groups, inverse = np.unique(keys[mask], return_inverse=True)
+            counts = np.bincount(inverse, minlength=len(groups))
+            if agg == "count":
+                results = counts
+            elif agg == "percentile":
+                # 依分組排序後切段，每組各算一次
+                ordered = values[np.argsort(inverse, kind="stable")]
+                results = [np.percentile(part, q) for part in np.split(ordered, np.cumsum(counts)[:-1])]
+            else:
+                sums = np.zeros(len(groups), dtype=np.int64)
+                np.add.at(sums, inverse, values)
+                results = sums if agg == "sum" else sums / counts
+            return {label(int(group)): self._output(agg, result)
+                    for group, result in zip(groups, results)}
+
+    def _mask(self, transaction_type: Optional[str] = None, account_id: Optional[str] = None,
+              start: TimeBound = None, end: TimeBound = None) -> "np.ndarray":
+        """篩選條件 → 布林遮罩（類別不存在時全部為 False，不需比對）"""
+        mask = np.ones(self._size, dtype=bool)
+        for value, codes, name in ((transaction_type, self._type_codes, "type"),
+                                   (account_id, self._account_codes, "account")):
+            if value is None:
+                continue
+            code = codes.get(value)
+            if code is None:
+                return np.zeros(self._size, dtype=bool)
+            mask &= self.column(name) == code
+        if start is not None:
+            mask &= self.column("timestamp") >= self._micros(start)
+        if end is not None:
+            mask &= self.column("timestamp") < self._micros(end)
+        return mask
+
+    def _group_keys(self, by: str) -> Tuple["np.ndarray", Callable[[int], str]]:
+        """分組鍵陣列，以及鍵 → 顯示名稱的函數"""
+        if by == "account":
+            return self.column("account"), self.accounts.__getitem__
+        if by == "type":
+            return self.column("type"), self.types.__getitem__
+        return self.column("timestamp") // MICROS_PER_DAY, lambda day: str(np.datetime64(day, "D"))
+
+    @staticmethod
+    def _micros(value: Union[str, datetime]) -> int:
+        """ISO 時間字串 / datetime → epoch 微秒"""
+        return int(np.datetime64(value, "us").astype(np.int64))
+
+    @staticmethod
+    def _reduce(agg: str, values: "np.ndarray", q: Optional[float]):
+        """不分組的彙總"""
+        if agg == "count":
+            return int(len(values))
+        if agg == "sum":
+            return to_major(int(values.sum()))
+        if len(values) == 0:
+            return None
+        if agg == "mean":
+            return to_major(int(values.sum())) / len(values)
+        return float(np.percentile(values, q)) / 100
+
+    @staticmethod
+    def _output(agg: str, value) -> Union[int, float]:
+        """分組結果 → 對外單位（筆數為 int，金額為元）"""
+        if agg == "count":
+            return int(value)
+        if agg == "sum":
+            return to_major(int(value))
+        return float(value) / 100
@@ -0,0 +1,184 @@
+"""
+Async Bank Module
+asyncio 介面 - 讓 asyncio 服務（API gateway 等）呼叫銀行核心而不阻塞事件迴圈
+
+[完整實作 100%] 由整合者提供，組員直接使用
+
+[設計決策]
+- 所有檔案 I/O 都在固定大小的執行緒池中執行，事件迴圈只負責排程；
+  同時送進執行緒池的工作數量以 Semaphore 限制，大量請求在迴圈中排隊，
+  不會堆積在執行緒池的佇列裡
+- 讀取合併：相同查詢（同一帳戶的 get_account / 相同參數的 get_history）
+  正在執行時，後到的請求直接等待同一個結果，不重複讀檔
+- 寫入合併：存款 / 提款 / 轉帳放入佇列，由單一寫入工作以
+  TransactionModule.apply_batch 一次處理目前累積的所有操作，
+  N 個同時到達的請求只需要一次寫檔
+- 錯誤與同步版本相同：單筆失敗拋出 ValueError，不影響同批其他請求；
+  格式錯誤的操作在合併前就被拒絕，整批 apply_batch 拋出例外時改為逐筆重做，
+  只有出錯的請求收到例外
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .money import to_minor
+
+
+_ID_FIELDS = ("account_id", "from_account_id", "to_account_id")
+
+
+class AsyncBank:
+    """銀行核心的 asyncio 介面"""
+
+    def __init__(self, transaction_module, max_workers: int = 4, max_batch: int = 1000):
+        """
+        初始化
+
+        參數：
+            transaction_module: TransactionModule 實例（透過它取得 AccountModule / HistoryModule）
+            max_workers (int): 執行緒池大小，也是同時進行的檔案 I/O 上限
+            max_batch (int): 單次合併寫入的操作數上限
+        """
+        self.transaction = transaction_module
+        self.account = transaction_module.account
+        self.history = transaction_module.history
+        self.max_workers = max_workers
+        self.max_batch = max_batch
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bank-io")
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._reads: Dict[Tuple, asyncio.Future] = {}
+        self._queue: List[Tuple[Dict, asyncio.Future]] = []
+        self._writer: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "AsyncBank":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    # ==================== 執行緒池 ====================
+
+    async def _run(self, func: Callable, *args) -> Any:
+        """在執行緒池中執行阻塞函數（同時最多 max_workers 個）"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    # ==================== 讀取（合併相同查詢） ====================
+
+    async def _read(self, key: Tuple, func: Callable, *args) -> Any:
+        """相同 key 的查詢正在執行時共用結果"""
+        future = self._reads.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._run(func, *args))
+            self._reads[key] = future
+            future.add_done_callback(lambda _: self._reads.pop(key, None))
+        # shield：單一呼叫端取消時不影響其他等待同一結果的請求
+        return await asyncio.shield(future)
+
+    async def get_account(self, account_id: str) -> Optional[Dict]:
+        """查詢帳戶，不存在時回傳 None"""
+        account = await self._read(("account", account_id), self.account.get_account, account_id)
+        return dict(account) if account is not None else None
+
+    async def get_history(self, account_id: str, limit: int = 10) -> List[Dict]:
+        """查詢帳戶交易記錄（同 HistoryModule.get_history）"""
+        transactions = await self._read(("history", account_id, limit),
+                                        self.history.get_history, account_id, limit)
+        return [dict(txn) for txn in transactions]
+
+    # ==================== 寫入（合併為批次） ====================
+
+    @staticmethod
+    def _validate(op: Dict):
+        """
+        合併前檢查欄位型別，避免單筆格式錯誤拖垮同批的其他請求
+
+        例外：
+            ValueError: 帳號 / 冪等鍵不是字串，或金額格式錯誤
+        """
+        for field in _ID_FIELDS:
+            if field in op and not isinstance(op[field], str):
+                raise ValueError(f"帳號格式錯誤: {op[field]!r}")
+        key = op.get("idempotency_key")
+        if key is not None and not isinstance(key, str):
+            raise ValueError(f"冪等鍵格式錯誤: {key!r}")
+        to_minor(op["amount"])
+
+    async def _submit(self, op: Dict) -> Dict:
+        """
+        將操作放入寫入佇列，等待所屬批次完成
+
+        呼叫端取消等待時，已送出的操作仍可能被套用
+
+        例外：
+            ValueError: 欄位格式錯誤（不進入佇列），或操作失敗
+        """
+        self._validate(op)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((op, future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._drain())
+        return await future
+
+    async def _drain(self):
+        """寫入工作：每次取出佇列中累積的操作，以一次 apply_batch 處理"""
+        while self._queue:
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            try:
+                results = await self._run(self.transaction.apply_batch, [op for op, _ in batch])
+            except Exception:
+                # 整批失敗時 apply_batch 已全部回滾：逐筆重做，
+                # 只有真正出錯的請求收到例外（寫檔錯誤等仍會通知每一筆）
+                for op, future in batch:
+                    try:
+                        result = (await self._run(self.transaction.apply_batch, [op]))[0]
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+                        continue
+                    self._resolve(future, result)
+                continue
+            for (_, future), result in zip(batch, results):
+                self._resolve(future, result)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: Dict):
+        """依 apply_batch 的單筆結果完成等待中的請求"""
+        if future.done():
+            return
+        if result.get("success"):
+            future.set_result(result)
+        else:
+            future.set_exception(ValueError(result.get("error")))
+
+    async def deposit(self, account_id: str, amount: float,
+                      idempotency_key: Optional[str] = None) -> Dict:
+        """存款（回傳值與例外同 TransactionModule.deposit）"""
+        return await self._submit({"op": "deposit", "account_id": account_id, "amount": amount,
+                                   "idempotency_key": idempotency_key})
+
+    async def withdraw(self, account_id: str, amount: float,
+                       idempotency_key: Optional[str] = None) -> Dict:
+        """提款（回傳值與例外同 TransactionModule.withdraw）"""
+        return await self._submit({"op": "withdraw", "account_id": account_id, "amount": amount,
+                                   "idempotency_key": idempotency_key})
+
+    async def transfer(self, from_account_id: str, to_account_id: str, amount: float,
+                       idempotency_key: Optional[str] = None) -> Dict:
+        """轉帳（回傳值與例外同 TransactionModule.transfer）"""
+        return await self._submit({"op": "transfer", "from_account_id": from_account_id,
+                                   "to_account_id": to_account_id, "amount": amount,
+                                   "idempotency_key": idempotency_key})
+
+    # ==================== 關閉 ====================
+
+    async def aclose(self):
+        """等待佇列中的寫入完成後關閉執行緒池"""
+        while self._writer is not None and not self._writer.done():
+            await self._writer
+        self._executor.shutdown(wait=True)
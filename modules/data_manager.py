@@ -5,24 +5,433 @@ Data Manager Module
 [完整實作 100%] 由整合者提供，組員直接使用
 """
 
+import atexit
 import json
+from bisect import bisect_left
+import mmap
 import os
-from datetime import datetime
-from typing import Dict, List, Any
+import struct
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+from array import array
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Any, Optional, Tuple
+
+from modules.file_lock import FileLock
+from modules.idempotency import IDEMPOTENCY_FILE_NAME, IdempotencyStore, encode_records
+from modules.serialization import DEFAULT_CODEC, HEADER_MAGIC, decode, get_codec
+
+
+# 交易記錄的儲存模式
+STORAGE_JSON = "json"   # 單一 transactions.json 陣列（預設，相容舊資料）
+STORAGE_LOG = "log"     # 只追加的 JSONL 分段檔（每筆交易一行）
+
+SEGMENT_DIR_NAME = "transactions_log"
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+ACCOUNT_SHARD_DIR_NAME = "accounts_shards"
+ACCOUNT_INDEX_FILE_NAME = "account_index.tsv"
+OFFSET_TABLE_FILE_NAME = "txn_offsets.bin"
+WAL_FILE_NAME = "wal.jsonl"
+WAL_CHECKPOINT_BYTES = 4 * 1024 * 1024
+
+# 交易 ID → 記錄位置的固定寬度表：第 n 號交易存放在 (n - 1) * 8 的位置，
+# 內容為「記錄位置 + 1」（0 代表沒有這筆交易）
+OFFSET_ENTRY = struct.Struct("<q")
+
+# log 模式的記錄位置以單一整數表示：分段檔編號 << 40 | 檔內 offset
+POSITION_SHIFT = 40
+POSITION_MASK = (1 << POSITION_SHIFT) - 1
+
+# 時間區間查詢：時間戳記在寫入前產生，並行寫入時相鄰記錄可能有些微亂序，
+# 二分搜尋的邊界放寬此範圍後再逐筆比對
+TIMESTAMP_SKEW = timedelta(seconds=1)
+
+# 儲存後端
+BACKEND_JSON = "json"       # data/ 目錄下的 JSON 檔案（預設）
+BACKEND_SQLITE = "sqlite"   # data/bank.db 單一 SQLite 資料庫
+SQLITE_FILE_NAME = "bank.db"
+
+# 跨程序鎖：資料目錄下的單一鎖檔，以位元組區域區分
+# - 0 ~ FILE_REGION_BASE - 1：帳戶鎖分段（TransactionModule）
+# - FILE_REGION_BASE 之後：各資料檔（見 DataManager._region_of）
+LOCK_FILE_NAME = ".lock"
+FILE_REGION_BASE = 1 << 16
+IDEMPOTENCY_REGION = FILE_REGION_BASE + 4
+WAL_REGION = FILE_REGION_BASE + 5
+
+
+def resolve_backend(data_dir: str, backend: Optional[str] = None) -> str:
+    """
+    決定資料目錄使用的儲存後端
+    
+    優先順序：
+    1. 明確指定的 backend 參數
+    2. config.json 的 "backend" 設定
+    3. 目錄中已有 bank.db 時使用 SQLite
+    4. 預設 JSON
+    """
+    if backend is not None:
+        if backend not in (BACKEND_JSON, BACKEND_SQLITE):
+            raise ValueError(f"不支援的儲存後端: {backend}")
+        return backend
+    config_file = os.path.join(data_dir, "config.json")
+    if os.path.exists(config_file):
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                configured = json.load(f).get("backend")
+        except (OSError, ValueError):
+            configured = None
+        if configured in (BACKEND_JSON, BACKEND_SQLITE):
+            return configured
+    if os.path.exists(os.path.join(data_dir, SQLITE_FILE_NAME)):
+        return BACKEND_SQLITE
+    return BACKEND_JSON
+
+
+def parse_id_number(identifier: Optional[str], prefix: str) -> Optional[int]:
+    """
+    取出 ID 的數字部分（ACC0001 → 1、TXN12345 → 12345）
+    
+    格式不符時回傳 None
+    """
+    if not identifier or not identifier.startswith(prefix):
+        return None
+    digits = identifier[len(prefix):]
+    if not (digits.isascii() and digits.isdigit()) or int(digits) < 1:
+        return None
+    return int(digits)
+
+
+def _shift_timestamp(timestamp: str, delta: timedelta) -> str:
+    """ISO 時間字串加減一段時間；無法解析時原樣回傳（不放寬邊界）"""
+    try:
+        return (datetime.fromisoformat(timestamp) + delta).isoformat()
+    except (ValueError, OverflowError):
+        return timestamp
+
+
+class _TimestampView:
+    """
+    把「記錄位置列表 + 讀取函數」包成 bisect 可用的時間戳記序列
+    
+    只有被比較到的記錄才會讀取，二分搜尋只需 O(log n) 次讀取
+    """
+    
+    def __init__(self, positions, read: Callable[[Any], Optional[Dict]]):
+        self.positions = positions
+        self.read = read
+    
+    def __len__(self) -> int:
+        return len(self.positions)
+    
+    def __getitem__(self, i: int) -> str:
+        txn = self.read(self.positions[i])
+        return txn.get("timestamp", "") if txn is not None else ""
+
+
+def _flush_on_exit(ref):
+    """程式結束前把群組提交尚未落盤的內容寫入"""
+    data_manager = ref()
+    if data_manager is not None:
+        data_manager.flush()
+
+
+class _CommitWindow:
+    """
+    群組提交視窗：視窗內的儲存由同一次 flush() 寫入並 fsync
+    
+    第一個等到截止時間的執行緒擔任 leader 執行 flush()，其他執行緒（follower）
+    等待 done；flush() 完成時以 finish() 通知結果
+    """
+    
+    __slots__ = ("deadline", "done", "success", "claimed")
+    
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.done = threading.Event()
+        self.success = False
+        self.claimed = False
+    
+    def finish(self, success: bool):
+        """flush() 完成：記錄結果並喚醒所有等待者"""
+        self.success = success
+        self.done.set()
+
+
+class _WriterState(threading.local):
+    """各執行緒的寫入狀態：持有中的檔案鎖、尚未交出的 WAL 記錄與 log 追加、加入的提交視窗"""
+    
+    def __init__(self):
+        # {檔案: 是否由本臨界區取得跨程序鎖}
+        self.held: Dict[str, bool] = {}
+        self.window: Optional[_CommitWindow] = None
+        self.failed = False
+        self.clear_staged()
+    
+    def clear_staged(self):
+        """清空暫存：WAL 記錄、log 追加 [(分段檔, 內容)] 與索引記錄、追加前的寫入位置"""
+        self.wal_ops: List[Dict] = []
+        self.appends: List[Tuple[str, bytearray]] = []
+        self.entries: List = []
+        self.log_start: Optional[Tuple[int, int]] = None
+
+
+class ConcurrentUpdateError(RuntimeError):
+    """帳戶在讀取之後已被其他寫入者修改（版本號不符），呼叫端應重新讀取後重試"""
+
+
+class StalePositionError(LookupError):
+    """增量讀取的位置已失效（交易記錄被整份覆寫），呼叫端應從位置 0 重新讀取"""
+
+
+class UnitOfWork:
+    """
+    工作單元 - 暫存一組帳戶餘額變更與交易記錄，commit() 時一次寫入
+    
+    [設計決策]
+    - 暫存期間完全不動 DataManager 的資料，捨棄時不需要復原任何東西
+    - commit() 交由 DataManager 套用：JSON 後端只鎖定涉及的帳戶檔與交易檔，
+      每個檔案只寫一次，不同分片的工作單元可同時提交，群組提交時共用一次 fsync；
+      SQLite 後端為單一資料庫交易
+    - 由 DataManager.unit_of_work() 建立，不直接使用
+    - 樂觀鎖：update_balance 可帶讀取時的版本號，commit() 先確認所有帳戶的版本
+      都未改變才開始寫入；任何一個不符就拋出 ConcurrentUpdateError，完全不寫入
+    - 冪等鍵（remember）與資料在同一次提交寫入：JSON 後端與交易一起追加
+      （WAL 模式在同一筆 WAL 記錄），SQLite 後端在同一個資料庫交易
+    """
+    
+    def __init__(self, data_manager: "DataManager"):
+        self.data_manager = data_manager
+        self.balances: Dict[str, int] = {}
+        self.expected_versions: Dict[str, int] = {}
+        self.transactions: List[Dict] = []
+        self.remembered: List[Tuple[IdempotencyStore, Dict]] = []
+    
+    def get_account(self, account_id: str) -> Optional[Dict]:
+        """查詢帳戶（含本工作單元暫存的餘額），不存在時回傳 None"""
+        account = self.data_manager.get_account(account_id)
+        if account is not None and account_id in self.balances:
+            account["balance"] = self.balances[account_id]
+        return account
+    
+    def update_balance(self, account_id: str, balance: int,
+                       expected_version: Optional[int] = None):
+        """
+        暫存餘額變更（以分為單位，同 DataManager.update_balance）
+        
+        expected_version 為讀取帳戶時的 version；同一帳戶多次變更時以第一次為準
+        
+        例外：
+            ValueError: 帳戶不存在
+        """
+        if account_id not in self.balances and self.data_manager.get_account(account_id) is None:
+            raise ValueError(f"帳戶不存在: {account_id}")
+        self.balances[account_id] = balance
+        if expected_version is not None:
+            self.expected_versions.setdefault(account_id, expected_version)
+    
+    def append_transaction(self, transaction: Dict):
+        """暫存一筆交易記錄"""
+        self.transactions.append(transaction)
+    
+    def remember(self, store: IdempotencyStore, key: Optional[str], result: Dict,
+                 fingerprint: Optional[str] = None):
+        """
+        暫存冪等鍵與結果，與餘額、交易記錄一起寫入（key 為 None 時略過）
+        
+        store 需為 DataManager.idempotency_store() 建立的儲存
+        """
+        if key is not None:
+            self.remembered.append((store, store.record(key, result, fingerprint)))
+    
+    def commit(self):
+        """
+        一次寫入所有暫存內容
+        
+        例外：
+            ConcurrentUpdateError: 帳戶版本已改變（沒有寫入任何內容）
+            OSError: 寫入失敗
+        """
+        self.data_manager._commit_unit_of_work(self)
+        for store, record in self.remembered:
+            store.committed([record])
+        self.balances = {}
+        self.expected_versions = {}
+        self.transactions = []
+        self.remembered = []
 
 
 class DataManager:
-    """資料管理器 - 負責所有資料檔案的讀寫操作"""
+    """
+    資料管理器 - 負責所有資料檔案的讀寫操作
+    
+    DataManager(data_dir, backend="sqlite") 或 config.json 設定
+    "backend": "sqlite" 時，會建立 SQLiteDataManager（介面相同）
+    """
     
-    def __init__(self, data_dir: str = "data"):
-        """初始化 DataManager"""
+    def __new__(cls, data_dir: str = "data", *args, backend: Optional[str] = None, **kwargs):
+        """依設定選擇儲存後端"""
+        if cls is DataManager and resolve_backend(data_dir, backend) == BACKEND_SQLITE:
+            from modules.sqlite_backend import SQLiteDataManager
+            return super().__new__(SQLiteDataManager)
+        return super().__new__(cls)
+    
+    def __init__(self, data_dir: str = "data",
+                 transaction_storage: Optional[str] = None,
+                 segment_max_bytes: int = SEGMENT_MAX_BYTES,
+                 backend: Optional[str] = None,
+                 group_commit_window: float = 0.0,
+                 id_block_size: int = 1000,
+                 codec: Optional[str] = None,
+                 account_shards: Optional[int] = None,
+                 wal: bool = False,
+                 wal_checkpoint_bytes: int = WAL_CHECKPOINT_BYTES):
+        """
+        初始化 DataManager
+        
+        參數：
+            data_dir (str): 資料目錄
+            backend (str, optional): 儲存後端 "json" 或 "sqlite"（見 resolve_backend）
+            transaction_storage (str, optional): 交易記錄儲存模式
+                - "json": 整份 transactions.json 陣列（預設）
+                - "log": 只追加的 JSONL 分段檔，新增交易只寫一行
+                - None: 依 config.json 的 "transaction_storage" 設定
+            segment_max_bytes (int): log 模式下單一分段檔的大小上限
+            group_commit_window (float): 群組提交視窗（秒）
+                - 0: 每次儲存立即 fsync（預設）
+                - > 0: 視窗內（多個執行緒）的儲存合併成一次寫入與 fsync；
+                  寫入方法等到所屬視窗落盤才回傳，回傳 True 即代表已落盤
+            id_block_size (int): 每次從 config.json 預留的 ID 數量
+            codec (str, optional): accounts / transactions 檔案的序列化格式
+                （見 modules.serialization；None 時依 config.json 的 "codec"，
+                預設為縮排 JSON）。config.json 一律使用縮排 JSON
+            account_shards (int, optional): 帳戶分片數量
+                - 1: 所有帳戶存在 accounts.json（預設）
+                - N > 1: 依帳號雜湊分散到 N 個分片檔，更新餘額只重寫一個分片
+                - None: 依 config.json 的 "account_shards" 設定
+                與 config 不同時會自動重新分片
+            wal (bool): 預寫日誌（write-ahead log）模式
+                - False: 每次提交直接寫入主檔（預設）
+                - True: 每次提交只追加一筆記錄到 wal.jsonl 並 fsync，
+                  主檔留在記憶體，WAL 累積到 wal_checkpoint_bytes、
+                  呼叫 checkpoint() 或 close() 時才寫入；
+                  WAL 模式的程序獨佔資料目錄（其他程序無法同時開啟）
+                不論是否啟用，開啟時都會重播上次當機留下的 WAL
+            wal_checkpoint_bytes (int): WAL 超過此大小時自動 checkpoint
+        """
+        self.backend = BACKEND_JSON
         self.data_dir = data_dir
         self.accounts_file = os.path.join(data_dir, "accounts.json")
         self.transactions_file = os.path.join(data_dir, "transactions.json")
         self.config_file = os.path.join(data_dir, "config.json")
+        self.idempotency_file = os.path.join(data_dir, IDEMPOTENCY_FILE_NAME)
+        self.shard_dir = os.path.join(data_dir, ACCOUNT_SHARD_DIR_NAME)
+        self.account_shards = 1
+        self.segment_dir = os.path.join(data_dir, SEGMENT_DIR_NAME)
+        self.account_index_file = os.path.join(self.segment_dir, ACCOUNT_INDEX_FILE_NAME)
+        self.offset_table_file = os.path.join(self.segment_dir, OFFSET_TABLE_FILE_NAME)
+        self.segment_max_bytes = segment_max_bytes
+        
+        # 帳戶 → 交易位置索引
+        # - log 模式：{account_id: array(記錄位置)}，持久化於 account_index.tsv
+        # - json 模式：{account_id: [陣列索引]}，僅在記憶體中，隨快取更新
+        # 複合索引 {(account_id, type): 同上}，與帳戶索引一起維護
+        self._account_index: Dict[str, Any] = {}
+        self._type_index: Dict[Tuple[str, str], Any] = {}
+        self._json_index_source: Optional[List] = None
+        self._json_indexed = 0
+        # json 模式的交易 ID → 陣列索引
+        self._txn_index: Dict[str, int] = {}
+        # log 模式的 mmap：交易位置表與各分段檔
+        # - 重新 mmap 在 _mmap_lock 內進行，同一個檔案不會被多個執行緒重複 mmap
+        # - 被取代的 mmap 不主動 close：其他執行緒可能仍在讀取，
+        #   最後一個參照釋放時自動關閉
+        self._offset_mmap: Optional[mmap.mmap] = None
+        self._segment_mmaps: Dict[int, mmap.mmap] = {}
+        self._mmap_lock = threading.Lock()
+        
+        # 已解析的檔案內容快取：{filepath: ((mtime_ns, size, inode), data)}
+        self._cache: Dict[str, Any] = {}
+        
+        # 群組提交：尚未落盤的檔案內容與 log 分段檔，以及目前開放中的提交視窗
+        self.group_commit_window = group_commit_window
+        self._pending: Dict[str, Any] = {}
+        self._dirty_segments = set()
+        # 延後寫入的追加（log 分段檔與冪等鍵檔）：[(檔案, 內容)] 與分段檔的索引記錄，
+        # flush() 時才寫入（WAL 模式在 WAL 提交之後寫入），批次 rollback 時直接捨棄
+        self._appends: List[Tuple[str, bytearray]] = []
+        self._append_entries: List = []
+        self._active_segment = 0
+        self._active_size = 0
+        self._batch_log_start: Optional[Tuple[int, int]] = None
+        self._commit_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._window: Optional[_CommitWindow] = None
+        self._writer = _WriterState()
+        
+        # 執行緒安全：
+        # - 每個檔案一把鎖，「載入 → 修改 → 儲存」為一個臨界區，不同檔案可並行
+        # - 批次由單一執行緒獨佔，進行中其他執行緒的寫入等待批次結束
+        self._file_locks: Dict[str, threading.RLock] = {}
+        self._batch_cond = threading.Condition()
+        self._batch_owner: Optional[int] = None
+        self._batch_depth = 0
+        self._active_writers = 0
+        self._index_lock = threading.Lock()
+        
+        # 多程序安全：寫入只在提交當下持有該檔案的跨程序獨佔鎖；
+        # 延後寫入（群組提交 / 批次）則持有到 flush() 落盤為止 {區域: 檔案}
+        self.locks = FileLock(os.path.join(data_dir, LOCK_FILE_NAME))
+        self._held_regions: Dict[int, str] = {}
+        self._index_size = 0
+        if group_commit_window > 0 or wal:
+            atexit.register(_flush_on_exit, weakref.ref(self))
+        
+        # 預寫日誌：初始化（含當機復原）完成後才啟用，
+        # 尚未提交的記錄暫存在 _wal_buffer，flush() 時寫成 WAL 的一行
+        self.wal = False
+        self.wal_file = os.path.join(data_dir, WAL_FILE_NAME)
+        self.wal_checkpoint_bytes = wal_checkpoint_bytes
+        self._wal_buffer: List[Dict] = []
+        self._wal_lock = threading.Lock()
+        self._wal_handle = None
+        self._wal_size = 0
+        self._wal_replaying = False
+        
+        # ID 配置器：{config key: [下一個可配發 ID, 預留區段上限]}
+        self.id_block_size = id_block_size
+        self._id_lock = threading.Lock()
+        self._id_blocks = {"next_account_id": [0, 0], "next_transaction_id": [0, 0]}
         
         os.makedirs(data_dir, exist_ok=True)
-        self._init_files()
+        # 多個程序同時初始化同一目錄時依序進行
+        # 開啟失敗（例如目錄正被 WAL 模式使用）時釋放已登記的鎖
+        try:
+            with self.locks.exclusive(FILE_REGION_BASE):
+                configured_codec = self._configured_codec()
+                self.codec = get_codec(codec or configured_codec or DEFAULT_CODEC)
+                self._init_files()
+                if codec is not None and codec != configured_codec:
+                    config = self._load_json(self.config_file)
+                    config["codec"] = codec
+                    self._save_json(self.config_file, config)
+                self._resolve_account_shards(account_shards)
+                self.transaction_storage = self._resolve_storage(transaction_storage)
+                if self.transaction_storage == STORAGE_LOG:
+                    self._init_log()
+                self._claim_wal(wal)
+                self._recover_wal()
+        except BaseException:
+            self.locks.close()
+            raise
+        if wal:
+            self._wal_handle = open(self.wal_file, 'ab')
+            self.wal = True
     
     def _init_files(self):
         """初始化所有資料檔案"""
@@ -36,76 +445,1939 @@ class DataManager:
                 "next_transaction_id": 1,
                 "created_at": datetime.now().isoformat()
             })
+        # 群組提交模式下也要讓初始檔案立即存在
+        self.flush()
+    
+    def _configured_codec(self) -> Optional[str]:
+        """config.json 中設定的序列化格式"""
+        if not os.path.exists(self.config_file):
+            return None
+        return self._load_json(self.config_file).get("codec")
+    
+    def _resolve_storage(self, requested: Optional[str]) -> str:
+        """決定交易記錄的儲存模式，並記錄到 config.json"""
+        config = self._load_json(self.config_file)
+        current = config.get("transaction_storage", STORAGE_JSON)
+        if requested is None:
+            return current
+        if requested not in (STORAGE_JSON, STORAGE_LOG):
+            raise ValueError(f"不支援的儲存模式: {requested}")
+        if requested == STORAGE_JSON and current == STORAGE_LOG:
+            raise ValueError("資料目錄已使用 log 模式，無法切回 json 模式")
+        if requested == STORAGE_LOG and current == STORAGE_JSON:
+            # 既有 transactions.json 有資料時，需透過 migrate_transactions_to_log() 轉換
+            if self._load_json(self.transactions_file):
+                raise ValueError("transactions.json 已有資料，請先呼叫 migrate_transactions_to_log()")
+            config["transaction_storage"] = STORAGE_LOG
+            self._save_json(self.config_file, config)
+        return requested
+    
+    @staticmethod
+    def _file_signature(filepath: str):
+        """檔案簽章（修改時間、大小、inode），用來判斷快取是否仍有效"""
+        st = os.stat(filepath)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
     
     def _load_json(self, filepath: str) -> Any:
-        """讀取 JSON 檔案"""
+        """
+        讀取資料檔案（依檔頭自動選擇 JSON 或二進位格式）
+        
+        [設計決策]
+        - 解析結果會快取在記憶體，之後只比對檔案簽章（一次 stat），不重新解析
+        - 檔案被外部修改或其他程序寫入時，簽章改變就會重新載入
+        - 回傳的是快取物件本身，修改後必須呼叫對應的 save 寫回
+        - 群組提交尚未落盤的內容優先於檔案
+        """
+        pending = self._pending.get(filepath)
+        if pending is not None:
+            return pending
+        
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            signature = self._file_signature(filepath)
         except FileNotFoundError:
+            self._cache.pop(filepath, None)
             raise FileNotFoundError(f"檔案不存在: {filepath}")
-        except json.JSONDecodeError as e:
+        
+        cached = self._cache.get(filepath)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        
+        try:
+            with open(filepath, 'rb') as f:
+                data = decode(f.read())
+        except FileNotFoundError:
+            raise FileNotFoundError(f"檔案不存在: {filepath}")
+        except ValueError as e:
             raise ValueError(f"JSON 格式錯誤: {filepath}")
+        self._cache[filepath] = (signature, data)
+        return data
     
     def _save_json(self, filepath: str, data: Any) -> bool:
-        """儲存資料到 JSON 檔案"""
+        """
+        儲存資料到 JSON 檔案（write-through：同時更新快取）
+        
+        [設計決策]
+        - 先寫暫存檔、fsync，再以 rename 取代原檔；
+          當機時檔案不是舊版就是新版，不會被截斷
+        - 群組提交或批次模式下只登記待寫內容，由 flush() 合併寫入；
+          群組提交時加入目前的提交視窗，由寫入方法在離開臨界區後
+          等待落盤（_committed）；WAL 模式的主檔留待 checkpoint，
+          提交點為 WAL 記錄（_seal）
+        """
+        if self._deferred():
+            with self._commit_lock:
+                self._pending[filepath] = data
+                if not self.wal:
+                    self._join_window()
+            return True
+        
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            self._write_atomic(filepath, data)
+            self._fsync_dir(os.path.dirname(filepath))
+            self._cache[filepath] = (self._file_signature(filepath), data)
             return True
         except Exception as e:
+            # 寫入失敗時快取可能已被呼叫端修改，丟棄以便下次從檔案重新載入
+            self._cache.pop(filepath, None)
             print(f"[Error] 儲存失敗: {e}")
             return False
     
+    def _write_atomic(self, filepath: str, data: Any):
+        """編碼 → 寫入暫存檔 → fsync → rename 取代原檔"""
+        codec = get_codec(DEFAULT_CODEC) if filepath == self.config_file else self.codec
+        content = codec.encode(data)
+        directory = os.path.dirname(filepath) or "."
+        fd, tmp_path = tempfile.mkstemp(
+            dir=directory, prefix=os.path.basename(filepath) + ".", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+    
+    @staticmethod
+    def _fsync_dir(directory: str):
+        """fsync 目錄，確保 rename 本身落盤（不支援的平台略過）"""
+        try:
+            fd = os.open(directory or ".", os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    
+    def _deferred(self) -> bool:
+        """目前的儲存是否延後到 flush() 才落盤（WAL 模式、群組提交或本執行緒的批次中）"""
+        return self.wal or self.group_commit_window > 0 or self._batch_owner == threading.get_ident()
+    
+    def _file_lock(self, filepath: str) -> threading.RLock:
+        """取得檔案鎖（第一次使用時建立）"""
+        lock = self._file_locks.get(filepath)
+        if lock is None:
+            lock = self._file_locks.setdefault(filepath, threading.RLock())
+        return lock
+    
+    def _region_of(self, filepath: str) -> int:
+        """
+        資料檔 → 跨程序鎖區域
+        
+        FILE_REGION_BASE 本身保留給初始化，+4 為冪等鍵檔（IDEMPOTENCY_REGION），
+        +5 為 WAL 擁有權（WAL_REGION）
+        """
+        if filepath == self.idempotency_file:
+            return IDEMPOTENCY_REGION
+        if filepath == self.config_file:
+            offset = 1
+        elif filepath in (self.transactions_file, self.segment_dir):
+            offset = 2
+        elif filepath == self.accounts_file:
+            offset = 3
+        else:
+            # 分片檔 shard_XXX_of_NNN.json
+            offset = 16 + int(os.path.basename(filepath)[6:9])
+        return FILE_REGION_BASE + offset
+    
+    @contextmanager
+    def _region_lock(self, filepath: str, exclusive: bool = True):
+        """
+        跨程序鎖定資料檔（只在提交當下持有）
+        
+        本程序已因延後寫入持有該檔案的獨佔鎖時直接進入
+        """
+        region = self._region_of(filepath)
+        if region in self._held_regions:
+            yield
+            return
+        self.locks.acquire(region, exclusive)
+        try:
+            yield
+        finally:
+            self.locks.release(region, exclusive)
+    
+    def _hold_region(self, filepath: str):
+        """延後寫入：取得檔案的跨程序獨佔鎖，由 flush() 釋放（呼叫端需持有檔案鎖）"""
+        region = self._region_of(filepath)
+        if region not in self._held_regions:
+            self.locks.acquire(region)
+            self._held_regions[region] = filepath
+    
+    def _release_regions(self):
+        """flush() 完成後釋放沒有待寫內容的檔案鎖"""
+        for region, filepath in list(self._held_regions.items()):
+            with self._file_lock(filepath):
+                if (filepath in self._pending or region not in self._held_regions
+                        or (filepath == self.segment_dir and self._append_entries)):
+                    continue
+                del self._held_regions[region]
+                self.locks.release(region)
+    
+    @contextmanager
+    def _writing(self, *filepaths: str):
+        """
+        寫入臨界區
+        
+        同一檔案的「載入 → 修改 → 儲存」互斥，不同檔案（例如不同分片）可並行；
+        其他執行緒的批次進行中時，等待批次結束再進入
+        
+        可一次鎖定多個檔案（呼叫端依固定順序傳入）或巢狀使用：本執行緒已持有的檔案
+        直接進入，新取得的檔案鎖持有到最外層結束；最外層結束前，區塊內登記的
+        WAL 記錄與 log 追加一起交給提交佇列（_seal），寫在 WAL 的同一行；
+        區塊內發生例外時全部捨棄，log 寫入位置退回追加前
+        
+        跨程序：立即寫入時只在區塊內持有該檔案的獨佔鎖；
+        區塊內的 _load_json 會因檔案簽章改變而重新載入其他程序寫入的內容
+        """
+        state = self._writer
+        outermost = not state.held
+        if outermost:
+            me = threading.get_ident()
+            with self._batch_cond:
+                while self._batch_owner not in (None, me):
+                    self._batch_cond.wait()
+                self._active_writers += 1
+        checkpoint = False
+        try:
+            for filepath in filepaths:
+                if filepath not in state.held:
+                    self._acquire_file(filepath)
+            yield
+            if outermost:
+                self._seal()
+        except BaseException:
+            if outermost:
+                if state.log_start is not None:
+                    self._active_segment, self._active_size = state.log_start
+                state.clear_staged()
+            raise
+        finally:
+            if outermost:
+                self._release_files()
+                with self._batch_cond:
+                    self._active_writers -= 1
+                    self._batch_cond.notify_all()
+                    checkpoint = (self.wal and self._wal_size >= self.wal_checkpoint_bytes
+                                  and self._active_writers == 0 and self._batch_owner is None)
+            if checkpoint:
+                self.checkpoint()
+    
+    def _acquire_file(self, filepath: str):
+        """取得檔案鎖與跨程序鎖，登記在本執行緒的寫入狀態（由 _release_files 釋放）"""
+        lock = self._file_lock(filepath)
+        lock.acquire()
+        try:
+            region = self._region_of(filepath)
+            owned = False
+            if self._deferred():
+                # 延後寫入：跨程序鎖持有到 flush() 落盤為止
+                self._hold_region(filepath)
+            elif region not in self._held_regions:
+                self.locks.acquire(region)
+                owned = True
+        except BaseException:
+            lock.release()
+            raise
+        self._writer.held[filepath] = owned
+    
+    def _release_files(self):
+        """最外層寫入臨界區結束：依取得的相反順序釋放本執行緒持有的檔案鎖"""
+        held = self._writer.held
+        for filepath, owned in reversed(list(held.items())):
+            if owned:
+                self.locks.release(self._region_of(filepath))
+            self._file_lock(filepath).release()
+        held.clear()
+    
+    def _seal(self):
+        """
+        最外層寫入臨界區結束前（仍持有所有檔案鎖）：把本執行緒登記的 WAL 記錄
+        與 log 追加一次交給提交佇列
+        
+        同一臨界區（例如一個工作單元）的記錄不會被其他執行緒的提交拆開；
+        沒有群組提交且不在批次中時立即提交，失敗由 _committed 回報
+        """
+        state = self._writer
+        if not (state.wal_ops or state.appends):
+            return
+        with self._commit_lock:
+            self._wal_buffer.extend(state.wal_ops)
+            self._appends.extend(state.appends)
+            self._append_entries.extend(state.entries)
+            state.clear_staged()
+            self._join_window()
+        if self.group_commit_window <= 0 and self._batch_owner != threading.get_ident():
+            if not self._wal_commit():
+                state.failed = True
+    
+    @contextmanager
+    def batch(self):
+        """
+        批次模式：區塊內的所有儲存只更新記憶體，離開區塊時一次寫入並 fsync
+        
+        使用範例：
+            with data_manager.batch():
+                for ...:
+                    data_manager.update_balance(...)
+            # 離開時 accounts / transactions / config 各寫入一次
+        
+        可巢狀使用，最外層結束時才寫入；
+        區塊內發生例外時，最外層會丟棄所有尚未落盤的內容（檔案維持批次前的狀態）
+        
+        同一時間只有一個執行緒能進入批次：會等待其他執行緒進行中的寫入完成，
+        批次期間其他執行緒的寫入則等待批次結束
+        
+        例外：
+            OSError: 離開區塊時寫入失敗
+        """
+        me = threading.get_ident()
+        with self._batch_cond:
+            if self._batch_owner != me:
+                while self._batch_owner is not None or self._active_writers > 0:
+                    self._batch_cond.wait()
+                self._batch_owner = me
+                if self.group_commit_window > 0 or self.wal:
+                    # 先送出群組提交視窗內的其他寫入，讓 rollback 只影響本批次
+                    self.flush()
+                self._batch_log_start = (self._active_segment, self._active_size)
+            self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            with self._batch_cond:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    with self._commit_lock:
+                        # WAL 模式：本批次沒有任何變更時，待寫內容都是已提交的，不能丟棄
+                        changed = not self.wal or bool(self._wal_buffer)
+                        self._wal_buffer = []
+                        if changed:
+                            self._discard_pending()
+                        if self._appends:
+                            # 尚未寫入分段檔的追加都屬於本批次，寫入位置退回批次開始時
+                            self._appends = []
+                            self._append_entries = []
+                            self._active_segment, self._active_size = self._batch_log_start
+                    if self.wal and changed:
+                        # 丟棄的內容也包含已提交、尚未 checkpoint 的變更，由 WAL 重建
+                        self._replay_wal(self._read_wal())
+                    self._release_regions()
+                    self._batch_owner = None
+                    self._batch_cond.notify_all()
+            raise
+        with self._batch_cond:
+            self._batch_depth -= 1
+            if self._batch_depth > 0:
+                return
+            try:
+                success = self.flush()
+            finally:
+                self._batch_owner = None
+                self._batch_cond.notify_all()
+        if not success:
+            raise OSError("批次寫入失敗")
+    
+    def _discard_pending(self):
+        """丟棄尚未落盤的內容（呼叫端需持有 _commit_lock，之後需呼叫 _release_regions）"""
+        pending, self._pending = self._pending, {}
+        for filepath in pending:
+            # 快取物件可能已被修改，下次從檔案重新載入
+            self._cache.pop(filepath, None)
+    
+    def _commit_unit_of_work(self, uow: UnitOfWork):
+        """
+        套用工作單元（由 UnitOfWork.commit 呼叫）
+        
+        [設計決策]
+        - 不使用 batch()（程序內同時只能有一個批次）：只鎖定涉及的帳戶檔，
+          依路徑排序取得（跨程序也是相同順序），交易檔最後才鎖定；
+          不同分片的工作單元可以同時提交
+        - 所有帳戶的存在與版本全部確認後才開始修改，任何一個不符就完全不寫入；
+          交易記錄寫入失敗時帳戶改回原內容
+        - WAL 記錄在臨界區結束時一起提交（_seal），不會只提交其中一部分
+        - 群組提交時加入目前的視窗，與其他執行緒的寫入共用一次 fsync
+        - 冪等鍵在交易之後追加到冪等鍵檔：WAL 模式在同一筆 WAL 記錄，
+          延後寫入時隨同一次 flush()，不會只有資料落盤而鍵遺失
+        
+        例外：
+            ConcurrentUpdateError: 帳戶版本已改變（沒有寫入任何內容）
+            OSError: 寫入失敗
+        """
+        files: Dict[str, List[str]] = {}
+        for account_id in uow.balances:
+            files.setdefault(self._account_file(account_id), []).append(account_id)
+        paths = sorted(files)
+        with self._writing(*paths):
+            stored = {path: self._load_json(path) for path in paths}
+            for path in paths:
+                for account_id in files[path]:
+                    account = stored[path].get(account_id)
+                    expected = uow.expected_versions.get(account_id)
+                    if expected is not None and (account is None or account.get("version", 0) != expected):
+                        raise ConcurrentUpdateError(f"帳戶已被修改: {account_id}")
+                    if account is None:
+                        raise OSError(f"更新餘額失敗: {account_id}")
+            previous = {}
+            for path in paths:
+                accounts = stored[path]
+                for account_id in files[path]:
+                    previous[account_id] = accounts[account_id]
+                    account = dict(previous[account_id], balance=uow.balances[account_id])
+                    account["version"] = account.get("version", 0) + 1
+                    self._wal_log({"op": "set_account", "account_id": account_id, "account": account})
+                    accounts[account_id] = account
+            try:
+                for path in paths:
+                    if not self._save_json(path, stored[path]):
+                        raise OSError(f"更新餘額失敗: {path}")
+                if not self.append_transactions(uow.transactions):
+                    raise OSError("寫入交易記錄失敗")
+                if uow.remembered and not self._remember_keys([record for _, record in uow.remembered]):
+                    raise OSError("寫入冪等鍵失敗")
+            except OSError:
+                # 改回原本的帳戶內容（WAL 記錄隨臨界區的例外一併捨棄）
+                for path in paths:
+                    for account_id in files[path]:
+                        stored[path][account_id] = previous[account_id]
+                    self._save_json(path, stored[path])
+                raise
+        if not self._committed():
+            raise OSError("工作單元寫入失敗")
+    
+    @contextmanager
+    def unit_of_work(self):
+        """
+        工作單元：在區塊內暫存餘額變更與交易記錄，區塊正常結束時一次寫入
+        
+        使用範例：
+            with data_manager.unit_of_work() as uow:
+                uow.update_balance("ACC0001", 50000)
+                uow.update_balance("ACC0002", 150000)
+                uow.append_transaction({...})
+            # 離開時才真正寫入；區塊內拋出例外則全部捨棄
+        """
+        uow = UnitOfWork(self)
+        yield uow
+        uow.commit()
+    
+    def _join_window(self):
+        """
+        群組提交：本執行緒加入目前的提交視窗（呼叫端需持有 _commit_lock）
+        
+        視窗在第一筆儲存時開啟；批次由批次結束時的 flush() 統一落盤，不加入
+        """
+        if self.group_commit_window > 0 and self._batch_owner != threading.get_ident():
+            if self._window is None:
+                self._window = _CommitWindow(time.monotonic() + self.group_commit_window)
+            self._writer.window = self._window
+    
+    def _committed(self, success: bool = True) -> bool:
+        """
+        寫入方法離開臨界區後呼叫：等待本執行緒加入的提交視窗落盤
+        
+        [設計決策]
+        - 視窗截止前等待其他執行緒加入；截止時視窗仍未送出，
+          第一個到達的執行緒擔任 leader 執行 flush()，其餘等待結果
+        - 仍在寫入臨界區內（巢狀呼叫）或為批次擁有者時不等待，
+          由最外層或批次結束時處理
+        
+        輸出：
+            bool: success、WAL 立即提交成功且所屬視窗已成功落盤
+        """
+        state = self._writer
+        if state.held or self._batch_owner == threading.get_ident():
+            return success
+        if state.failed:
+            state.failed = False
+            success = False
+        window, state.window = state.window, None
+        if window is None:
+            return success
+        remaining = window.deadline - time.monotonic()
+        if remaining > 0:
+            window.done.wait(remaining)
+        if not window.done.is_set():
+            with self._commit_lock:
+                lead = not window.claimed
+                window.claimed = True
+            if lead:
+                self.flush()
+        window.done.wait()
+        return success and window.success
+    
+    def flush(self) -> bool:
+        """
+        將群組提交視窗內累積的儲存一次寫入並 fsync
+        
+        WAL 模式下只把累積的記錄寫成 WAL 的一行（一次 fsync），
+        主檔留待 checkpoint()；WAL 超過 wal_checkpoint_bytes 時接著 checkpoint
+        
+        輸出：
+            bool: True=全部成功
+        """
+        if not self.wal:
+            return self._flush_files()
+        if not self._wal_commit():
+            return False
+        if (self._wal_size >= self.wal_checkpoint_bytes
+                and self._batch_owner in (None, threading.get_ident())):
+            return self.checkpoint()
+        return True
+    
+    def _flush_files(self) -> bool:
+        """
+        將待寫的主檔與 log 分段檔寫入並 fsync
+        
+        非 WAL 模式下同時寫入暫存的 log 追加、送出目前的提交視窗，
+        寫完後通知視窗內的等待者（WAL 模式的追加與視窗由 _wal_commit 送出）
+        """
+        with self._flush_lock:
+            with self._commit_lock:
+                paths = list(self._pending)
+                appends, entries, window = [], [], None
+                if not self.wal:
+                    appends, self._appends = self._appends, []
+                    entries, self._append_entries = self._append_entries, []
+                    window, self._window = self._window, None
+            
+            success = True
+            if appends and not self._write_appends(appends, entries):
+                with self._commit_lock:
+                    self._appends[:0] = appends
+                    self._append_entries[:0] = entries
+                success = False
+            with self._commit_lock:
+                segments, self._dirty_segments = self._dirty_segments, set()
+            directories = set()
+            for filepath in paths:
+                # 持有檔案鎖，編碼期間其他執行緒不會修改同一份資料
+                with self._file_lock(filepath):
+                    with self._commit_lock:
+                        data = self._pending.pop(filepath, None)
+                    if data is None:
+                        continue
+                    try:
+                        self._write_atomic(filepath, data)
+                        self._cache[filepath] = (self._file_signature(filepath), data)
+                        directories.add(os.path.dirname(filepath))
+                    except Exception as e:
+                        self._cache.pop(filepath, None)
+                        print(f"[Error] 儲存失敗: {e}")
+                        success = False
+            for path in segments:
+                try:
+                    with open(path, 'ab') as f:
+                        os.fsync(f.fileno())
+                except OSError as e:
+                    print(f"[Error] 儲存失敗: {e}")
+                    success = False
+            for directory in directories:
+                self._fsync_dir(directory)
+            self._release_regions()
+            if window is not None:
+                window.finish(success)
+            return success
+    
+    def close(self):
+        """
+        關閉前將待寫內容落盤（WAL 模式會 checkpoint 並清空 WAL），
+        並歸還未用完的 ID 區段（見 _return_id_blocks）
+        """
+        self.checkpoint()
+        self._return_id_blocks()
+        if self._wal_handle is not None:
+            self.wal = False
+            self._wal_handle.close()
+            self._wal_handle = None
+        self._close_mmaps()
+        self.locks.close()
+    
+    def invalidate_cache(self):
+        """清除所有快取，下次讀取時重新從檔案載入"""
+        self._cache.clear()
+    
+    # ==================== 預寫日誌（WAL） ====================
+    
+    def checkpoint(self) -> bool:
+        """
+        將 WAL 中已提交的變更寫入主檔，全部落盤後清空 WAL
+        
+        [設計決策]
+        - 等待進行中的寫入完成，期間其他執行緒的寫入暫停（同 batch()）
+        - 先寫主檔、後截斷 WAL：中途當機時重播 WAL 即可，重播為冪等
+        
+        輸出：
+            bool: True=全部成功（非 WAL 模式同 flush()）
+        """
+        if not self.wal:
+            return self.flush()
+        me = threading.get_ident()
+        with self._batch_cond:
+            owned = self._batch_owner == me
+            if not owned:
+                while self._batch_owner is not None or self._active_writers > 0:
+                    self._batch_cond.wait()
+                self._batch_owner = me
+        try:
+            if not (self._wal_commit() and self._flush_files()):
+                return False
+            return self._wal_truncate()
+        finally:
+            if not owned:
+                with self._batch_cond:
+                    self._batch_owner = None
+                    self._batch_cond.notify_all()
+    
+    def _claim_wal(self, wal: bool):
+        """
+        登記資料目錄的使用者（鎖持有到 close()）
+        
+        WAL 模式的主檔延後寫入，其他程序讀到的會是舊內容，因此以獨佔鎖登記；
+        一般模式以共用鎖登記，兩者不能同時開啟同一個目錄
+        
+        例外：
+            OSError: 目錄正被不相容模式的其他程序使用
+        """
+        if not self.locks.acquire(WAL_REGION, exclusive=wal, blocking=False):
+            raise OSError(f"資料目錄正被其他程序使用（WAL 模式需獨佔）: {self.data_dir}")
+    
+    def _recover_wal(self):
+        """
+        當機復原：重播 WAL 中已提交的記錄，寫入主檔後清空 WAL（呼叫端需持有初始化鎖）
+        
+        最後一行沒有寫完（當機當下正在寫入）時視為未提交，直接捨棄
+        """
+        records = self._read_wal()
+        if records:
+            with self.batch():
+                self._replay_wal(records)
+        if os.path.exists(self.wal_file) and os.path.getsize(self.wal_file) > 0:
+            with open(self.wal_file, 'r+b') as f:
+                f.truncate(0)
+                os.fsync(f.fileno())
+    
+    def _read_wal(self) -> List[List[Dict]]:
+        """
+        讀取 WAL 中完整的記錄（每行一次提交：「crc32 十六進位 + 空白 + JSON」）
+        
+        遇到不完整或校驗不符的行即停止，之後的內容一律不採用
+        """
+        try:
+            with open(self.wal_file, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        records = []
+        for line in data.split(b"\n")[:-1]:
+            checksum, _, payload = line.partition(b" ")
+            try:
+                if int(checksum, 16) != zlib.crc32(payload):
+                    break
+                records.append(json.loads(payload))
+            except ValueError:
+                break
+        return records
+    
+    def _replay_wal(self, records: List[List[Dict]]):
+        """
+        依序重新套用 WAL 記錄（呼叫端需為批次擁有者，變更留在待寫內容中）
+        
+        每種記錄都是冪等的：帳戶以整筆內容覆寫，交易以 transaction_id 去重，
+        主檔已包含部分或全部變更時重播結果相同
+        """
+        self._wal_replaying = True
+        try:
+            for ops in records:
+                for op in ops:
+                    self._apply_wal_op(op)
+        finally:
+            self._wal_replaying = False
+    
+    def _apply_wal_op(self, op: Dict):
+        """套用單一 WAL 記錄"""
+        kind = op["op"]
+        if kind == "set_account":
+            self.add_account(op["account_id"], op["account"])
+        elif kind == "delete_account":
+            self.delete_account(op["account_id"])
+        elif kind == "append_transactions":
+            self.append_transactions([
+                transaction for transaction in op["transactions"]
+                if self.get_transaction(transaction.get("transaction_id")) is None
+            ])
+        elif kind == "save_accounts":
+            self.save_accounts(op["accounts"])
+        elif kind == "save_transactions":
+            self.save_transactions(op["transactions"])
+        elif kind == "remember":
+            self._remember_keys(op["records"])
+    
+    def _wal_log(self, op: Dict):
+        """
+        登記一筆 WAL 記錄，隨下一次提交寫入
+        
+        呼叫端需在寫入臨界區內、修改資料之前呼叫，checkpoint 才不會夾在中間；
+        臨界區內先暫存在本執行緒，離開時整組交給提交佇列（批次中直接放入佇列，
+        由批次結束時一起提交）
+        """
+        if self.wal and not self._wal_replaying:
+            state = self._writer
+            if state.held and self._batch_owner != threading.get_ident():
+                state.wal_ops.append(op)
+                return
+            with self._commit_lock:
+                self._wal_buffer.append(op)
+    
+    @contextmanager
+    def _wal_logged(self, op: Dict):
+        """
+        整份覆寫等多檔操作：WAL 模式下包在批次中並登記 op，一次提交
+        
+        非 WAL 模式與重播時直接執行
+        """
+        if not self.wal or self._wal_replaying:
+            yield
+            return
+        with self.batch():
+            self._wal_log(op)
+            yield
+    
+    def _wal_commit(self) -> bool:
+        """
+        將累積的記錄寫成 WAL 的一行並 fsync（提交點）
+        
+        WAL 落盤之後才把暫存的 log 追加寫入分段檔（fsync 留待 checkpoint）；
+        寫入失敗時記錄與追加放回佇列，下次提交重試；目前的提交視窗一併送出
+        """
+        with self._wal_lock:
+            with self._commit_lock:
+                ops, self._wal_buffer = self._wal_buffer, []
+                appends, self._appends = self._appends, []
+                entries, self._append_entries = self._append_entries, []
+                window, self._window = self._window, None
+            success = self._wal_write(ops) and self._write_appends(appends, entries)
+            if not success:
+                with self._commit_lock:
+                    self._appends[:0] = appends
+                    self._append_entries[:0] = entries
+            if window is not None:
+                window.finish(success)
+            return success
+    
+    def _wal_write(self, ops: List[Dict]) -> bool:
+        """將記錄寫成 WAL 的一行並 fsync（呼叫端需持有 _wal_lock）"""
+        if not ops:
+            return True
+        payload = json.dumps(ops, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        line = b"%08x %s\n" % (zlib.crc32(payload), payload)
+        try:
+            self._wal_handle.write(line)
+            self._wal_handle.flush()
+            os.fsync(self._wal_handle.fileno())
+        except OSError as e:
+            with self._commit_lock:
+                self._wal_buffer[:0] = ops
+            print(f"[Error] WAL 寫入失敗: {e}")
+            return False
+        self._wal_size += len(line)
+        return True
+    
+    def _write_appends(self, appends: List[Tuple[str, bytearray]], entries: List) -> bool:
+        """
+        將暫存的 log 追加寫入分段檔並更新索引（呼叫端需持有 _wal_lock 或 _flush_lock）
+        
+        分段檔記為待 fsync，由 _flush_files 落盤（WAL 模式為 checkpoint 時）；
+        寫入失敗時截回原長度，避免重試時留下半行；冪等鍵檔在寫入當下持有跨程序鎖
+        """
+        written = []
+        try:
+            for path, data in appends:
+                with self._region_lock(path) if path == self.idempotency_file else nullcontext():
+                    with open(path, 'ab') as f:
+                        written.append((path, f.tell()))
+                        f.write(data)
+        except OSError as e:
+            for path, size in reversed(written):
+                try:
+                    os.truncate(path, size)
+                except OSError:
+                    pass
+            print(f"[Error] 儲存失敗: {e}")
+            return False
+        with self._commit_lock:
+            self._dirty_segments.update(path for path, _ in appends)
+        self._index_append(entries)
+        return True
+    
+    def _wal_truncate(self) -> bool:
+        """checkpoint 完成後清空 WAL"""
+        with self._wal_lock:
+            try:
+                os.ftruncate(self._wal_handle.fileno(), 0)
+                os.fsync(self._wal_handle.fileno())
+            except OSError as e:
+                print(f"[Error] WAL 清空失敗: {e}")
+                return False
+            self._wal_size = 0
+            return True
+    
     # ==================== 帳戶操作 ====================
     
     def load_accounts(self) -> Dict[str, Dict]:
-        """載入所有帳戶資料"""
-        return self._load_json(self.accounts_file)
+        """
+        載入所有帳戶資料
+        
+        分片模式下會合併所有分片並回傳副本；
+        單筆操作請改用 get_account / update_balance，只會讀寫一個分片
+        """
+        if self.account_shards <= 1:
+            return self._load_json(self.accounts_file)
+        merged = {}
+        for shard in range(self.account_shards):
+            for account_id, account in self._load_json(self._shard_path(shard)).items():
+                merged[account_id] = dict(account)
+        return merged
     
     def save_accounts(self, accounts: Dict) -> bool:
-        """儲存帳戶資料"""
-        return self._save_json(self.accounts_file, accounts)
+        """
+        儲存帳戶資料
+        
+        分片模式下依帳號分配到各分片，只重寫內容有變動的分片
+        """
+        with self._wal_logged({"op": "save_accounts", "accounts": accounts}):
+            if self.account_shards <= 1:
+                with self._writing(self.accounts_file):
+                    success = self._save_json(self.accounts_file, accounts)
+                return self._committed(success)
+            shards = [{} for _ in range(self.account_shards)]
+            for account_id, account in accounts.items():
+                shards[self._shard_of(account_id)][account_id] = account
+            success = True
+            for shard, shard_accounts in enumerate(shards):
+                path = self._shard_path(shard)
+                with self._writing(path):
+                    if shard_accounts != self._load_json(path):
+                        success = self._save_json(path, shard_accounts) and success
+            return self._committed(success)
+    
+    def get_account(self, account_id: str) -> Optional[Dict]:
+        """查詢單一帳戶（回傳副本），不存在時回傳 None"""
+        account = self._load_json(self._account_file(account_id)).get(account_id)
+        return dict(account) if account is not None else None
+    
+    def add_account(self, account_id: str, account: Dict) -> bool:
+        """新增單一帳戶"""
+        path = self._account_file(account_id)
+        with self._writing(path):
+            accounts = self._load_json(path)
+            self._wal_log({"op": "set_account", "account_id": account_id, "account": account})
+            accounts[account_id] = account
+            success = self._save_json(path, accounts)
+        return self._committed(success)
+    
+    def update_balance(self, account_id: str, balance: int,
+                       expected_version: Optional[int] = None) -> bool:
+        """
+        更新單一帳戶餘額（分），並將版本號 +1
+        
+        給定 expected_version 時為 compare-and-swap：目前版本不符就不寫入。
+        帳戶不存在或版本不符時回傳 False
+        """
+        path = self._account_file(account_id)
+        with self._writing(path):
+            accounts = self._load_json(path)
+            account = accounts.get(account_id)
+            if account is None:
+                return False
+            version = account.get("version", 0)
+            if expected_version is not None and version != expected_version:
+                return False
+            account["balance"] = balance
+            account["version"] = version + 1
+            self._wal_log({"op": "set_account", "account_id": account_id, "account": dict(account)})
+            success = self._save_json(path, accounts)
+        return self._committed(success)
+    
+    def check_version(self, account_id: str, expected_version: int) -> bool:
+        """
+        帳戶目前的版本號是否等於 expected_version（舊資料沒有 version 視為 0）
+        
+        批次中呼叫時，帳戶檔會鎖定到批次落盤為止
+        """
+        path = self._account_file(account_id)
+        with self._writing(path):
+            account = self._load_json(path).get(account_id)
+            return account is not None and account.get("version", 0) == expected_version
+    
+    def delete_account(self, account_id: str) -> bool:
+        """刪除單一帳戶，帳戶不存在時回傳 False"""
+        path = self._account_file(account_id)
+        with self._writing(path):
+            accounts = self._load_json(path)
+            if account_id not in accounts:
+                return False
+            self._wal_log({"op": "delete_account", "account_id": account_id})
+            del accounts[account_id]
+            success = self._save_json(path, accounts)
+        return self._committed(success)
+    
+    # ==================== 帳戶分片 ====================
+    
+    def _shard_of(self, account_id: str) -> int:
+        """帳號 → 分片編號（crc32，跨程序固定）"""
+        return zlib.crc32(account_id.encode("utf-8")) % self.account_shards
+    
+    def _shard_path(self, shard: int, shards: Optional[int] = None) -> str:
+        """
+        分片檔路徑
+        
+        檔名包含分片總數，重新分片時新舊檔案不會互相覆蓋
+        """
+        shards = shards or self.account_shards
+        return os.path.join(self.shard_dir, f"shard_{shard:03d}_of_{shards:03d}.json")
+    
+    def _account_file(self, account_id: str) -> str:
+        """存放此帳戶的檔案"""
+        if self.account_shards <= 1:
+            return self.accounts_file
+        return self._shard_path(self._shard_of(account_id))
+    
+    def _resolve_account_shards(self, requested: Optional[int]):
+        """
+        決定帳戶分片數量，與 config.json 不同時重新分片
+        
+        [設計決策]
+        順序為「寫入新分片 → 更新 config → 刪除舊分片」，
+        中途當機時 config 仍指向完整的舊資料
+        """
+        config = self._load_json(self.config_file)
+        configured = config.get("account_shards", 1)
+        self.account_shards = configured
+        if requested is None or requested == configured:
+            self._init_shards()
+            return
+        if requested < 1:
+            raise ValueError(f"分片數量必須 >= 1: {requested}")
+        
+        accounts = self.load_accounts()
+        old_paths = [self._shard_path(i) for i in range(configured)] if configured > 1 else []
+        
+        self.account_shards = requested
+        if requested > 1:
+            os.makedirs(self.shard_dir, exist_ok=True)
+            shards = [{} for _ in range(requested)]
+            for account_id, account in accounts.items():
+                shards[self._shard_of(account_id)][account_id] = account
+            for shard, shard_accounts in enumerate(shards):
+                self._save_json(self._shard_path(shard), shard_accounts)
+        else:
+            self._save_json(self.accounts_file, accounts)
+        
+        config["account_shards"] = requested
+        self._save_json(self.config_file, config)
+        self.flush()
+        
+        if requested > 1:
+            self._save_json(self.accounts_file, {})
+        for path in old_paths:
+            self._pending.pop(path, None)
+            self._cache.pop(path, None)
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def _init_shards(self):
+        """確保所有分片檔存在"""
+        if self.account_shards <= 1:
+            return
+        os.makedirs(self.shard_dir, exist_ok=True)
+        for shard in range(self.account_shards):
+            if not os.path.exists(self._shard_path(shard)):
+                self._save_json(self._shard_path(shard), {})
+        self.flush()
     
     # ==================== 交易記錄操作 ====================
     
     def load_transactions(self) -> List[Dict]:
         """載入所有交易記錄"""
+        if self.transaction_storage == STORAGE_LOG:
+            return list(self.iter_transactions())
         return self._load_json(self.transactions_file)
     
     def save_transactions(self, transactions: List) -> bool:
-        """儲存交易記錄"""
-        return self._save_json(self.transactions_file, transactions)
+        """
+        儲存交易記錄（整份覆寫）
+        
+        log 模式下會重寫所有分段檔，只適合清空或搬移資料；
+        新增單筆交易請使用 append_transaction()
+        """
+        with self._wal_logged({"op": "save_transactions", "transactions": transactions}):
+            if self.transaction_storage == STORAGE_LOG:
+                with self._writing(self.segment_dir):
+                    success = self._rewrite_log(transactions)
+            else:
+                with self._writing(self.transactions_file):
+                    success = self._save_json(self.transactions_file, transactions)
+            return self._committed(success)
+    
+    def append_transaction(self, transaction: Dict) -> bool:
+        """
+        新增一筆交易記錄
+        
+        [設計決策]
+        - json 模式：載入整份陣列、追加、覆寫（O(總交易數)）
+        - log 模式：在目前分段檔尾端寫入一行 JSON（O(1)）
+        """
+        return self.append_transactions([transaction])
+    
+    def append_transactions(self, transactions: List[Dict]) -> bool:
+        """
+        一次新增多筆交易記錄
+        
+        - json 模式：一次追加、一次覆寫
+        - log 模式：同一分段檔的記錄合併為一次 write
+        """
+        if not transactions:
+            return True
+        op = {"op": "append_transactions", "transactions": list(transactions)}
+        if self.transaction_storage != STORAGE_LOG:
+            with self._writing(self.transactions_file):
+                stored = self._load_json(self.transactions_file)
+                self._wal_log(op)
+                stored.extend(transactions)
+                success = self._save_json(self.transactions_file, stored)
+        else:
+            with self._writing(self.segment_dir):
+                self._wal_log(op)
+                success = self._append_log(transactions)
+        return self._committed(success)
+    
+    def _append_log(self, transactions: List[Dict]) -> bool:
+        """
+        log 模式追加（呼叫端需持有 segment_dir 的寫入鎖）
+        
+        延後寫入時只配置寫入位置並暫存內容（_stage_appends），flush() 時才寫入分段檔：
+        批次 rollback 不會留下交易或索引記錄；WAL 模式在 WAL 記錄 fsync 之後才寫入，
+        當機時分段檔不會出現 WAL 沒有的交易
+        
+        有暫存的追加時本程序一直持有 segment_dir 的跨程序鎖，分段檔大小落後於
+        寫入位置，不需要（也不能）同步；WAL 模式獨佔資料目錄，同樣不需要
+        """
+        if not (self.wal or self._append_entries or self._writer.entries):
+            self._sync_log()
+        segment, size = self._active_segment, self._active_size
+        writes = []
+        entries = []
+        for transaction in transactions:
+            line = json.dumps(transaction, ensure_ascii=False, separators=(",", ":")) + "\n"
+            data = line.encode("utf-8")
+            if size + len(data) > self.segment_max_bytes and size > 0:
+                segment += 1
+                size = 0
+            path = self._segment_path(segment)
+            if not writes or writes[-1][0] != path:
+                writes.append((path, bytearray()))
+            writes[-1][1].extend(data)
+            entries.append((transaction.get("account_id"), transaction.get("transaction_id"),
+                            (segment << POSITION_SHIFT) | size, transaction.get("type", "")))
+            size += len(data)
+        if self._deferred():
+            self._stage_appends(writes, entries)
+            self._active_segment, self._active_size = segment, size
+            return True
+        try:
+            for path, data in writes:
+                with open(path, 'ab') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._active_segment, self._active_size = segment, size
+            self._index_append(entries)
+            return True
+        except OSError as e:
+            print(f"[Error] 儲存失敗: {e}")
+            return False
+    
+    def _stage_appends(self, writes: List[Tuple[str, bytearray]], entries: List):
+        """
+        暫存延後寫入的追加（分段檔的追加需持有 segment_dir 的寫入鎖，在更新寫入位置之前呼叫）
+        
+        臨界區內先暫存在本執行緒並記下分段檔追加前的位置（例外時退回），
+        離開時由 _seal 與 WAL 記錄一起交給提交佇列並加入提交視窗；
+        批次中直接放入佇列，rollback 時捨棄
+        """
+        state = self._writer
+        if state.held and self._batch_owner != threading.get_ident():
+            if entries and state.log_start is None:
+                state.log_start = (self._active_segment, self._active_size)
+            state.appends.extend(writes)
+            state.entries.extend(entries)
+            return
+        with self._commit_lock:
+            self._appends.extend(writes)
+            self._append_entries.extend(entries)
+    
+    def iter_transactions(self) -> Iterator[Dict]:
+        """
+        依寫入順序逐筆讀取交易記錄
+        
+        [設計決策]
+        - log 模式：逐行串流讀取分段檔
+        - json 模式：已在快取中就直接走訪快取；否則以增量解析器
+          逐筆解析 transactions.json，不會一次載入整個歷史
+        - 二進位格式無法增量解析，只能整份解碼
+        """
+        if self.transaction_storage != STORAGE_LOG:
+            filepath = self.transactions_file
+            cached = self._cache.get(filepath)
+            if filepath in self._pending or (
+                    cached is not None and cached[0] == self._file_signature(filepath)):
+                yield from self._load_json(filepath)
+            else:
+                yield from self._iter_json_array(filepath)
+            return
+        yield from self._iter_log()
+    
+    def _iter_log(self, start_segment: int = 0, start_offset: int = 0) -> Iterator[Dict]:
+        """log 模式：從指定分段檔的指定位置開始逐行串流讀取"""
+        for txn, _ in self._scan_log(start_segment, start_offset):
+            yield txn
+    
+    def _scan_log(self, start_segment: int = 0, start_offset: int = 0) -> Iterator[Tuple[Dict, int]]:
+        """同 _iter_log，另外產生該行結束後的記錄位置（分段檔編號 << 40 | offset）"""
+        for number in self._list_segments():
+            if number < start_segment:
+                continue
+            path = self._segment_path(number)
+            with open(path, 'rb') as f:
+                offset = start_offset if number == start_segment else 0
+                f.seek(offset)
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        # 寫到一半的殘行（當機），視為不存在
+                        break
+                    offset += len(raw)
+                    try:
+                        yield json.loads(raw), (number << POSITION_SHIFT) | offset
+                    except json.JSONDecodeError:
+                        raise ValueError(f"JSON 格式錯誤: {path}")
+    
+    def get_transactions_since(self, position: int = 0) -> Tuple[List[Dict], int]:
+        """
+        增量讀取：上次讀到的位置之後新增的交易記錄（依寫入順序）
+        
+        輸入：
+            position (int): 上次回傳的位置，0 表示從頭開始
+        
+        輸出：
+            tuple: (新增的交易記錄, 下次使用的位置)
+        
+        [設計決策]
+        - 交易只追加，位置之前的記錄不會改變，只需讀取尾端新增的部分
+          - json 模式：位置為陣列長度
+          - log 模式：位置為「分段檔編號 << 40 | 檔內 offset」，直接從該處讀起
+        - 整份覆寫（save_transactions / clear_all_data）後位置失效，偵測到時拋出
+          StalePositionError，由呼叫端從 0 重新讀取：
+          - json 模式：陣列長度小於位置
+          - log 模式：位置所在的分段檔不存在，或位置不在行尾（檔案變短或內容不同）
+        
+        例外：
+            StalePositionError: 位置已失效
+        """
+        if self.transaction_storage != STORAGE_LOG:
+            transactions = self._load_json(self.transactions_file)
+            if position > len(transactions):
+                raise StalePositionError(f"交易記錄已被覆寫: {position} > {len(transactions)}")
+            return transactions[position:], len(transactions)
+        if position and not self._at_line_end(position):
+            raise StalePositionError(f"交易記錄已被覆寫: {position}")
+        records = []
+        for txn, position in self._scan_log(position >> POSITION_SHIFT, position & POSITION_MASK):
+            records.append(txn)
+        return records, position
+    
+    def _at_line_end(self, position: int) -> bool:
+        """log 模式的記錄位置是否仍是某一行的結尾（分段檔存在且前一個位元組為換行）"""
+        offset = position & POSITION_MASK
+        try:
+            with open(self._segment_path(position >> POSITION_SHIFT), 'rb') as f:
+                if offset == 0:
+                    return True
+                f.seek(offset - 1)
+                return f.read(1) == b"\n"
+        except FileNotFoundError:
+            return False
+    
+    def iter_transactions_range(self, start: Optional[str] = None, end: Optional[str] = None,
+                                account_id: Optional[str] = None) -> Iterator[Dict]:
+        """
+        依時間區間逐筆讀取交易記錄（start <= timestamp < end，依寫入順序）
+        
+        輸入：
+            start (str, optional): ISO 時間字串，None 表示不限
+            end (str, optional): ISO 時間字串，None 表示不限
+            account_id (str, optional): 只取單一帳戶
+        
+        [設計決策]
+        - 交易依時間順序追加，以二分搜尋找出區間起點（O(log n) 次讀取），
+          之後只讀取區間內的記錄，讀到超過 end 的記錄就停止
+          - 指定帳戶：在帳戶索引上二分搜尋
+          - 全部帳戶：json 模式在交易陣列上；log 模式先依各分段檔第一筆找出分段，
+            再在分段檔內以位元組位置二分搜尋行首
+        - 搜尋邊界放寬 TIMESTAMP_SKEW，容許並行寫入造成的些微亂序，區間內仍逐筆比對
+        """
+        low = _shift_timestamp(start, -TIMESTAMP_SKEW) if start is not None else None
+        high = _shift_timestamp(end, TIMESTAMP_SKEW) if end is not None else None
+        if account_id is not None or self.transaction_storage != STORAGE_LOG:
+            if account_id is not None:
+                positions, read = self._account_positions(account_id)
+            else:
+                transactions = self._load_json(self.transactions_file)
+                positions, read = range(len(transactions)), transactions.__getitem__
+            first = bisect_left(_TimestampView(positions, read), low) if low is not None else 0
+            records = (read(positions[i]) for i in range(first, len(positions)))
+        elif low is not None:
+            records = self._iter_log(*self._seek_log(low))
+        else:
+            records = self._iter_log()
+        
+        for txn in records:
+            if txn is None:
+                continue
+            timestamp = txn.get("timestamp", "")
+            if high is not None and timestamp >= high:
+                break
+            if (start is None or timestamp >= start) and (end is None or timestamp < end):
+                yield txn
+    
+    def _seek_log(self, timestamp: str) -> Tuple[int, int]:
+        """
+        log 模式：第一筆 timestamp >= 指定時間的記錄位置 (分段檔編號, 檔內 offset)
+        
+        先以各分段檔第一筆的時間二分搜尋分段，再在分段檔內二分搜尋：
+        任取中間位置往前找到行首，解析該行後決定往前或往後
+        """
+        segments = self._list_segments()
+        if not segments:
+            return 0, 0
+        firsts = _TimestampView(segments, lambda number: self._read_mapped(number << POSITION_SHIFT))
+        segment = segments[max(bisect_left(firsts, timestamp) - 1, 0)]
+        path = self._segment_path(segment)
+        if os.path.getsize(path) == 0:
+            return segment, 0
+        mapped = self._map_file(path)
+        try:
+            # 不變量：lo 之前的行都早於 timestamp，hi 之後的行都不早於 timestamp（兩者皆為行首）
+            lo, hi = 0, len(mapped)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                line_start = mapped.rfind(b"\n", 0, mid) + 1
+                line_end = mapped.find(b"\n", line_start)
+                if line_end == -1:
+                    # 寫到一半的殘行
+                    hi = line_start
+                elif json.loads(mapped[line_start:line_end]).get("timestamp", "") < timestamp:
+                    lo = line_end + 1
+                else:
+                    hi = line_start
+            return segment, lo
+        finally:
+            mapped.close()
+    
+    def _iter_json_array(self, filepath: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Any]:
+        """
+        增量解析 JSON 陣列檔，逐一產生元素
+        
+        記憶體用量只與 chunk_size 和單筆元素大小有關，與陣列長度無關
+        """
+        decoder = json.JSONDecoder()
+        with open(filepath, 'rb') as f:
+            if f.read(len(HEADER_MAGIC)) == HEADER_MAGIC:
+                # 二進位格式：沒有辦法逐筆解析
+                yield from self._load_json(filepath)
+                return
+        
+        with open(filepath, 'r', encoding='utf-8') as f:
+            buffer, pos, eof = "", 0, False
+            started = False
+            while True:
+                # 略過空白與分隔符號
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if pos >= len(buffer):
+                    if eof:
+                        raise ValueError(f"JSON 格式錯誤: {filepath}")
+                    chunk = f.read(chunk_size)
+                    eof = not chunk
+                    buffer, pos = buffer[pos:] + chunk, 0
+                    continue
+                if not started:
+                    if buffer[pos] != "[":
+                        raise ValueError(f"JSON 格式錯誤: {filepath}")
+                    started = True
+                    pos += 1
+                    continue
+                if buffer[pos] == "]":
+                    return
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                    # 元素剛好在緩衝區尾端時可能還沒讀完（例如數字），需要再讀一段確認
+                    complete = end < len(buffer) or eof
+                except json.JSONDecodeError:
+                    complete = False
+                if not complete:
+                    if eof:
+                        raise ValueError(f"JSON 格式錯誤: {filepath}")
+                    chunk = f.read(chunk_size)
+                    eof = not chunk
+                    buffer, pos = buffer[pos:] + chunk, 0
+                    continue
+                yield item
+                pos = end
+    
+    def get_account_transactions(self, account_id: str,
+                                 transaction_type: Optional[str] = None,
+                                 limit: int = 0, newest_first: bool = False) -> List[Dict]:
+        """
+        查詢單一帳戶的交易記錄（預設依寫入順序，舊→新）
+        
+        輸入：
+            account_id (str): 帳號 ID
+            transaction_type (str, optional): 只取特定類型
+            limit (int): 最多回傳幾筆（0 = 全部）
+            newest_first (bool): True 時回傳最新的 limit 筆（新→舊）
+        
+        [設計決策]
+        - 交易一律在發生當下追加，寫入順序就是時間順序；
+          newest_first 從帳戶索引的尾端往回讀，湊滿 limit 筆就停止，
+          讀取量與記憶體為 O(limit)，不需要讀出整個帳戶歷史再排序
+        - 指定類型時改用 (帳號, 類型) 複合索引，只讀取符合的記錄
+        """
+        if newest_first:
+            return self.get_account_page(account_id, limit, transaction_type=transaction_type)[0]
+        positions, read = self._account_positions(account_id, transaction_type)
+        if limit > 0:
+            positions = positions[:limit]
+        if self.transaction_storage == STORAGE_LOG:
+            return self._read_at(positions)
+        return [read(i) for i in positions]
+    
+    def get_account_page(self, account_id: str, limit: int, before: Optional[int] = None,
+                         transaction_type: Optional[str] = None) -> Tuple[List[Dict], Optional[int]]:
+        """
+        分頁查詢單一帳戶的交易記錄（新→舊）
+        
+        輸入：
+            account_id (str): 帳號 ID
+            limit (int): 每頁筆數（0 = 剩下的全部）
+            before (int, optional): 上一頁回傳的游標，只取比它舊的記錄；None 為第一頁
+            transaction_type (str, optional): 只取特定類型
+        
+        輸出：
+            tuple: (交易記錄列表, 下一頁游標)，沒有更舊的記錄時游標為 None
+        
+        [設計決策]
+        - 游標是記錄在帳戶索引中的序號：索引只追加，舊記錄的序號不會改變，
+          翻頁期間新增的交易也不會讓頁面錯位
+        - 第 k 頁直接從游標往回讀 limit 筆，成本與第 1 頁相同
+        """
+        positions, read = self._account_positions(account_id, transaction_type)
+        # 索引可能被其他執行緒追加，以目前長度為準往回走
+        i = len(positions) if before is None else min(before, len(positions))
+        transactions = []
+        while i > 0 and (limit <= 0 or len(transactions) < limit):
+            i -= 1
+            txn = read(positions[i])
+            if txn is not None:
+                transactions.append(txn)
+        return transactions, (i if i > 0 else None)
+    
+    def _account_positions(self, account_id: str, transaction_type: Optional[str] = None):
+        """
+        帳戶（或帳戶 + 類型）的記錄位置列表，以及依位置讀取單筆記錄的函數
+        
+        log 模式會先補上其他程序追加的索引；索引檔沒有變長時不需要跨程序鎖
+        """
+        if self.transaction_storage == STORAGE_LOG:
+            # 只讀取索引中屬於此帳戶的記錄
+            if self._log_index_grew():
+                with self._region_lock(self.segment_dir, exclusive=False):
+                    self._sync_log_index()
+            read = self._read_mapped
+        else:
+            read = self._refresh_json_index().__getitem__
+        if transaction_type is None:
+            return self._account_index.get(account_id, ()), read
+        return self._type_index.get((account_id, transaction_type), ()), read
+    
+    def get_transaction(self, transaction_id: str) -> Optional[Dict]:
+        """
+        依交易 ID 查詢單筆交易，不存在時回傳 None
+        
+        [設計決策]
+        - log 模式：交易位置表與分段檔皆以 mmap 讀取，
+          查詢只需一次定位 + 解析一筆記錄，不會複製其餘 log
+        - json 模式：使用記憶體中的交易 ID 索引
+        """
+        if self.transaction_storage != STORAGE_LOG:
+            transactions = self._refresh_json_index()
+            index = self._txn_index.get(transaction_id)
+            return transactions[index] if index is not None else None
+        
+        number = parse_id_number(transaction_id, "TXN")
+        if number is None:
+            return None
+        position = self._offset_lookup(number)
+        if position is None:
+            return None
+        transaction = self._read_mapped(position)
+        if transaction is None or transaction.get("transaction_id") != transaction_id:
+            return None
+        return transaction
+    
+    def _refresh_json_index(self) -> List[Dict]:
+        """
+        json 模式的記憶體索引（帳戶 → 陣列索引、交易 ID → 陣列索引）
+        
+        transactions.json 只會追加，因此只需補上新增的部分；
+        快取物件被替換或變短時才整份重建
+        """
+        transactions = self._load_json(self.transactions_file)
+        with self._index_lock:
+            if self._json_index_source is not transactions or self._json_indexed > len(transactions):
+                self._json_index_source = transactions
+                self._account_index = {}
+                self._type_index = {}
+                self._txn_index = {}
+                self._json_indexed = 0
+            end = len(transactions)
+            for i in range(self._json_indexed, end):
+                txn = transactions[i]
+                self._account_index.setdefault(txn.get("account_id"), []).append(i)
+                self._type_index.setdefault((txn.get("account_id"), txn.get("type", "")), []).append(i)
+                self._txn_index[txn.get("transaction_id")] = i
+            self._json_indexed = end
+        return transactions
+    
+    def migrate_transactions_to_log(self) -> int:
+        """
+        一次性將 transactions.json 陣列轉換為 log 模式
+        
+        輸出：
+            int: 轉換的交易筆數
+        
+        轉換完成後原檔更名為 transactions.json.migrated 保留備份
+        """
+        if self.transaction_storage == STORAGE_LOG:
+            return 0
+        if self.wal:
+            # 以下直接搬移主檔，先讓主檔包含所有已提交的變更
+            self.checkpoint()
+        
+        transactions = self._load_json(self.transactions_file)
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self._rewrite_log(transactions)
+        
+        config = self._load_json(self.config_file)
+        config["transaction_storage"] = STORAGE_LOG
+        self._save_json(self.config_file, config)
+        if self.wal:
+            self.checkpoint()
+        os.replace(self.transactions_file, self.transactions_file + ".migrated")
+        self._save_json(self.transactions_file, [])
+        
+        self.transaction_storage = STORAGE_LOG
+        self._init_log()
+        if self.wal:
+            self.checkpoint()
+        return len(transactions)
+    
+    # ==================== Log 分段檔 ====================
+    
+    def _segment_path(self, number: int) -> str:
+        """分段檔路徑"""
+        return os.path.join(self.segment_dir, f"segment_{number:06d}.jsonl")
+    
+    def _list_segments(self) -> List[int]:
+        """列出所有分段檔編號（由舊到新）"""
+        if not os.path.isdir(self.segment_dir):
+            return []
+        numbers = []
+        for name in os.listdir(self.segment_dir):
+            if name.startswith("segment_") and name.endswith(".jsonl"):
+                numbers.append(int(name[len("segment_"):-len(".jsonl")]))
+        return sorted(numbers)
+    
+    def _init_log(self):
+        """準備可追加的分段檔，並截掉當機留下的殘行"""
+        os.makedirs(self.segment_dir, exist_ok=True)
+        with self._region_lock(self.segment_dir):
+            segments = self._list_segments()
+            self._active_segment = segments[-1] if segments else 1
+            path = self._segment_path(self._active_segment)
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+            self._truncate_partial_line(path)
+            self._active_size = os.path.getsize(path)
+            self._load_account_index()
+    
+    def _sync_log(self):
+        """
+        追加前同步其他程序寫入的內容（呼叫端需持有 segment_dir 的獨佔鎖）
+        
+        分段檔的實際大小才是下一筆記錄的位置，不能只看本程序記錄的大小
+        """
+        segments = self._list_segments()
+        if segments and segments[-1] > self._active_segment:
+            self._active_segment = segments[-1]
+        path = self._segment_path(self._active_segment)
+        self._active_size = os.path.getsize(path) if os.path.exists(path) else 0
+        self._sync_log_index()
+    
+    def _log_index_grew(self) -> bool:
+        """帳戶索引檔是否比已讀取的部分長（不上鎖的快速檢查，變長時再上鎖補讀）"""
+        try:
+            return os.path.getsize(self.account_index_file) > self._index_size
+        except FileNotFoundError:
+            return False
+    
+    def _sync_log_index(self):
+        """
+        補上其他程序追加到帳戶索引檔的記錄
+        
+        索引檔只追加，比對已讀取的長度即可得知是否有新記錄
+        """
+        with self._index_lock:
+            try:
+                size = os.path.getsize(self.account_index_file)
+            except FileNotFoundError:
+                return
+            if size <= self._index_size:
+                return
+            with open(self.account_index_file, 'rb') as f:
+                f.seek(self._index_size)
+                data = f.read(size - self._index_size)
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].decode("utf-8").splitlines():
+                account_id, position, transaction_type = line.split("\t")
+                self._index_position(account_id, int(position), transaction_type)
+            self._index_size += end
+    
+    # ==================== 帳戶索引（log 模式） ====================
+    
+    def _load_account_index(self):
+        """
+        載入持久化的帳戶索引，並補上索引之後才寫入 log 的記錄
+        
+        [設計決策]
+        - 索引檔只追加：每筆交易一行「帳號<TAB>位置<TAB>類型」
+        - 索引是衍生資料，損毀、遺失或為舊格式（沒有類型欄）時從 log 重建
+        """
+        self._account_index = {}
+        self._type_index = {}
+        self._index_size = 0
+        last_position = None
+        if not os.path.exists(self.offset_table_file) and os.path.exists(self.account_index_file):
+            # 兩個索引由同一次掃描補齊，缺少交易位置表時一併重建
+            os.remove(self.account_index_file)
+        if os.path.exists(self.account_index_file):
+            self._truncate_partial_line(self.account_index_file)
+            try:
+                with open(self.account_index_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        account_id, position, transaction_type = line.rstrip("\n").split("\t")
+                        last_position = int(position)
+                        self._index_position(account_id, last_position, transaction_type)
+            except ValueError:
+                print(f"[Warning] 索引檔損毀或格式過舊，重新建立: {self.account_index_file}")
+                os.remove(self.account_index_file)
+                self._account_index = {}
+                self._type_index = {}
+                last_position = None
+            else:
+                self._index_size = os.path.getsize(self.account_index_file)
+        
+        # 從最後一筆已索引記錄的下一行開始補索引
+        if last_position is None:
+            start_segment, start_offset = 0, 0
+        else:
+            start_segment = last_position >> POSITION_SHIFT
+            with open(self._segment_path(start_segment), 'rb') as f:
+                f.seek(last_position & POSITION_MASK)
+                start_offset = (last_position & POSITION_MASK) + len(f.readline())
+        
+        entries = []
+        for number in self._list_segments():
+            if number < start_segment:
+                continue
+            with open(self._segment_path(number), 'rb') as f:
+                offset = start_offset if number == start_segment else 0
+                f.seek(offset)
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break
+                    txn = json.loads(raw)
+                    entries.append((txn.get("account_id"), txn.get("transaction_id"),
+                                    (number << POSITION_SHIFT) | offset, txn.get("type", "")))
+                    offset += len(raw)
+        self._index_append(entries)
+    
+    def _index_position(self, account_id: str, position: int, transaction_type: str):
+        """將一筆記錄位置加入帳戶索引與複合索引（呼叫端需持有 _index_lock 或在初始化中）"""
+        self._account_index.setdefault(account_id, array('q')).append(position)
+        self._type_index.setdefault((account_id, transaction_type), array('q')).append(position)
+    
+    def _index_append(self, entries: List):
+        """
+        將 (帳號, 交易 ID, 位置, 類型) 寫入索引
+        
+        先寫交易位置表再寫帳戶索引：兩者之間當機時，
+        重開後會從帳戶索引的最後一筆開始補，重寫位置表的結果相同
+        """
+        if not entries:
+            return
+        mode = 'r+b' if os.path.exists(self.offset_table_file) else 'w+b'
+        with open(self.offset_table_file, mode) as f:
+            for _, transaction_id, position, _ in entries:
+                number = parse_id_number(transaction_id, "TXN")
+                if number is not None:
+                    f.seek((number - 1) * OFFSET_ENTRY.size)
+                    f.write(OFFSET_ENTRY.pack(position + 1))
+        data = "".join(f"{account_id}\t{position}\t{transaction_type}\n"
+                       for account_id, _, position, transaction_type in entries).encode("utf-8")
+        with self._index_lock:
+            for account_id, _, position, transaction_type in entries:
+                self._index_position(account_id, position, transaction_type)
+            with open(self.account_index_file, 'ab') as f:
+                f.write(data)
+            self._index_size += len(data)
+    
+    def _offset_lookup(self, number: int) -> Optional[int]:
+        """從 mmap 的交易位置表取得第 number 號交易的記錄位置"""
+        start = (number - 1) * OFFSET_ENTRY.size
+        mapped = self._offset_mmap
+        if mapped is None or start + OFFSET_ENTRY.size > len(mapped):
+            # 表格變長（新交易）時重新 mmap
+            with self._mmap_lock:
+                mapped = self._offset_mmap
+                if mapped is None or start + OFFSET_ENTRY.size > len(mapped):
+                    if not os.path.exists(self.offset_table_file):
+                        return None
+                    if os.path.getsize(self.offset_table_file) < start + OFFSET_ENTRY.size:
+                        return None
+                    mapped = self._offset_mmap = self._map_file(self.offset_table_file)
+        value, = OFFSET_ENTRY.unpack_from(mapped, start)
+        return value - 1 if value else None
+    
+    def _read_mapped(self, position: int) -> Optional[Dict]:
+        """從 mmap 的分段檔解析單筆記錄"""
+        segment, offset = position >> POSITION_SHIFT, position & POSITION_MASK
+        mapped = self._segment_mmaps.get(segment)
+        end = mapped.find(b"\n", offset) if mapped is not None and offset < len(mapped) else -1
+        if end == -1:
+            # 尚未 mmap，或目前分段檔在 mmap 之後又追加了記錄
+            with self._mmap_lock:
+                if self._segment_mmaps.get(segment) is mapped:
+                    path = self._segment_path(segment)
+                    if not os.path.exists(path) or os.path.getsize(path) <= offset:
+                        return None
+                    self._segment_mmaps[segment] = self._map_file(path)
+                mapped = self._segment_mmaps[segment]
+            end = mapped.find(b"\n", offset) if offset < len(mapped) else -1
+            if end == -1:
+                return None
+        return json.loads(mapped[offset:end])
+    
+    @staticmethod
+    def _map_file(path: str) -> mmap.mmap:
+        """唯讀 mmap 整個檔案"""
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    def _close_mmaps(self):
+        """
+        捨棄所有 mmap（分段檔重寫或關閉時）
+        
+        不直接 close：進行中的讀取仍持有參照，讀完後自動關閉
+        """
+        with self._mmap_lock:
+            self._offset_mmap = None
+            self._segment_mmaps = {}
+    
+    def _read_at(self, positions) -> List[Dict]:
+        """依位置讀取 log 記錄（每筆一次 seek + 一行解析）"""
+        results = []
+        handles = {}
+        try:
+            for position in positions:
+                segment = position >> POSITION_SHIFT
+                f = handles.get(segment)
+                if f is None:
+                    f = handles[segment] = open(self._segment_path(segment), 'rb')
+                f.seek(position & POSITION_MASK)
+                results.append(json.loads(f.readline()))
+        finally:
+            for f in handles.values():
+                f.close()
+        return results
+    
+    def _truncate_partial_line(self, path: str):
+        """若檔案最後一行沒有換行符號，代表寫入中斷，將其截掉"""
+        size = os.path.getsize(path)
+        if size == 0:
+            return
+        with open(path, 'rb+') as f:
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # 往回找最後一個換行符號
+            pos = size
+            while pos > 0:
+                step = min(4096, pos)
+                pos -= step
+                f.seek(pos)
+                chunk = f.read(step)
+                idx = chunk.rfind(b"\n")
+                if idx != -1:
+                    f.truncate(pos + idx + 1)
+                    return
+            f.truncate(0)
+    
+    def _rewrite_log(self, transactions: List) -> bool:
+        """以新內容重寫所有分段檔"""
+        with self._commit_lock:
+            # 尚未寫入分段檔的追加屬於舊內容
+            self._appends = [(path, data) for path, data in self._appends
+                             if os.path.dirname(path) != self.segment_dir]
+            self._append_entries = []
+        try:
+            for number in self._list_segments():
+                os.remove(self._segment_path(number))
+            os.makedirs(self.segment_dir, exist_ok=True)
+            self._close_mmaps()
+            for path in (self.account_index_file, self.offset_table_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._account_index = {}
+            self._type_index = {}
+            self._index_size = 0
+            
+            number, size = 1, 0
+            entries = []
+            f = open(self._segment_path(number), 'wb')
+            try:
+                for txn in transactions:
+                    data = (json.dumps(txn, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+                    if size + len(data) > self.segment_max_bytes and size > 0:
+                        f.close()
+                        number, size = number + 1, 0
+                        f = open(self._segment_path(number), 'wb')
+                    f.write(data)
+                    entries.append((txn.get("account_id"), txn.get("transaction_id"),
+                                    (number << POSITION_SHIFT) | size, txn.get("type", "")))
+                    size += len(data)
+            finally:
+                f.close()
+            self._index_append(entries)
+            self._active_segment, self._active_size = number, size
+            return True
+        except OSError as e:
+            print(f"[Error] 儲存失敗: {e}")
+            return False
+    
+    # ==================== 冪等鍵 ====================
+    
+    def idempotency_store(self, **kwargs) -> IdempotencyStore:
+        """
+        建立本資料目錄的冪等鍵儲存（idempotency.jsonl，與資料共用鎖檔）
+        
+        參數：
+            **kwargs: IdempotencyStore 的 max_entries / ttl
+        """
+        return IdempotencyStore(self.idempotency_file, locks=self.locks,
+                                lock_region=IDEMPOTENCY_REGION, **kwargs)
+    
+    def _remember_keys(self, records: List[Dict]) -> bool:
+        """
+        將冪等鍵記錄追加到冪等鍵檔（呼叫端需在寫入臨界區內或為批次擁有者）
+        
+        延後寫入時與同一臨界區的交易一起交給提交佇列（WAL 模式寫在同一筆記錄）；
+        立即寫入時當下追加並 fsync
+        """
+        self._wal_log({"op": "remember", "records": records})
+        data = bytearray(encode_records(records))
+        if self._deferred():
+            self._stage_appends([(self.idempotency_file, data)], [])
+            return True
+        try:
+            with self._region_lock(self.idempotency_file):
+                with open(self.idempotency_file, 'ab') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+            return True
+        except OSError as e:
+            print(f"[Error] 儲存失敗: {e}")
+            return False
     
     # ==================== 設定檔操作 ====================
     
+    # [設計決策] ID 配置器
+    # - config.json 的 next_xxx_id 代表「尚未被預留的第一個 ID」
+    # - 每次從 config.json 預留一整段（id_block_size 個）ID，只寫一次檔案，
+    #   之後在記憶體中依序配發
+    # - close() 時若 config.json 的 next_xxx_id 仍是本實例區段的結尾
+    #   （之後沒有其他實例預留），把未用完的部分歸還；否則直接跳過
+    #   （當機或多程序交錯時可能產生空號，但不會重複）
+    # - 格式為前綴 + 至少 4 位數字，超過 9999 時自動加寬（ACC10000）
+    
+    def _peek_id(self, key: str) -> int:
+        """查看下一個會配發的 ID（不消耗）"""
+        with self._id_lock:
+            block = self._id_blocks[key]
+            if block[0] >= block[1]:
+                self._reserve_id_block(key)
+            return block[0]
+    
+    def _allocate_id(self, key: str) -> int:
+        """配發一個 ID（讀取與遞增為同一個原子操作）"""
+        with self._id_lock:
+            block = self._id_blocks[key]
+            if block[0] >= block[1]:
+                self._reserve_id_block(key)
+            allocated = block[0]
+            block[0] += 1
+            return allocated
+    
+    def _reserve_id_block(self, key: str):
+        """
+        從 config.json 預留一段新的 ID（呼叫端需持有 _id_lock）
+        
+        讀取與寫回 config.json 期間持有跨程序獨佔鎖，其他程序不會預留到同一段
+        """
+        with self._region_lock(self.config_file):
+            self._reserve_id_block_locked(key)
+    
+    def _reserve_id_block_locked(self, key: str):
+        """預留 ID 的實際讀寫（呼叫端需持有 config.json 的跨程序鎖）"""
+        config = self._load_json(self.config_file)
+        start = max(config.get(key, 1), self._id_blocks[key][1])
+        config[key] = start + self.id_block_size
+        # 預留必須在配發前落盤，否則重啟後可能重複配發；
+        # 群組提交 / 批次模式下也直接寫入，不等待 flush()
+        try:
+            self._write_atomic(self.config_file, config)
+            self._fsync_dir(os.path.dirname(self.config_file))
+        except OSError as e:
+            self._cache.pop(self.config_file, None)
+            raise IOError(f"無法預留 ID: {self.config_file}") from e
+        with self._commit_lock:
+            self._pending.pop(self.config_file, None)
+        self._cache[self.config_file] = (self._file_signature(self.config_file), config)
+        self._id_blocks[key][:] = [start, start + self.id_block_size]
+    
+    def _return_id_blocks(self):
+        """
+        歸還未用完的 ID 區段：next_xxx_id 仍等於本實例區段結尾時改回下一個未配發的 ID
+        
+        讀取與寫回期間持有 config.json 的跨程序鎖；寫入失敗只是留下空號，不拋出例外
+        """
+        with self._id_lock, self._region_lock(self.config_file):
+            config = self._load_json(self.config_file)
+            returned = {
+                key: block[0] for key, block in self._id_blocks.items()
+                if block[0] < block[1] and config.get(key) == block[1]
+            }
+            if not returned:
+                return
+            config.update(returned)
+            try:
+                self._write_atomic(self.config_file, config)
+                self._fsync_dir(os.path.dirname(self.config_file))
+            except OSError as e:
+                self._cache.pop(self.config_file, None)
+                print(f"[Error] 無法歸還 ID 區段: {e}")
+                return
+            with self._commit_lock:
+                self._pending.pop(self.config_file, None)
+            self._cache[self.config_file] = (self._file_signature(self.config_file), config)
+            for key in returned:
+                self._id_blocks[key][:] = [0, 0]
+    
     def get_next_account_id(self) -> int:
         """取得下一個帳號 ID"""
-        config = self._load_json(self.config_file)
-        return config.get("next_account_id", 1)
+        return self._peek_id("next_account_id")
     
     def increment_account_id(self) -> bool:
         """遞增帳號 ID"""
-        config = self._load_json(self.config_file)
-        config["next_account_id"] += 1
-        return self._save_json(self.config_file, config)
+        self._allocate_id("next_account_id")
+        return True
+    
+    def allocate_account_id(self) -> int:
+        """配發一個帳號 ID（取代 get_next_account_id + increment_account_id）"""
+        return self._allocate_id("next_account_id")
     
     def get_next_transaction_id(self) -> int:
         """取得下一個交易 ID"""
-        config = self._load_json(self.config_file)
-        return config.get("next_transaction_id", 1)
+        return self._peek_id("next_transaction_id")
     
     def increment_transaction_id(self) -> bool:
         """遞增交易 ID"""
-        config = self._load_json(self.config_file)
-        config["next_transaction_id"] += 1
-        return self._save_json(self.config_file, config)
+        self._allocate_id("next_transaction_id")
+        return True
+    
+    def allocate_transaction_id(self) -> int:
+        """配發一個交易 ID（取代 get_next_transaction_id + increment_transaction_id）"""
+        return self._allocate_id("next_transaction_id")
     
     def clear_all_data(self):
         """清空所有資料（測試用）"""
         self._save_json(self.accounts_file, {})
+        for shard in range(self.account_shards if self.account_shards > 1 else 0):
+            self._save_json(self._shard_path(shard), {})
         self._save_json(self.transactions_file, [])
-        self._save_json(self.config_file, {
+        
+        # 保留儲存設定，只重設流水號
+        config = {
+            key: value for key, value in self._load_json(self.config_file).items()
+            if key in ("codec", "account_shards", "transaction_storage", "backend")
+        }
+        config.update({
             "next_account_id": 1,
             "next_transaction_id": 1
-        })
\ No newline at end of file
+        })
+        if self.transaction_storage == STORAGE_LOG:
+            self._rewrite_log([])
+        self._save_json(self.config_file, config)
+        with self._id_lock:
+            self._id_blocks = {"next_account_id": [0, 0], "next_transaction_id": [0, 0]}
+        if self.wal:
+            self.checkpoint()
\ No newline at end of file
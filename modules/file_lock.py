@@ -0,0 +1,264 @@
+"""
+File Lock Module
+跨程序檔案鎖 - 多個程序共用同一個資料目錄時的互斥
+
+[完整實作 100%] 由整合者提供，組員直接使用
+
+[設計決策]
+- 整個資料目錄只用一個鎖檔，以「區域」（鎖檔中的第 N 個位元組）區分不同的鎖，
+  各區域互不影響，鎖定範圍越小，程序之間越能並行
+- 共用鎖（讀）之間不互斥；獨佔鎖（寫）與同一區域的其他鎖互斥
+- fcntl 的鎖屬於程序而不屬於執行緒，同一程序對同一區域再次上鎖或解鎖會互相覆蓋，
+  因此程序內另以 threading 管理：第一個讀者 / 寫者才向作業系統上鎖，
+  最後一個離開時才解鎖
+- 程序內寫者優先：有執行緒等待獨佔鎖時，新的共用鎖請求先等待，
+  持續不斷的讀者不會讓寫者永遠等不到（同一執行緒不可重複取得同一區域的共用鎖）
+- 關閉同一檔案的任何一個 fd 都會釋放本程序在該檔案上的所有 fcntl 鎖，
+  因此同一程序內指向同一鎖檔（realpath 相同）的 FileLock 共用一份 fd 與區域狀態
+  （模組層級的登錄表，以參照計數管理）；各實例只記錄自己持有的區域，
+  close() 只釋放自己持有的部分，最後一個實例關閉時才關閉 fd；
+  鎖檔被刪除重建（inode 不同）時視為新的檔案，不沿用舊狀態
+- 沒有 fcntl 的平台（Windows）只保留程序內的互斥
+"""
+
+import errno
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - 依平台而定
+    fcntl = None
+
+
+class _Region:
+    """單一區域在本程序內的狀態"""
+
+    __slots__ = ("cond", "readers", "writer", "waiting")
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        # 等待獨佔鎖的執行緒數（> 0 時新的讀者先等待）
+        self.waiting = 0
+
+
+class _LockFile:
+    """同一鎖檔在本程序內共用的狀態（fd、各區域、參照計數）"""
+
+    __slots__ = ("path", "fd", "identity", "regions", "guard", "refs")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd: Optional[int] = None
+        self.identity: Optional[Tuple[int, int]] = None
+        if fcntl is not None:
+            self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            st = os.fstat(self.fd)
+            self.identity = (st.st_dev, st.st_ino)
+        self.regions: Dict[int, _Region] = {}
+        self.guard = threading.Lock()
+        self.refs = 0
+
+    def is_current(self) -> bool:
+        """路徑上的鎖檔是否仍是開啟的這一個"""
+        if self.identity is None:
+            return True
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (st.st_dev, st.st_ino) == self.identity
+
+
+# {realpath: 共用狀態}
+_registry: Dict[str, _LockFile] = {}
+_registry_lock = threading.Lock()
+
+
+class FileLock:
+    """
+    以 fcntl 位元組範圍鎖實作的共用 / 獨佔鎖
+
+    使用範例：
+        locks = FileLock("data/.lock")
+        with locks.exclusive(3):
+            ...  # 其他程序、其他執行緒都無法取得區域 3
+        with locks.shared(3):
+            ...  # 可與其他讀者同時進行
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[_LockFile] = None
+        # 本實例持有的區域 {(區域, 是否獨佔): 次數}
+        self._held: Dict[Tuple[int, bool], int] = {}
+
+    def _lock_file(self) -> _LockFile:
+        """取得共用狀態（第一次使用時向登錄表登記）"""
+        with _registry_lock:
+            if self._file is None:
+                key = os.path.realpath(self.path)
+                lock_file = _registry.get(key)
+                if lock_file is None or not lock_file.is_current():
+                    lock_file = _registry[key] = _LockFile(key)
+                lock_file.refs += 1
+                self._file = lock_file
+            return self._file
+
+    def _region(self, region: int) -> _Region:
+        """取得區域狀態"""
+        lock_file = self._lock_file()
+        with lock_file.guard:
+            state = lock_file.regions.get(region)
+            if state is None:
+                state = lock_file.regions[region] = _Region()
+            return state
+
+    def _os_lock(self, region: int, operation, blocking: bool = True) -> bool:
+        """
+        向作業系統上鎖 / 解鎖
+
+        核心偵測到跨程序死結（EDEADLK）時稍後重試，由對方先完成；
+        blocking=False 時被其他程序持有就回傳 False
+        """
+        if fcntl is None:
+            return True
+        if not blocking:
+            operation |= fcntl.LOCK_NB
+        while True:
+            try:
+                fcntl.lockf(self._file.fd, operation, 1, region, os.SEEK_SET)
+                return True
+            except OSError as e:
+                if not blocking and e.errno in (errno.EACCES, errno.EAGAIN):
+                    return False
+                if e.errno != errno.EDEADLK:
+                    raise
+                time.sleep(0.001)
+
+    def acquire(self, region: int, exclusive: bool = True, blocking: bool = True) -> bool:
+        """
+        取得區域鎖
+
+        blocking=True 時等待直到取得；False 時無法立即取得就回傳 False
+        """
+        state = self._region(region)
+        with state.cond:
+            if exclusive:
+                if state.writer or state.readers:
+                    if not blocking:
+                        return False
+                    state.waiting += 1
+                    try:
+                        while state.writer or state.readers:
+                            state.cond.wait()
+                    finally:
+                        state.waiting -= 1
+                        if not state.waiting:
+                            state.cond.notify_all()
+                state.writer = True
+                acquired = False
+                try:
+                    acquired = self._os_lock(region, fcntl.LOCK_EX if fcntl else None, blocking)
+                finally:
+                    if not acquired:
+                        state.writer = False
+                        state.cond.notify_all()
+                if acquired:
+                    self._track(region, True, 1)
+                return acquired
+            else:
+                while state.writer or state.waiting:
+                    if not blocking:
+                        return False
+                    state.cond.wait()
+                state.readers += 1
+                if state.readers == 1:
+                    # 第一個讀者負責上鎖；持有 cond 期間其他讀者會等到上鎖完成
+                    acquired = False
+                    try:
+                        acquired = self._os_lock(region, fcntl.LOCK_SH if fcntl else None, blocking)
+                    finally:
+                        if not acquired:
+                            state.readers -= 1
+                            state.cond.notify_all()
+                    if not acquired:
+                        return False
+        self._track(region, False, 1)
+        return True
+
+    def _track(self, region: int, exclusive: bool, delta: int):
+        """記錄本實例持有的區域"""
+        with _registry_lock:
+            key = (region, exclusive)
+            count = self._held.get(key, 0) + delta
+            if count > 0:
+                self._held[key] = count
+            else:
+                self._held.pop(key, None)
+
+    def release(self, region: int, exclusive: bool = True):
+        """釋放區域鎖（可由取得者以外的執行緒呼叫）"""
+        self._track(region, exclusive, -1)
+        self._release(region, exclusive)
+
+    def _release(self, region: int, exclusive: bool):
+        """釋放區域鎖的實際處理（不更新持有記錄）"""
+        state = self._region(region)
+        with state.cond:
+            if exclusive:
+                state.writer = False
+                self._os_lock(region, fcntl.LOCK_UN if fcntl else None)
+            else:
+                state.readers -= 1
+                if state.readers == 0:
+                    self._os_lock(region, fcntl.LOCK_UN if fcntl else None)
+            state.cond.notify_all()
+
+    @contextmanager
+    def exclusive(self, region: int):
+        """獨佔鎖區塊"""
+        self.acquire(region, exclusive=True)
+        try:
+            yield
+        finally:
+            self.release(region, exclusive=True)
+
+    @contextmanager
+    def shared(self, region: int):
+        """共用鎖區塊"""
+        self.acquire(region, exclusive=False)
+        try:
+            yield
+        finally:
+            self.release(region, exclusive=False)
+
+    def close(self):
+        """
+        釋放本實例持有的所有區域；同一鎖檔的最後一個實例關閉時才關閉 fd
+
+        同一程序內其他實例持有的區域不受影響
+        """
+        with _registry_lock:
+            lock_file, held = self._file, self._held
+            self._held = {}
+        if lock_file is None:
+            return
+        for (region, exclusive), count in held.items():
+            for _ in range(count):
+                self._release(region, exclusive)
+        with _registry_lock:
+            self._file = None
+            lock_file.refs -= 1
+            if lock_file.refs == 0:
+                if _registry.get(lock_file.path) is lock_file:
+                    del _registry[lock_file.path]
+                with lock_file.guard:
+                    if lock_file.fd is not None:
+                        os.close(lock_file.fd)
+                        lock_file.fd = None
@@ -11,8 +11,17 @@ History Module
 3. 按類型查詢
 """
 
+import base64
+import json
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+from modules.data_manager import UnitOfWork
+from modules.money import read_minor, to_major, to_minor
+
+
+# 所有交易類型（get_history_by_type 只接受這些類型）
+TRANSACTION_TYPES = ("DEPOSIT", "WITHDRAW", "TRANSFER_OUT", "TRANSFER_IN")
 
 
 class HistoryModule:
@@ -31,7 +40,9 @@ class HistoryModule:
     
     def log_transaction(self, account_id: str, transaction_type: str, 
                        amount: float, balance_after: float, 
-                       related_account: Optional[str] = None) -> str:
+                       related_account: Optional[str] = None,
+                       unit_of_work: Optional[UnitOfWork] = None,
+                       minor_units: bool = False) -> str:
         """
         記錄交易
         
@@ -43,14 +54,19 @@ class HistoryModule:
             amount (float): 交易金額
             balance_after (float): 交易後餘額
             related_account (str, optional): 關聯帳號（轉帳時使用）
+            unit_of_work (UnitOfWork, optional): 給定時只暫存在工作單元，
+                由工作單元 commit 時一起寫入
+            minor_units (bool): True 時 amount / balance_after 為「分」的整數
+                （TransactionModule 使用），預設為「元」
         
         輸出：
             str: 交易 ID (例如: "TXN0001")
         
         [設計決策]
-        - 交易 ID 格式：TXN + 4位數字
+        - 交易 ID 格式：TXN + 至少4位數字
         - 記錄時間戳記
         - 轉帳時可記錄對方帳號
+        - 金額以「分」的整數儲存（modules/money.py）
         
         使用範例：
             txn_id = history.log_transaction(
@@ -60,20 +76,17 @@ class HistoryModule:
                 balance_after=1500.0
             )
         """
-        # Step 1: 載入現有交易記錄
-        transactions = self.data_manager.load_transactions()
-        
-        # Step 2: 生成交易 ID
-        next_id = self.data_manager.get_next_transaction_id()
+        # Step 1: 生成交易 ID
+        next_id = self.data_manager.allocate_transaction_id()
         transaction_id = f"TXN{next_id:04d}"
         
-        # Step 3: 建立交易記錄
+        # Step 2: 建立交易記錄
         transaction = {
             "transaction_id": transaction_id,
             "account_id": account_id,
             "type": transaction_type,
-            "amount": float(amount),
-            "balance_after": float(balance_after),
+            "amount": amount if minor_units else to_minor(amount),
+            "balance_after": balance_after if minor_units else to_minor(balance_after),
             "timestamp": datetime.now().isoformat()
         }
         
@@ -81,154 +94,255 @@ class HistoryModule:
         if related_account:
             transaction["related_account"] = related_account
         
-        # Step 4: 加入列表
-        transactions.append(transaction)
-        
-        # Step 5: 儲存
-        self.data_manager.save_transactions(transactions)
-        self.data_manager.increment_transaction_id()
+        # Step 3: 追加儲存（log 模式只寫一行，不重寫整份歷史）
+        if unit_of_work is not None:
+            unit_of_work.append_transaction(transaction)
+        else:
+            self.data_manager.append_transaction(transaction)
         
         return transaction_id
     
-    def get_history(self, account_id: str, limit: int = 10) -> List[Dict]:
+    @staticmethod
+    def _to_minor(transaction: Dict) -> Dict:
+        """儲存層的交易記錄 → 金額為「分」的整數（舊版檔案的 float 一併換算）"""
+        # DataManager 可能回傳快取物件本身，一律產生新的 dict
+        return dict(transaction, amount=read_minor(transaction["amount"]),
+                    balance_after=read_minor(transaction["balance_after"]))
+    
+    @staticmethod
+    def _to_major(transaction: Dict) -> Dict:
+        """儲存層的交易記錄 → 金額為「元」（對外介面使用）"""
+        return dict(transaction, amount=to_major(read_minor(transaction["amount"])),
+                    balance_after=to_major(read_minor(transaction["balance_after"])))
+    
+    def get_history(self, account_id: str, limit: int = 10,
+                    after: Optional[str] = None) -> List[Dict]:
         """
         查詢帳戶的交易記錄
         
-        [已實作 60% / 留白 40%]
+        [已實作 100%]
         
         輸入：
             account_id (str): 帳號 ID
-            limit (int): 最多返回幾筆（預設 10）
+            limit (int): 最多返回幾筆（預設 10，0 = 全部）
+            after (str, optional): 分頁游標（get_history_page 回傳的 next_cursor），
+                只返回比游標更舊的記錄
         
         輸出：
             list: 交易記錄列表（最新的在前）
         
-        [討論事項]
-        1. 與組員B討論：
-           - 需要支援哪些交易類型的篩選？
-        
-        2. 與團隊討論：
-           - 如果 limit=0，是否返回全部？
-           - 排序方式：最新在前還是最舊在前？
-        
-        [實作提示]
-        - 需要篩選出屬於該帳戶的交易
-        - 需要排序（按時間）
-        - 需要限制返回筆數
-        """
-        # [已提供] 載入所有交易
-        transactions = self.data_manager.load_transactions()
-        
-        # [已提供] 篩選該帳戶的交易
-        account_transactions = [
-            txn for txn in transactions 
-            if txn.get("account_id") == account_id
-        ]
-        
-        # ========== [留白區域 1] 排序 ==========
-        # TODO: 按時間排序（約 1-2 行）
-        #
-        # [需要討論]
-        # 1. 最新的在前還是最舊的在前？
-        #    建議：最新的在前（使用者通常想看最近的交易）
-        #
-        # 2. 如何排序？
-        #    提示：使用 sorted() 函數
-        #    提示：key=lambda x: x['timestamp']
-        #    提示：reverse=True 代表降序（新→舊）
-        #
-        # [參考實作]
-        # account_transactions = sorted(
-        #     account_transactions,
-        #     key=lambda x: x['timestamp'],
-        #     reverse=True
-        # )
-        
-        
-        
-        # ========== [留白區域 2] 限制筆數 ==========
-        # TODO: 只返回前 limit 筆（約 1 行）
-        #
-        # [需要考慮]
-        # 1. 如果 limit=0，要返回全部還是空列表？
-        #    建議：返回全部
-        #
-        # 2. 如何切片？
-        #    提示：使用列表切片 [:limit]
-        #    提示：如果 limit=0，可以特別處理
-        #
-        # [參考實作]
-        # if limit > 0:
-        #     account_transactions = account_transactions[:limit]
-        
-        
-        
-        return account_transactions
+        例外：
+            ValueError: 游標格式錯誤或不屬於此帳戶
+        
+        [設計決策]
+        - 交易依時間順序追加，不需要 sorted()：
+          DataManager 從帳戶索引尾端往回讀，湊滿 limit 筆就停止，
+          查詢最近 10 筆的成本與帳戶歷史長度無關
+        - limit=0 返回全部（CLI「顯示全部」）；大量記錄請改用 get_history_page 分頁
+        """
+        return self.get_history_page(account_id, limit, after)["transactions"]
+    
+    def get_history_page(self, account_id: str, limit: int = 10,
+                         after: Optional[str] = None) -> Dict:
+        """
+        分頁查詢帳戶的交易記錄（最新的在前）
+        
+        [已實作 100%]
+        
+        輸入：
+            account_id (str): 帳號 ID
+            limit (int): 每頁筆數（0 = 剩下的全部）
+            after (str, optional): 上一頁的 next_cursor，None 為第一頁
+        
+        輸出：
+            dict: {"transactions": [...], "next_cursor": str 或 None（沒有下一頁）}
+        
+        例外：
+            ValueError: 游標格式錯誤或不屬於此帳戶
+        
+        [設計決策]
+        - keyset 分頁：游標記錄上一頁最後一筆在帳戶索引中的位置，
+          任何一頁都是從游標直接往回讀 limit 筆，翻到第 k 頁不需要略過前面 k-1 頁
+        - 游標對呼叫端是不透明字串，內容與後端有關，只能原樣傳回
+        
+        使用範例：
+            page = history.get_history_page("ACC0001", limit=50)
+            while page["next_cursor"]:
+                page = history.get_history_page("ACC0001", 50, after=page["next_cursor"])
+        """
+        before = self._decode_cursor(account_id, after) if after is not None else None
+        transactions, next_before = self.data_manager.get_account_page(account_id, limit, before)
+        return {
+            "transactions": [self._to_major(txn) for txn in transactions],
+            "next_cursor": self._encode_cursor(account_id, next_before) if next_before is not None else None
+        }
+    
+    @staticmethod
+    def _encode_cursor(account_id: str, position: int) -> str:
+        """分頁游標：帳號與索引位置編碼為 URL 安全的字串"""
+        raw = json.dumps([account_id, position], separators=(",", ":")).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+    
+    @staticmethod
+    def _decode_cursor(account_id: str, cursor: str) -> int:
+        """解析分頁游標，格式錯誤或屬於其他帳戶時拋出 ValueError"""
+        try:
+            owner, position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        except (ValueError, TypeError, AttributeError, UnicodeError):
+            raise ValueError(f"無效的分頁游標: {cursor!r}") from None
+        if owner != account_id or not isinstance(position, int) or isinstance(position, bool):
+            raise ValueError(f"無效的分頁游標: {cursor!r}")
+        return position
     
     def get_history_by_type(self, account_id: str, transaction_type: str, 
                            limit: int = 10) -> List[Dict]:
         """
         查詢特定類型的交易記錄
         
-        [留白 100%] 請自行實作
+        [已實作 100%]
         
         輸入：
             account_id (str): 帳號 ID
             transaction_type (str): 交易類型 (DEPOSIT, WITHDRAW, TRANSFER_OUT, TRANSFER_IN)
-            limit (int): 最多返回幾筆
+            limit (int): 最多返回幾筆（0 = 全部）
+        
+        輸出：
+            list: 符合條件的交易記錄（最新的在前）
+        
+        例外：
+            ValueError: 交易類型不在 TRANSACTION_TYPES 中
+        
+        [設計決策]
+        - DataManager 維護 (帳號, 類型) 複合索引，隨每次追加交易更新；
+          查詢只讀取符合的記錄，不逐筆比對帳號與類型
+        - 與 get_history 相同由新往舊讀取，湊滿 limit 筆就停止
+        - 不合法的類型在查詢前直接拋出 ValueError，不做任何讀取
+        """
+        if transaction_type not in TRANSACTION_TYPES:
+            raise ValueError(f"不支援的交易類型: {transaction_type}")
+        account_transactions = self.data_manager.get_account_transactions(
+            account_id, transaction_type, limit=limit, newest_first=True
+        )
+        return [self._to_major(txn) for txn in account_transactions]
+    
+    def get_transaction(self, transaction_id: str) -> Optional[Dict]:
+        """
+        依交易 ID 查詢單筆交易
+        
+        [已實作 100%]
+        
+        輸入：
+            transaction_id (str): 交易 ID (例如: "TXN0001")
+        
+        輸出：
+            dict: 交易記錄，或 None (如果交易不存在)
+        
+        [設計決策]
+        - log 模式下以交易 ID 的數字部分查固定寬度的位置表（mmap），
+          一次定位就能讀到該筆記錄，不需掃描整個歷史
+        
+        使用範例：
+            txn = history.get_transaction("TXN0001")
+            if txn:
+                print(f"金額: {txn['amount']}")
+        """
+        transaction = self.data_manager.get_transaction(transaction_id)
+        return self._to_major(transaction) if transaction is not None else None
+    
+    def iter_transactions(self, filter: Optional[Callable[[Dict], bool]] = None,
+                          start: Optional[Union[str, datetime]] = None,
+                          end: Optional[Union[str, datetime]] = None,
+                          minor_units: bool = False) -> Iterator[Dict]:
+        """
+        逐筆走訪全部交易記錄（依寫入順序）
+        
+        [已實作 100%]
+        
+        輸入：
+            filter (callable, optional): 篩選函數，回傳 True 的交易才會產生
+            start (str/datetime, optional): 只取 timestamp >= start 的交易
+            end (str/datetime, optional): 只取 timestamp < end 的交易
+            minor_units (bool): True 時金額為「分」的整數，
+                大量加總、對帳請使用（整數相加沒有誤差）
+        
+        輸出：
+            generator: 逐筆產生交易記錄
+        
+        [設計決策]
+        - 交易由 DataManager 從磁碟逐筆讀出，記憶體用量固定，
+          適合每晚的全量批次工作
+        - timestamp 為 ISO 格式字串，可直接以字串比較大小
+        - filter 收到的交易與產生的交易使用相同單位
+        
+        使用範例：
+            for txn in history.iter_transactions(
+                    filter=lambda t: t["type"] == "WITHDRAW",
+                    start="2025-10-01", end="2025-11-01"):
+                total += txn["amount"]
+        """
+        if isinstance(start, datetime):
+            start = start.isoformat()
+        if isinstance(end, datetime):
+            end = end.isoformat()
+        
+        for txn in self.data_manager.iter_transactions():
+            timestamp = txn.get("timestamp", "")
+            if start is not None and timestamp < start:
+                continue
+            if end is not None and timestamp >= end:
+                continue
+            txn = self._to_minor(txn) if minor_units else self._to_major(txn)
+            if filter is not None and not filter(txn):
+                continue
+            yield txn
+    
+    def get_history_range(self, account_id: Optional[str] = None,
+                          start: Optional[Union[str, datetime]] = None,
+                          end: Optional[Union[str, datetime]] = None,
+                          minor_units: bool = False) -> Iterator[Dict]:
+        """
+        查詢時間區間內的交易記錄（月結對帳單、主管機關報表）
+        
+        [已實作 100%]
+        
+        輸入：
+            account_id (str, optional): 帳號 ID，None 表示全部帳戶
+            start (str/datetime, optional): 只取 timestamp >= start 的交易
+            end (str/datetime, optional): 只取 timestamp < end 的交易
+            minor_units (bool): True 時金額為「分」的整數
         
         輸出：
-            list: 符合條件的交易記錄
-        
-        [討論事項]
-        1. 與組員B討論：
-           - 有哪些交易類型？需要定義常數嗎？
-           - 例如：TRANSACTION_TYPES = ["DEPOSIT", "WITHDRAW", ...]
-        
-        2. 與團隊討論：
-           - 如果 transaction_type 不合法，要拋例外還是返回空列表？
-        
-        [實作提示]
-        這個函數可以重用 get_history() 的邏輯：
-        
-        方法1（簡單但效能較差）：
-            # 先取得所有交易
-            all_history = self.get_history(account_id, limit=0)
-            # 再篩選類型
-            filtered = [txn for txn in all_history if txn['type'] == transaction_type]
-            # 限制筆數
-            return filtered[:limit]
-        
-        方法2（推薦，效能較好）：
-            # 載入所有交易
-            transactions = self.data_manager.load_transactions()
-            # 一次篩選帳號和類型
-            filtered = [
-                txn for txn in transactions
-                if txn['account_id'] == account_id and txn['type'] == transaction_type
-            ]
-            # 排序
-            # 限制筆數
-            # 返回
-        
-        預計 10-15 行
-        """
-        pass  # TODO: 請實作
+            generator: 逐筆產生區間內的交易記錄（舊→新）
+        
+        [設計決策]
+        - 與 iter_transactions(start=, end=) 結果相同，但不從頭掃描：
+          交易依時間順序追加，DataManager 以二分搜尋（bisect）找出區間起點，
+          只讀取區間內的記錄，超過 end 即停止
+        - 以 generator 串流回傳，大區間也不需要一次放進記憶體
+        
+        使用範例：
+            for txn in history.get_history_range("ACC0001", "2025-10-01", "2025-11-01"):
+                print(txn["timestamp"], txn["amount"])
+        """
+        if isinstance(start, datetime):
+            start = start.isoformat()
+        if isinstance(end, datetime):
+            end = end.isoformat()
+        
+        convert = self._to_minor if minor_units else self._to_major
+        for txn in self.data_manager.iter_transactions_range(start, end, account_id):
+            yield convert(txn)
     
     def get_all_transactions(self) -> List[Dict]:
         """
         取得所有交易記錄（管理員功能）
         
-        [留白 100%] 選擇性實作
+        [已實作 100%]
         
         輸出：
             list: 所有交易記錄
         
-        [實作提示]
-        這是最簡單的函數，只需要：
-        1. 載入 transactions
-        2. 回傳
-        
-        預計 2 行
+        [注意]
+        會把全部交易放進一個 list；資料量大時請改用 iter_transactions()
         """
-        pass  # TODO: 選擇性實作
\ No newline at end of file
+        return list(self.iter_transactions())
@@ -0,0 +1,317 @@
+"""
+Idempotency Module
+冪等鍵儲存 - 用戶端重送同一個請求時回傳第一次的結果，不重複入帳
+
+[完整實作 100%] 由整合者提供，組員直接使用
+
+[設計決策]
+- 記憶體中以 OrderedDict 保存「鍵 → 結果」：查詢、新增、更新使用順序皆為 O(1)，
+  超過 max_entries 時淘汰最久未使用的鍵（LRU），記憶體用量固定
+- 每個鍵有存活時間（TTL），過期後視為不存在
+- 持久化為只追加的 JSONL 檔（每個鍵一行），重啟時重播；
+  檔案行數超過上限的兩倍時，以目前保留的鍵重寫（壓縮），檔案大小同樣有上限
+- 其他程序追加的鍵：查不到時補讀檔案新增的部分；檔案被壓縮（inode 改變）時整份重讀
+- 每個鍵記錄請求內容的指紋（request_fingerprint），同一個鍵帶著不同參數重送時拒絕，
+  不會把別的請求的結果當成這次的結果回傳；沒有指紋的舊記錄一律接受
+- 交易模組的鍵與資料在同一個工作單元寫入（UnitOfWork.remember → committed），
+  不會出現「資料已寫入、鍵沒寫入」而重複入帳的狀態；put() 供獨立使用
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from modules.file_lock import FileLock
+
+
+IDEMPOTENCY_FILE_NAME = "idempotency.jsonl"
+DEFAULT_MAX_ENTRIES = 100_000
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def request_fingerprint(*parts) -> str:
+    """請求內容（操作名稱與參數）的指紋：sha256 十六進位字串"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def encode_records(records: List[Dict]) -> bytes:
+    """持久化記錄（record() 的回傳值）→ JSONL 內容"""
+    return "".join(
+        json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        for record in records
+    ).encode("utf-8")
+
+
+class IdempotencyStore:
+    """
+    有上限的冪等鍵結果快取（LRU + TTL，持久化）
+
+    使用範例：
+        store = IdempotencyStore("data/idempotency.jsonl")
+        fingerprint = request_fingerprint("deposit", "ACC0001", 10000)
+        if store.get("req-123", fingerprint) is None:
+            result = ...  # 實際處理
+            store.put("req-123", result, fingerprint)
+    """
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl: float = DEFAULT_TTL, locks: Optional[FileLock] = None,
+                 lock_region: int = 0):
+        """
+        參數：
+            path (str): JSONL 檔案路徑
+            max_entries (int): 記憶體與檔案中保留的鍵數上限
+            ttl (float): 鍵的存活秒數
+            locks (FileLock, optional): 跨程序鎖（與 DataManager 共用鎖檔）
+            lock_region (int): 使用的鎖區域
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._locks = locks
+        self._region = lock_region
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._offset = 0
+        self._inode = None
+        self._lines = 0
+        # batch() 區塊內：put() 待寫入的記錄，以及 committed() 已由工作單元寫入的記錄
+        self._buffer: Optional[List[Dict]] = None
+        self._adopted: List[Dict] = []
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._entries)
+
+    # ==================== 跨程序鎖 ====================
+
+    @contextmanager
+    def _file_locked(self, exclusive: bool):
+        """持有檔案的跨程序鎖（未設定 locks 時略過）"""
+        if self._locks is None:
+            yield
+            return
+        self._locks.acquire(self._region, exclusive)
+        try:
+            yield
+        finally:
+            self._locks.release(self._region, exclusive)
+
+    # ==================== 讀取檔案 ====================
+
+    def _ensure_loaded(self):
+        """第一次使用時載入檔案（呼叫端需持有 _lock）"""
+        if not self._loaded:
+            with self._file_locked(exclusive=False):
+                self._sync()
+            self._loaded = True
+
+    def _sync(self):
+        """讀入檔案新增的部分；檔案被其他程序壓縮時整份重讀（呼叫端需持有 _lock）"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            self._entries.clear()
+            self._offset = 0
+            self._lines = 0
+            self._inode = st.st_ino
+        if st.st_size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(st.st_size - self._offset)
+        end = data.rfind(b"\n") + 1
+        now = time.time()
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self._lines += 1
+            if record["expires_at"] > now:
+                self._remember(record)
+        self._offset += end
+
+    def _remember(self, record: Dict):
+        """放入記憶體並淘汰超出上限的最舊鍵（呼叫端需持有 _lock）"""
+        key = record["key"]
+        self._entries[key] = (record["result"], record["expires_at"], record.get("fingerprint"))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # ==================== 查詢與新增 ====================
+
+    def get(self, key: str, fingerprint: Optional[str] = None) -> Optional[Dict]:
+        """
+        查詢鍵的結果（O(1)），不存在或已過期時回傳 None
+
+        本程序查不到時會補讀其他程序新增的鍵
+
+        例外：
+            ValueError: 鍵已用於指紋不同的請求（兩邊都有指紋時才比對）
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(key)
+            if entry is None:
+                with self._file_locked(exclusive=False):
+                    self._sync()
+                entry = self._entries.get(key)
+                if entry is None:
+                    return None
+            result, expires_at, stored = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            if fingerprint is not None and stored is not None and stored != fingerprint:
+                raise ValueError(f"冪等鍵已用於不同的請求: {key}")
+            self._entries.move_to_end(key)
+            return dict(result)
+
+    def record(self, key: str, result: Dict, fingerprint: Optional[str] = None) -> Dict:
+        """建立鍵的持久化記錄（尚未寫入；由 put() 或工作單元寫入）"""
+        record = {"key": key, "result": dict(result), "expires_at": time.time() + self.ttl}
+        if fingerprint is not None:
+            record["fingerprint"] = fingerprint
+        return record
+
+    def put(self, key: str, result: Dict, fingerprint: Optional[str] = None):
+        """
+        記錄鍵的結果
+
+        一般情況下立即寫入並 fsync；batch() 區塊內則等區塊結束時一起寫入
+        """
+        with self._lock:
+            self._ensure_loaded()
+            record = self.record(key, result, fingerprint)
+            self._remember(record)
+            if self._buffer is not None:
+                self._buffer.append(record)
+            else:
+                self._append([record])
+
+    def committed(self, records: List[Dict]):
+        """
+        登記已由工作單元與資料一起寫入的記錄（UnitOfWork.commit 呼叫）
+
+        檔案不再寫一次，只補讀新增的部分並視需要壓縮；
+        batch() 區塊內等區塊結束時才補讀，區塊內發生例外時捨棄
+        """
+        with self._lock:
+            self._ensure_loaded()
+            for record in records:
+                self._remember(record)
+            if self._buffer is not None:
+                self._adopted.extend(records)
+                return
+            with self._file_locked(exclusive=True):
+                self._sync()
+                self._settle(records)
+
+    @contextmanager
+    def batch(self):
+        """
+        批次模式：區塊內新增的鍵在區塊結束時一次寫入、一次 fsync；
+        區塊內發生例外時捨棄這些鍵（對應的操作也已回滾）
+        """
+        with self._lock:
+            if self._buffer is not None:
+                # 巢狀批次併入外層
+                yield self
+                return
+            self._buffer = []
+            try:
+                yield self
+            except BaseException:
+                for record in self._buffer + self._adopted:
+                    self._entries.pop(record["key"], None)
+                raise
+            else:
+                if self._buffer or self._adopted:
+                    with self._file_locked(exclusive=True):
+                        self._sync()
+                        if self._buffer:
+                            self._write(self._buffer)
+                        self._settle(self._buffer + self._adopted)
+            finally:
+                self._buffer = None
+                self._adopted = []
+
+    # ==================== 寫入檔案 ====================
+
+    def _append(self, records: List[Dict]):
+        """追加記錄，行數過多時壓縮（呼叫端需持有 _lock）"""
+        with self._file_locked(exclusive=True):
+            # 先補讀其他程序的新增，讓 offset 與檔案尾端一致
+            self._sync()
+            self._write(records)
+            self._settle(records)
+
+    def _write(self, records: List[Dict]):
+        """寫入記錄並 fsync（呼叫端需持有 _lock 與跨程序獨佔鎖，且已 _sync）"""
+        data = encode_records(records)
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if self._inode is None:
+            self._inode = os.stat(self.path).st_ino
+        self._offset += len(data)
+        self._lines += len(records)
+
+    def _settle(self, records: List[Dict]):
+        """寫入後確認鍵在記憶體中，行數過多時壓縮（呼叫端需持有 _lock 與跨程序獨佔鎖）"""
+        # _sync 可能因其他程序壓縮而重讀，確保本次的鍵仍在記憶體中
+        for record in records:
+            if record["key"] not in self._entries:
+                self._remember(record)
+        if self._lines > 2 * self.max_entries:
+            self._compact()
+
+    def _compact(self):
+        """以目前保留且未過期的鍵重寫檔案（呼叫端需持有 _lock 與跨程序獨佔鎖）"""
+        live = self._live_records()
+        data = encode_records(live)
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + ".",
+                                        suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._entries = OrderedDict((record["key"], self._entries[record["key"]]) for record in live)
+        self._inode = os.stat(self.path).st_ino
+        self._offset = len(data)
+        self._lines = len(live)
+
+    def _live_records(self) -> List[Dict]:
+        """目前保留且未過期的鍵（由舊到新）"""
+        now = time.time()
+        live = []
+        for key, (result, expires_at, fingerprint) in self._entries.items():
+            if expires_at > now:
+                record = {"key": key, "result": result, "expires_at": expires_at}
+                if fingerprint is not None:
+                    record["fingerprint"] = fingerprint
+                live.append(record)
+        return live
@@ -0,0 +1,85 @@
+"""
+Money Module
+金額換算 - 餘額與交易金額一律以「最小單位」（分）的整數保存與計算
+
+[完整實作 100%] 由整合者提供，組員直接使用
+
+[設計決策]
+- 整數加減沒有誤差：一長串存提款後的餘額與逐筆加總完全相等，
+  對帳可以直接用 == 比較，不需要容許誤差；大量加總也比 Decimal 快
+- 對外介面（create_account、deposit、get_history 等）仍以「元」為單位：
+  傳入時轉成分（to_minor），回傳時轉回元（to_major）；
+  to_major 由整數換算，結果就是最接近該金額的 float，不會累積誤差
+- 舊版資料檔的金額以 float(...) 寫入（元），新版一律寫入 int（分），
+  讀取時以型別區分（read_minor），舊檔不需轉換即可使用
+"""
+
+import math
+from decimal import Decimal, InvalidOperation
+from typing import Union
+
+
+# 1 元 = 100 分
+MINOR_PER_MAJOR = 100
+
+Amount = Union[int, float, Decimal]
+
+
+def to_minor(amount: Amount) -> int:
+    """
+    元 → 分
+
+    輸入：
+        amount (int/float/Decimal): 以元為單位的金額
+
+    輸出：
+        int: 以分為單位的金額
+
+    例外：
+        ValueError: 不是數字、NaN / 無限大，或小數超過兩位
+
+    使用範例：
+        to_minor(1500.5)  # 150050
+        to_minor(0.1 + 0.2)  # 30
+    """
+    if isinstance(amount, bool) or not isinstance(amount, (int, float, Decimal)):
+        raise ValueError(f"金額格式錯誤: {amount!r}")
+    if isinstance(amount, int):
+        return amount * MINOR_PER_MAJOR
+    if isinstance(amount, Decimal):
+        try:
+            scaled = amount * MINOR_PER_MAJOR
+            minor = int(scaled.to_integral_value())
+        except (InvalidOperation, ValueError, OverflowError):
+            raise ValueError(f"金額格式錯誤: {amount!r}") from None
+        if scaled != minor:
+            raise ValueError(f"金額最多到小數第 2 位: {amount}")
+        return minor
+    if not math.isfinite(amount):
+        raise ValueError(f"金額格式錯誤: {amount!r}")
+    # float 的 0.1 + 0.2 等誤差遠小於 1 分，四捨五入到最近的分
+    scaled = amount * MINOR_PER_MAJOR
+    minor = round(scaled)
+    if not math.isclose(scaled, minor, rel_tol=1e-9, abs_tol=1e-6):
+        raise ValueError(f"金額最多到小數第 2 位: {amount}")
+    return minor
+
+
+def to_major(minor: int) -> float:
+    """
+    分 → 元
+
+    int / int 為正確捨入的除法，to_major(30) == 0.3
+    """
+    return minor / MINOR_PER_MAJOR
+
+
+def read_minor(value: Union[int, float]) -> int:
+    """
+    讀取儲存層的金額（分）
+
+    舊版資料檔的 float 代表「元」，換算成分；int 已經是分，原樣回傳
+    """
+    if isinstance(value, float):
+        return round(value * MINOR_PER_MAJOR)
+    return value
@@ -0,0 +1,129 @@
+"""
+Serialization Module
+序列化格式 - DataManager 資料檔案的編碼 / 解碼
+
+[完整實作 100%] 由整合者提供，組員直接使用
+
+支援格式：
+- json          : 縮排 JSON（預設，與舊資料完全相同）
+- json-compact  : 無縮排、無多餘空白的 JSON
+- orjson        : 使用 orjson 套件（有安裝時才可用）
+- msgpack       : MessagePack 二進位格式（有安裝時才可用）
+- marshal       : Python 內建二進位格式
+
+[設計決策]
+- JSON 類格式本身就能辨識（內容以 { 或 [ 開頭），不加檔頭，
+  外部工具仍能直接讀取
+- 二進位格式在檔案開頭寫入一行檔頭 b"SBS1 <格式名稱>\\n"，
+  讀取時依檔頭自動選擇解碼器，因此同一目錄可混用不同格式
+"""
+
+import json
+import marshal
+from typing import Any, Dict, List
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 依環境而定
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 依環境而定
+    msgpack = None
+
+
+HEADER_MAGIC = b"SBS1 "
+DEFAULT_CODEC = "json"
+
+
+class Codec:
+    """單一序列化格式"""
+
+    def __init__(self, name: str, dumps, loads, binary: bool):
+        self.name = name
+        self._dumps = dumps
+        self._loads = loads
+        self.binary = binary
+        self.header = HEADER_MAGIC + name.encode("ascii") + b"\n" if binary else b""
+
+    def encode(self, data: Any) -> bytes:
+        """資料 → 檔案內容（含檔頭）"""
+        return self.header + self._dumps(data)
+
+    def decode_payload(self, payload: bytes) -> Any:
+        """檔頭之後的內容 → 資料"""
+        return self._loads(payload)
+
+
+def _json_pretty(data: Any) -> bytes:
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def _json_compact(data: Any) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_loads(payload: bytes) -> Any:
+    return json.loads(payload.decode("utf-8"))
+
+
+CODECS: Dict[str, Codec] = {
+    "json": Codec("json", _json_pretty, _json_loads, binary=False),
+    "json-compact": Codec("json-compact", _json_compact, _json_loads, binary=False),
+    "marshal": Codec("marshal", marshal.dumps, marshal.loads, binary=True),
+}
+
+if orjson is not None:
+    CODECS["orjson"] = Codec("orjson", orjson.dumps, orjson.loads, binary=False)
+
+if msgpack is not None:
+    CODECS["msgpack"] = Codec(
+        "msgpack",
+        lambda data: msgpack.packb(data, use_bin_type=True),
+        lambda payload: msgpack.unpackb(payload, raw=False, strict_map_key=False),
+        binary=True,
+    )
+
+
+def available_codecs() -> List[str]:
+    """目前環境可用的格式名稱"""
+    return list(CODECS)
+
+
+def get_codec(name: str) -> Codec:
+    """
+    取得格式
+
+    例外：
+        ValueError: 格式不存在或未安裝對應套件
+    """
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ValueError(f"不支援的資料格式: {name}（可用: {', '.join(CODECS)}）")
+    return codec
+
+
+def decode(raw: bytes) -> Any:
+    """
+    依檔頭自動解碼檔案內容
+
+    例外：
+        ValueError: 格式錯誤或檔頭指定的格式無法使用
+    """
+    if raw.startswith(HEADER_MAGIC):
+        end = raw.find(b"\n")
+        if end == -1:
+            raise ValueError("檔頭格式錯誤")
+        codec = get_codec(raw[len(HEADER_MAGIC):end].decode("ascii"))
+        payload = raw[end + 1:]
+    else:
+        # 沒有檔頭的一律是 JSON（舊檔案、json、json-compact、orjson）
+        codec = CODECS["orjson"] if "orjson" in CODECS else CODECS["json"]
+        payload = raw
+    try:
+        return codec.decode_payload(payload)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"{codec.name} 解碼失敗: {e}")
@@ -0,0 +1,659 @@
+"""
+SQLite Backend
+SQLite 儲存後端 - 與 DataManager 相同介面，資料存放在 data/bank.db
+
+[完整實作 100%] 由整合者提供，組員直接使用
+
+使用方式：
+    dm = DataManager("data", backend="sqlite")
+    # 或在 config.json 設定 "backend": "sqlite"
+
+[設計決策]
+- 帳戶、交易、設定各一張表
+- 交易表在 account_id、type、timestamp 上建立索引
+- get_account / update_balance 只讀寫單一列
+- 交易查詢走索引，不必載入全部歷史
+- 金額欄位為 INTEGER（分）；舊版以 REAL（元）建立的資料庫在開啟時轉換一次
+- 帳戶的 version 欄位支援 compare-and-swap 更新（UPDATE ... WHERE version = ?）
+- 冪等鍵存在 idempotency 表，工作單元的鍵與餘額、交易在同一個資料庫交易寫入
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from modules.data_manager import (DataManager, BACKEND_JSON, BACKEND_SQLITE, FILE_REGION_BASE,
+                                  LOCK_FILE_NAME, SQLITE_FILE_NAME, ConcurrentUpdateError,
+                                  StalePositionError)
+from modules.file_lock import FileLock
+from modules.idempotency import IdempotencyStore
+from modules.money import read_minor
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    account_id   TEXT PRIMARY KEY,
+    name         TEXT NOT NULL,
+    balance      INTEGER NOT NULL,
+    created_date TEXT,
+    version      INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    seq             INTEGER PRIMARY KEY AUTOINCREMENT,
+    transaction_id  TEXT NOT NULL UNIQUE,
+    account_id      TEXT NOT NULL,
+    type            TEXT NOT NULL,
+    amount          INTEGER NOT NULL,
+    balance_after   INTEGER NOT NULL,
+    related_account TEXT,
+    timestamp       TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_account ON transactions (account_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_type ON transactions (type);
+CREATE INDEX IF NOT EXISTS idx_transactions_timestamp ON transactions (timestamp);
+CREATE INDEX IF NOT EXISTS idx_transactions_account_type ON transactions (account_id, type);
+CREATE INDEX IF NOT EXISTS idx_transactions_account_timestamp ON transactions (account_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS config (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS idempotency (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    key        TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    record     TEXT NOT NULL
+);
+"""
+
+# 舊版資料庫（金額為 REAL，單位為元）→ INTEGER（分）
+# SQLite 無法修改欄位型別：改名舊表、以 SCHEMA 建立新表、換算後複製、刪除舊表
+MIGRATE_LEGACY_MONEY = """
+BEGIN IMMEDIATE;
+ALTER TABLE accounts RENAME TO legacy_accounts;
+ALTER TABLE transactions RENAME TO legacy_transactions;
+DROP INDEX IF EXISTS idx_transactions_account;
+DROP INDEX IF EXISTS idx_transactions_type;
+DROP INDEX IF EXISTS idx_transactions_timestamp;
+DROP INDEX IF EXISTS idx_transactions_account_type;
+DROP INDEX IF EXISTS idx_transactions_account_timestamp;
+""" + SCHEMA + """
+INSERT INTO accounts (account_id, name, balance, created_date)
+    SELECT account_id, name, CAST(ROUND(balance * 100) AS INTEGER), created_date
+    FROM legacy_accounts;
+INSERT INTO transactions (seq, transaction_id, account_id, type, amount, balance_after,
+                          related_account, timestamp)
+    SELECT seq, transaction_id, account_id, type, CAST(ROUND(amount * 100) AS INTEGER),
+           CAST(ROUND(balance_after * 100) AS INTEGER), related_account, timestamp
+    FROM legacy_transactions;
+DROP TABLE legacy_accounts;
+DROP TABLE legacy_transactions;
+COMMIT;
+"""
+
+TRANSACTION_COLUMNS = ("transaction_id", "account_id", "type", "amount",
+                       "balance_after", "related_account", "timestamp")
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """
+    以 idempotency 表持久化的冪等鍵儲存（由 SQLiteDataManager.idempotency_store() 建立）
+
+    記憶體中的 LRU / TTL 與 IdempotencyStore 相同；
+    檔案的「已讀取位置」改為最後讀到的 seq，壓縮改為刪除過期與超出上限的列，
+    跨程序的鎖定交給 SQLite
+    """
+
+    def __init__(self, data_manager: "SQLiteDataManager", **kwargs):
+        super().__init__(data_manager.db_file, **kwargs)
+        self.data_manager = data_manager
+
+    def _sync(self):
+        """讀入 seq 大於已讀取位置的列（呼叫端需持有 _lock）"""
+        rows = self.data_manager._query(
+            "SELECT seq, record FROM idempotency WHERE seq > ? ORDER BY seq", (self._offset,))
+        now = time.time()
+        for row in rows:
+            record = json.loads(row["record"])
+            self._lines += 1
+            if record["expires_at"] > now:
+                self._remember(record)
+        if rows:
+            self._offset = rows[-1]["seq"]
+
+    def _write(self, records: List[Dict]):
+        """以單一資料庫交易新增記錄（呼叫端需持有 _lock）"""
+        with self.data_manager._write():
+            self.data_manager._insert_idempotency(records)
+        self._sync()
+
+    def _compact(self):
+        """以目前保留且未過期的鍵取代已讀取的所有列（呼叫端需持有 _lock）"""
+        live = self._live_records()
+        with self.data_manager._write():
+            self.data_manager.conn.execute("DELETE FROM idempotency WHERE seq <= ?", (self._offset,))
+            self.data_manager._insert_idempotency(live)
+        self._entries = OrderedDict((record["key"], self._entries[record["key"]]) for record in live)
+        self._lines = 0
+        self._sync()
+
+
+class SQLiteDataManager(DataManager):
+    """SQLite 資料管理器"""
+
+    def __init__(self, data_dir: str = "data", *args,
+                 backend: Optional[str] = None, **kwargs):
+        """
+        初始化 SQLite 資料庫
+
+        JSON 後端專用的參數（transaction_storage 等）在此忽略
+        """
+        self.backend = BACKEND_SQLITE
+        self.data_dir = data_dir
+        self.db_file = os.path.join(data_dir, SQLITE_FILE_NAME)
+
+        os.makedirs(data_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # 所有執行緒共用一個連線：寫入與批次持有 _lock，
+        # 批次期間其他執行緒的讀寫等待批次 commit / rollback
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        # 資料本身由 SQLite 處理跨程序鎖定；此鎖檔供 TransactionModule 的帳戶鎖使用
+        self.locks = FileLock(os.path.join(data_dir, LOCK_FILE_NAME))
+        with self.locks.exclusive(FILE_REGION_BASE):
+            self.conn.executescript(SCHEMA)
+            self._migrate_legacy_money()
+            self._migrate_account_version()
+        self._init_config()
+
+    def _init_config(self):
+        """初始化設定值"""
+        defaults = {
+            "next_account_id": 1,
+            "next_transaction_id": 1,
+            "created_at": datetime.now().isoformat()
+        }
+        with self.conn:
+            for key, value in defaults.items():
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO config (key, value) VALUES (?, ?)",
+                    (key, json.dumps(value))
+                )
+
+    def _migrate_legacy_money(self):
+        """
+        舊版金額欄位（REAL，元）轉為 INTEGER（分）
+
+        REAL 欄位會把寫入的整數轉成浮點數，讀取時無法與舊資料區分，
+        因此不能沿用；呼叫端持有初始化鎖，多個程序不會重複轉換
+        """
+        columns = {row["name"]: row["type"] for row in self.conn.execute("PRAGMA table_info(accounts)")}
+        if columns.get("balance", "").upper() != "REAL":
+            return
+        try:
+            self.conn.executescript(MIGRATE_LEGACY_MONEY)
+        except sqlite3.Error:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            raise
+
+    def _migrate_account_version(self):
+        """舊版資料庫的帳戶表加上 version 欄位（既有帳戶為 0）"""
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(accounts)")}
+        if "version" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE accounts ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def close(self):
+        """關閉資料庫連線"""
+        self.conn.close()
+        self.locks.close()
+
+    @contextmanager
+    def _write(self):
+        """寫入區塊：批次中不個別 commit，由最外層批次一次 commit"""
+        with self._lock:
+            if self._batch_depth > 0:
+                yield
+            else:
+                with self.conn:
+                    yield
+
+    def _query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        """執行查詢並取回所有結果"""
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    @contextmanager
+    def batch(self):
+        """批次模式：區塊內的寫入合併為單一 SQLite 交易（期間獨佔連線）"""
+        with self._lock:
+            if self._batch_depth == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.conn.rollback()
+                raise
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.conn.commit()
+
+    def _commit_unit_of_work(self, uow) -> None:
+        """
+        套用工作單元：單一 SQLite 交易，先確認所有帳戶的版本再寫入，
+        冪等鍵與餘額、交易一起 commit
+
+        例外：
+            ConcurrentUpdateError: 帳戶版本已改變（rollback，沒有寫入任何內容）
+            OSError: 寫入失敗
+        """
+        with self.batch():
+            for account_id in uow.balances:
+                expected = uow.expected_versions.get(account_id)
+                if expected is not None and not self.check_version(account_id, expected):
+                    raise ConcurrentUpdateError(f"帳戶已被修改: {account_id}")
+            for account_id, balance in uow.balances.items():
+                if not self.update_balance(account_id, balance, uow.expected_versions.get(account_id)):
+                    raise OSError(f"更新餘額失敗: {account_id}")
+            if not self.append_transactions(uow.transactions):
+                raise OSError("寫入交易記錄失敗")
+            self._insert_idempotency([record for _, record in uow.remembered])
+
+    def flush(self) -> bool:
+        """SQLite 每次 commit 即落盤"""
+        return True
+
+    def checkpoint(self) -> bool:
+        """將 SQLite 的 WAL 寫回資料庫檔並截斷"""
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return True
+
+    # ==================== 資料轉換 ====================
+
+    @staticmethod
+    def _row_to_account(row: sqlite3.Row) -> Dict:
+        """資料列 → 帳戶 dict"""
+        return {
+            "name": row["name"],
+            "balance": row["balance"],
+            "created_date": row["created_date"],
+            "version": row["version"]
+        }
+
+    @staticmethod
+    def _row_to_transaction(row: sqlite3.Row) -> Dict:
+        """資料列 → 交易 dict（格式與 transactions.json 相同）"""
+        transaction = {
+            "transaction_id": row["transaction_id"],
+            "account_id": row["account_id"],
+            "type": row["type"],
+            "amount": row["amount"],
+            "balance_after": row["balance_after"],
+            "timestamp": row["timestamp"]
+        }
+        if row["related_account"]:
+            transaction["related_account"] = row["related_account"]
+        return transaction
+
+    @staticmethod
+    def _transaction_params(transaction: Dict) -> tuple:
+        """交易 dict → INSERT 參數"""
+        return tuple(transaction.get(column) for column in TRANSACTION_COLUMNS)
+
+    def _insert_transactions(self, transactions) -> None:
+        """批次寫入交易（呼叫端負責 commit）"""
+        self.conn.executemany(
+            f"INSERT INTO transactions ({', '.join(TRANSACTION_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(TRANSACTION_COLUMNS))})",
+            (self._transaction_params(txn) for txn in transactions)
+        )
+
+    def _insert_idempotency(self, records: List[Dict]) -> None:
+        """新增冪等鍵記錄（呼叫端負責 commit）"""
+        self.conn.executemany(
+            "INSERT INTO idempotency (key, expires_at, record) VALUES (?, ?, ?)",
+            [(record["key"], record["expires_at"], json.dumps(record, ensure_ascii=False))
+             for record in records]
+        )
+
+    def idempotency_store(self, **kwargs) -> SQLiteIdempotencyStore:
+        """建立存放在 idempotency 表的冪等鍵儲存（參數同 DataManager.idempotency_store）"""
+        return SQLiteIdempotencyStore(self, **kwargs)
+
+    # ==================== 帳戶操作 ====================
+
+    def load_accounts(self) -> Dict[str, Dict]:
+        """載入所有帳戶資料"""
+        rows = self._query("SELECT * FROM accounts ORDER BY account_id")
+        return {row["account_id"]: self._row_to_account(row) for row in rows}
+
+    def save_accounts(self, accounts: Dict) -> bool:
+        """儲存帳戶資料（整表覆寫）"""
+        try:
+            with self._write():
+                self.conn.execute("DELETE FROM accounts")
+                self.conn.executemany(
+                    "INSERT INTO accounts (account_id, name, balance, created_date, version) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    ((account_id, info["name"], info["balance"], info.get("created_date"),
+                      info.get("version", 0))
+                     for account_id, info in accounts.items())
+                )
+            return True
+        except sqlite3.Error as e:
+            print(f"[Error] 儲存失敗: {e}")
+            return False
+
+    def get_account(self, account_id: str) -> Optional[Dict]:
+        """查詢單一帳戶"""
+        rows = self._query("SELECT * FROM accounts WHERE account_id = ?", (account_id,))
+        return self._row_to_account(rows[0]) if rows else None
+
+    def add_account(self, account_id: str, account: Dict) -> bool:
+        """新增單一帳戶"""
+        try:
+            with self._write():
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO accounts (account_id, name, balance, created_date, version) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (account_id, account["name"], account["balance"], account.get("created_date"),
+                     account.get("version", 0))
+                )
+            return True
+        except sqlite3.Error as e:
+            print(f"[Error] 儲存失敗: {e}")
+            return False
+
+    def update_balance(self, account_id: str, balance: int,
+                       expected_version: Optional[int] = None) -> bool:
+        """更新單一帳戶餘額並將版本號 +1（給定 expected_version 時為 compare-and-swap）"""
+        sql = "UPDATE accounts SET balance = ?, version = version + 1 WHERE account_id = ?"
+        params = (balance, account_id)
+        if expected_version is not None:
+            sql += " AND version = ?"
+            params += (expected_version,)
+        try:
+            with self._write():
+                cursor = self.conn.execute(sql, params)
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            print(f"[Error] 儲存失敗: {e}")
+            return False
+
+    def check_version(self, account_id: str, expected_version: int) -> bool:
+        """帳戶目前的版本號是否等於 expected_version"""
+        rows = self._query("SELECT version FROM accounts WHERE account_id = ?", (account_id,))
+        return bool(rows) and rows[0]["version"] == expected_version
+
+    def delete_account(self, account_id: str) -> bool:
+        """刪除單一帳戶"""
+        with self._write():
+            cursor = self.conn.execute("DELETE FROM accounts WHERE account_id = ?", (account_id,))
+        return cursor.rowcount == 1
+
+    # ==================== 交易記錄操作 ====================
+
+    def load_transactions(self) -> List[Dict]:
+        """載入所有交易記錄"""
+        return list(self.iter_transactions())
+
+    def save_transactions(self, transactions: List) -> bool:
+        """儲存交易記錄（整表覆寫）"""
+        try:
+            with self._write():
+                self.conn.execute("DELETE FROM transactions")
+                self._insert_transactions(transactions)
+            return True
+        except sqlite3.Error as e:
+            print(f"[Error] 儲存失敗: {e}")
+            return False
+
+    def append_transaction(self, transaction: Dict) -> bool:
+        """新增一筆交易記錄"""
+        return self.append_transactions([transaction])
+
+    def append_transactions(self, transactions: List[Dict]) -> bool:
+        """一次新增多筆交易記錄（單一 executemany）"""
+        try:
+            with self._write():
+                self._insert_transactions(transactions)
+            return True
+        except sqlite3.Error as e:
+            print(f"[Error] 儲存失敗: {e}")
+            return False
+
+    def iter_transactions(self) -> Iterator[Dict]:
+        """依寫入順序逐筆讀取交易記錄"""
+        return self._stream("SELECT * FROM transactions ORDER BY seq")
+
+    def iter_transactions_range(self, start: Optional[str] = None, end: Optional[str] = None,
+                                account_id: Optional[str] = None) -> Iterator[Dict]:
+        """
+        依時間區間逐筆讀取交易記錄（start <= timestamp < end，依時間順序）
+
+        走 timestamp / (account_id, timestamp) 索引，只讀取區間內的資料列
+        """
+        conditions, params = [], []
+        if account_id is not None:
+            conditions.append("account_id = ?")
+            params.append(account_id)
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("timestamp < ?")
+            params.append(end)
+        sql = "SELECT * FROM transactions"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return self._stream(sql + " ORDER BY timestamp, seq", tuple(params))
+
+    def _stream(self, sql: str, params: tuple = ()) -> Iterator[Dict]:
+        """分批取出查詢結果，逐筆產生交易記錄（每次 fetchmany 才持有 _lock）"""
+        with self._lock:
+            cursor = self.conn.execute(sql, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            for row in rows:
+                yield self._row_to_transaction(row)
+
+    def get_transactions_since(self, position: int = 0) -> Tuple[List[Dict], int]:
+        """
+        增量讀取（同 DataManager.get_transactions_since）：位置為最後讀到的 seq
+
+        seq 不會重複使用，整份覆寫後位置對應的列就不存在
+
+        例外：
+            StalePositionError: 位置已失效
+        """
+        if position and not self._query("SELECT 1 FROM transactions WHERE seq = ?", (position,)):
+            raise StalePositionError(f"交易記錄已被覆寫: seq {position}")
+        rows = self._query("SELECT * FROM transactions WHERE seq > ? ORDER BY seq", (position,))
+        return [self._row_to_transaction(row) for row in rows], (rows[-1]["seq"] if rows else position)
+
+    def get_account_transactions(self, account_id: str,
+                                 transaction_type: Optional[str] = None,
+                                 limit: int = 0, newest_first: bool = False) -> List[Dict]:
+        """
+        查詢單一帳戶的交易記錄（走 account_id 索引，預設舊→新）
+
+        newest_first 時依 seq 反向讀取，LIMIT 讓 SQLite 讀滿 limit 筆即停止
+        """
+        if newest_first:
+            return self.get_account_page(account_id, limit, transaction_type=transaction_type)[0]
+        sql, params = self._account_query(account_id, transaction_type)
+        sql += " ORDER BY seq"
+        if limit > 0:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [self._row_to_transaction(row) for row in self._query(sql, tuple(params))]
+
+    def get_account_page(self, account_id: str, limit: int, before: Optional[int] = None,
+                         transaction_type: Optional[str] = None) -> Tuple[List[Dict], Optional[int]]:
+        """
+        分頁查詢單一帳戶的交易記錄（新→舊，同 DataManager.get_account_page）
+
+        游標為 seq：WHERE seq < ? 由索引直接定位，第 k 頁的成本與第 1 頁相同；
+        多讀一筆以判斷是否還有下一頁
+        """
+        sql, params = self._account_query(account_id, transaction_type)
+        if before is not None:
+            sql += " AND seq < ?"
+            params.append(before)
+        sql += " ORDER BY seq DESC"
+        if limit > 0:
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        rows = self._query(sql, tuple(params))
+        if limit > 0 and len(rows) > limit:
+            rows = rows[:limit]
+            return [self._row_to_transaction(row) for row in rows], rows[-1]["seq"]
+        return [self._row_to_transaction(row) for row in rows], None
+
+    @staticmethod
+    def _account_query(account_id: str, transaction_type: Optional[str]) -> Tuple[str, List]:
+        """單一帳戶（或帳戶 + 類型）的查詢條件"""
+        sql = "SELECT * FROM transactions WHERE account_id = ?"
+        params = [account_id]
+        if transaction_type is not None:
+            sql += " AND type = ?"
+            params.append(transaction_type)
+        return sql, params
+
+    def get_transaction(self, transaction_id: str) -> Optional[Dict]:
+        """依交易 ID 查詢單筆交易（走 UNIQUE 索引）"""
+        rows = self._query("SELECT * FROM transactions WHERE transaction_id = ?", (transaction_id,))
+        return self._row_to_transaction(rows[0]) if rows else None
+
+    def migrate_transactions_to_log(self) -> int:
+        """SQLite 後端不使用 log 分段檔"""
+        raise ValueError("SQLite 後端不支援 log 模式")
+
+    # ==================== 設定檔操作 ====================
+
+    def _get_config(self, key: str, default: Any = None) -> Any:
+        """讀取設定值"""
+        rows = self._query("SELECT value FROM config WHERE key = ?", (key,))
+        return json.loads(rows[0]["value"]) if rows else default
+
+    def _increment_config(self, key: str) -> bool:
+        """設定值 +1（單一 UPDATE，不需先讀再寫）"""
+        with self._write():
+            cursor = self.conn.execute(
+                "UPDATE config SET value = CAST(value AS INTEGER) + 1 WHERE key = ?", (key,)
+            )
+        return cursor.rowcount == 1
+
+    def _allocate_config(self, key: str) -> int:
+        """在同一個交易中讀取並遞增設定值"""
+        with self._write():
+            if self._batch_depth == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+            allocated = self._get_config(key, 1)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)",
+                (key, json.dumps(allocated + 1))
+            )
+        return allocated
+
+    def get_next_account_id(self) -> int:
+        """取得下一個帳號 ID"""
+        return self._get_config("next_account_id", 1)
+
+    def increment_account_id(self) -> bool:
+        """遞增帳號 ID"""
+        return self._increment_config("next_account_id")
+
+    def allocate_account_id(self) -> int:
+        """配發一個帳號 ID"""
+        return self._allocate_config("next_account_id")
+
+    def get_next_transaction_id(self) -> int:
+        """取得下一個交易 ID"""
+        return self._get_config("next_transaction_id", 1)
+
+    def increment_transaction_id(self) -> bool:
+        """遞增交易 ID"""
+        return self._increment_config("next_transaction_id")
+
+    def allocate_transaction_id(self) -> int:
+        """配發一個交易 ID"""
+        return self._allocate_config("next_transaction_id")
+
+    def clear_all_data(self):
+        """清空所有資料（測試用）"""
+        with self.conn:
+            self.conn.execute("DELETE FROM accounts")
+            self.conn.execute("DELETE FROM transactions")
+            self.conn.execute("DELETE FROM config")
+        self._init_config()
+
+    def invalidate_cache(self):
+        """SQLite 後端沒有額外快取"""
+
+    # ==================== 匯入 ====================
+
+    def import_json_data(self, source_dir: str) -> Dict[str, int]:
+        """
+        匯入既有 JSON data/ 目錄
+
+        輸入：
+            source_dir (str): 舊的資料目錄（accounts.json、transactions.json 或 log 分段檔）
+
+        輸出：
+            dict: {"accounts": 帳戶數, "transactions": 交易數}
+
+        匯入會取代資料庫中現有的資料，並沿用來源的 ID 流水號；
+        舊版 JSON 的金額（float，元）在匯入時換算成分
+        """
+        source = DataManager(source_dir, backend=BACKEND_JSON)
+        try:
+            accounts = source.load_accounts()
+            count = 0
+            with self.conn:
+                self.conn.execute("DELETE FROM accounts")
+                self.conn.execute("DELETE FROM transactions")
+                self.conn.executemany(
+                    "INSERT INTO accounts (account_id, name, balance, created_date, version) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    ((account_id, info["name"], read_minor(info["balance"]), info.get("created_date"),
+                      info.get("version", 0))
+                     for account_id, info in accounts.items())
+                )
+                batch = []
+                for txn in source.iter_transactions():
+                    batch.append(dict(txn, amount=read_minor(txn["amount"]),
+                                      balance_after=read_minor(txn["balance_after"])))
+                    if len(batch) >= 10000:
+                        self._insert_transactions(batch)
+                        count += len(batch)
+                        batch = []
+                self._insert_transactions(batch)
+                count += len(batch)
+                for key in ("next_account_id", "next_transaction_id"):
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)",
+                        (key, json.dumps(source._load_json(source.config_file).get(key, 1)))
+                    )
+        finally:
+            source.close()
+        return {"accounts": len(accounts), "transactions": count}
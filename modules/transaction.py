@@ -9,17 +9,43 @@ Transaction Module
 1. 存款
 2. 提款
 3. 轉帳
-4. 呼叫其他模組更新餘額和記錄
+4. 一對多付款（薪資發放）
+5. 呼叫其他模組更新餘額和記錄
 """
 
+import random
+import threading
+import time
+import zlib
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from modules.data_manager import ConcurrentUpdateError
+from modules.idempotency import IdempotencyStore, request_fingerprint
+from modules.money import to_major, to_minor
+
+
+# 鎖的分段數量：鍵雜湊到固定數量的鎖，不需要為每個鍵建立一把鎖
+LOCK_STRIPES = 64
+
+# 樂觀鎖：版本衝突時最多重試的次數，與第一次重試前的最長退避秒數（之後每次加倍）
+CAS_MAX_RETRIES = 50
+CAS_BACKOFF = 0.0005
+
+# apply_batch：各操作中必須是字串的欄位（套用前檢查）
+_BATCH_STR_FIELDS = {
+    "deposit": ("account_id",),
+    "withdraw": ("account_id",),
+    "transfer": ("from_account_id", "to_account_id"),
+}
 
 
 class TransactionModule:
     """交易模組"""
     
-    def __init__(self, account_module, history_module):
+    def __init__(self, account_module, history_module,
+                 idempotency: Optional[IdempotencyStore] = None):
         """
         初始化交易模組
         
@@ -34,11 +60,95 @@ class TransactionModule:
         參數：
             account_module: AccountModule 實例
             history_module: HistoryModule 實例
+            idempotency (IdempotencyStore, optional): 冪等鍵儲存，
+                預設為 data_manager.idempotency_store()（鍵與資料在同一個工作單元寫入，
+                自訂時也需由同一個 DataManager 建立）
         """
         self.account = account_module
         self.history = history_module
+        
+        # 冪等鍵：同一個 idempotency_key 重送時回傳第一次的結果
+        self.idempotency = idempotency or account_module.data_manager.idempotency_store()
+        
+        # 帳戶餘額以版本號做樂觀並行控制（_retry_on_conflict），不鎖帳戶；
+        # 分段鎖只用於冪等鍵與批次操作，鎖在資料目錄的鎖檔上，跨程序同樣有效
+        self._held = threading.local()
     
-    def deposit(self, account_id: str, amount: float) -> Dict:
+    @contextmanager
+    def _locked(self, *keys: Optional[str]):
+        """
+        鎖定冪等鍵（None 略過），同一個鍵的重送不會同時執行
+        
+        [設計決策]
+        - 鍵雜湊到 LOCK_STRIPES 個分段，每個分段是鎖檔中的一個區域
+          （DataManager.locks），同時對其他執行緒與其他程序互斥
+        - 依分段編號由小到大取得，多個鍵同時鎖定也不會死結
+        - 落在同一分段、或本執行緒已持有（批次中）時不重複取得
+        """
+        held = self._held.__dict__.setdefault("stripes", set())
+        stripes = sorted({zlib.crc32(key.encode("utf-8")) % LOCK_STRIPES
+                          for key in keys if key is not None} - held)
+        yield from self._hold_stripes(stripes, held)
+    
+    @contextmanager
+    def _locked_all(self):
+        """依序鎖定所有分段（批次操作使用）"""
+        held = self._held.__dict__.setdefault("stripes", set())
+        yield from self._hold_stripes([n for n in range(LOCK_STRIPES) if n not in held], held)
+    
+    def _hold_stripes(self, stripes: List[int], held: set):
+        """依序取得分段鎖，區塊結束時反向釋放"""
+        locks = self.account.data_manager.locks
+        acquired = []
+        try:
+            for stripe in stripes:
+                locks.acquire(stripe)
+                acquired.append(stripe)
+                held.add(stripe)
+            yield
+        finally:
+            for stripe in reversed(acquired):
+                held.discard(stripe)
+                locks.release(stripe)
+    
+    def _retry_on_conflict(self, attempt: Callable[[], Dict]) -> Dict:
+        """
+        樂觀並行控制：執行 attempt（讀取帳戶 → 計算 → 以讀到的版本號寫入），
+        帳戶在讀取後被其他寫入者修改（ConcurrentUpdateError）時重新執行
+        
+        [設計決策]
+        - 不持有帳戶鎖：低衝突時沒有任何等待，衝突時只有後到的一方重做
+        - 重試前隨機退避（上限逐次加倍），避免衝突的寫入者同時重試
+        - 超過 CAS_MAX_RETRIES 次仍衝突時拋出 ConcurrentUpdateError
+        """
+        for retry in range(CAS_MAX_RETRIES):
+            try:
+                return attempt()
+            except ConcurrentUpdateError:
+                time.sleep(random.uniform(0, CAS_BACKOFF * (1 << min(retry, 6))))
+        return attempt()
+    
+    def _replay(self, idempotency_key: Optional[str], fingerprint: str) -> Optional[Dict]:
+        """
+        已處理過的 idempotency_key：回傳第一次的結果（呼叫端需持有鍵的鎖）
+        
+        例外：
+            ValueError: 鍵已用於參數不同的請求
+        """
+        if idempotency_key is None:
+            return None
+        return self.idempotency.get(idempotency_key, fingerprint)
+    
+    def _remember(self, uow, idempotency_key: Optional[str], fingerprint: str, result: Dict) -> Dict:
+        """
+        記錄成功的結果供重送時回傳：鍵與餘額、交易在同一個工作單元寫入
+        （失敗的操作不記錄，重送時重新檢查）
+        """
+        uow.remember(self.idempotency, idempotency_key, result, fingerprint)
+        return result
+    
+    def deposit(self, account_id: str, amount: float,
+                idempotency_key: Optional[str] = None) -> Dict:
         """
         存款功能
         
@@ -47,6 +157,8 @@ class TransactionModule:
         輸入：
             account_id (str): 帳號 ID
             amount (float): 存款金額
+            idempotency_key (str, optional): 冪等鍵，重送同一個鍵時
+                直接回傳第一次的結果，不會重複存款
         
         輸出：
             dict: {
@@ -62,46 +174,65 @@ class TransactionModule:
         - 存款金額必須 > 0
         - 使用例外處理錯誤情況
         - 成功後記錄到交易歷史
+        - 金額換算成「分」的整數後再計算，回傳時換回「元」
+        - 餘額與交易記錄在同一個工作單元寫入，帳戶版本在讀取後改變時
+          重新讀取再算一次（_retry_on_conflict）
+        - 冪等鍵連同結果也寫在同一個工作單元；同一個鍵帶著不同參數重送時
+          拋出 ValueError（以請求指紋比對）
         """
         # Step 1: 驗證金額
+        amount = to_minor(amount)
         if amount <= 0:
             raise ValueError("存款金額必須大於 0")
+        fingerprint = request_fingerprint("deposit", account_id, amount)
         
-        # Step 2: 取得帳戶
-        account = self.account.get_account(account_id)
-        if account is None:
-            raise ValueError(f"帳戶不存在: {account_id}")
-        
-        # Step 3: 計算新餘額
-        new_balance = account['balance'] + amount
-        
-        # Step 4: 更新餘額
-        self.account.update_balance(account_id, new_balance)
-        
-        # Step 5: 記錄交易
-        transaction_id = self.history.log_transaction(
-            account_id=account_id,
-            transaction_type="DEPOSIT",
-            amount=amount,
-            balance_after=new_balance
-        )
-        
-        # Step 6: 回傳結果
-        return {
-            "success": True,
-            "new_balance": new_balance,
-            "transaction_id": transaction_id
-        }
+        def attempt() -> Dict:
+            # Step 2: 取得帳戶
+            account = self.account.get_account(account_id, minor_units=True)
+            if account is None:
+                raise ValueError(f"帳戶不存在: {account_id}")
+            
+            # Step 3: 計算新餘額
+            new_balance = account['balance'] + amount
+            
+            with self.account.data_manager.unit_of_work() as uow:
+                # Step 4: 更新餘額（版本號與讀取時相同才寫入）
+                uow.update_balance(account_id, new_balance, expected_version=account['version'])
+                
+                # Step 5: 記錄交易
+                transaction_id = self.history.log_transaction(
+                    account_id=account_id,
+                    transaction_type="DEPOSIT",
+                    amount=amount,
+                    balance_after=new_balance,
+                    unit_of_work=uow,
+                    minor_units=True
+                )
+                
+                # Step 6: 回傳結果（與冪等鍵一起寫入）
+                return self._remember(uow, idempotency_key, fingerprint, {
+                    "success": True,
+                    "new_balance": to_major(new_balance),
+                    "transaction_id": transaction_id
+                })
+        
+        with self._locked(idempotency_key):
+            replay = self._replay(idempotency_key, fingerprint)
+            if replay is not None:
+                return replay
+            return self._retry_on_conflict(attempt)
     
-    def withdraw(self, account_id: str, amount: float) -> Dict:
+    def withdraw(self, account_id: str, amount: float,
+                 idempotency_key: Optional[str] = None) -> Dict:
         """
         提款功能
         
-        [已實作 40% / 留白 60%]
+        [已實作 100%]
         
         輸入：
             account_id (str): 帳號 ID
             amount (float): 提款金額
+            idempotency_key (str, optional): 冪等鍵（同 deposit）
         
         輸出：
             dict: {
@@ -123,64 +254,64 @@ class TransactionModule:
         - 需要多檢查餘額是否足夠
         - 新餘額是減法而非加法
         """
-        # [已提供] Step 1: 驗證金額
+        # [已提供] Step 1: 驗證金額（換算成分）
+        amount = to_minor(amount)
         if amount <= 0:
             raise ValueError("提款金額必須大於 0")
+        fingerprint = request_fingerprint("withdraw", account_id, amount)
         
-        # [已提供] Step 2: 取得帳戶
-        account = self.account.get_account(account_id)
-        if account is None:
-            raise ValueError(f"帳戶不存在: {account_id}")
-        
-        # ========== [留白區域 1] 驗證餘額 ==========
-        # TODO: 檢查餘額是否足夠（約 2-3 行）
-        #
-        # [需要檢查]
-        # 如果 amount > account['balance']:
-        #     應該拋出 ValueError("餘額不足")
-        #
-        # [進階思考]
-        # - 是否要保留最低餘額？
-        # - 例如：至少要留 100 元
-        
-        
-        
-        # [已提供] Step 3: 計算新餘額
-        new_balance = account['balance'] - amount
-        
-        # [已提供] Step 4: 更新餘額
-        self.account.update_balance(account_id, new_balance)
-        
-        # ========== [留白區域 2] 記錄交易 ==========
-        # TODO: 呼叫 history.log_transaction()（約 2-5 行）
-        #
-        # [需要與組員C確認]
-        # 1. 函數名稱：log_transaction 還是 add_transaction？
-        # 2. 參數順序：先 account_id 還是先 type？
-        # 3. transaction_type 用什麼字串？
-        #
-        # [參考 deposit() 的寫法]
-        # transaction_id = self.history.log_transaction(...)
-        
-        transaction_id = None  # TODO: 替換這行
-        
-        # [已提供] Step 5: 回傳結果
-        return {
-            "success": True,
-            "new_balance": new_balance,
-            "transaction_id": transaction_id
-        }
+        def attempt() -> Dict:
+            # [已提供] Step 2: 取得帳戶
+            account = self.account.get_account(account_id, minor_units=True)
+            if account is None:
+                raise ValueError(f"帳戶不存在: {account_id}")
+            
+            # Step 3: 驗證餘額
+            if amount > account['balance']:
+                raise ValueError("餘額不足")
+            
+            # [已提供] Step 4: 計算新餘額
+            new_balance = account['balance'] - amount
+            
+            with self.account.data_manager.unit_of_work() as uow:
+                # [已提供] Step 5: 更新餘額（版本號與讀取時相同才寫入）
+                uow.update_balance(account_id, new_balance, expected_version=account['version'])
+                
+                # Step 6: 記錄交易
+                transaction_id = self.history.log_transaction(
+                    account_id=account_id,
+                    transaction_type="WITHDRAW",
+                    amount=amount,
+                    balance_after=new_balance,
+                    unit_of_work=uow,
+                    minor_units=True
+                )
+                
+                # [已提供] Step 7: 回傳結果（與冪等鍵一起寫入）
+                return self._remember(uow, idempotency_key, fingerprint, {
+                    "success": True,
+                    "new_balance": to_major(new_balance),
+                    "transaction_id": transaction_id
+                })
+        
+        with self._locked(idempotency_key):
+            replay = self._replay(idempotency_key, fingerprint)
+            if replay is not None:
+                return replay
+            return self._retry_on_conflict(attempt)
     
-    def transfer(self, from_account_id: str, to_account_id: str, amount: float) -> Dict:
+    def transfer(self, from_account_id: str, to_account_id: str, amount: float,
+                 idempotency_key: Optional[str] = None) -> Dict:
         """
         轉帳功能
         
-        [留白 100%] 最複雜的功能，請完整實作
+        [已實作 100%]
         
         輸入：
             from_account_id (str): 轉出帳號
             to_account_id (str): 轉入帳號
             amount (float): 轉帳金額
+            idempotency_key (str, optional): 冪等鍵（同 deposit）
         
         輸出：
             dict: {
@@ -257,9 +388,315 @@ class TransactionModule:
                 "transaction_id": txn_out
             }
         
-        [⚠️ 進階挑戰]
-        思考：如果第一個 update_balance 成功，但第二個失敗怎麼辦？
-        - 目前簡單做法：不處理
-        - 未來改進：加入回滾機制
+        [設計決策]
+        Step 6、7 的兩筆餘額變更與兩筆交易記錄放在同一個工作單元
+        （DataManager.unit_of_work）中暫存，全部準備好才一次寫入；
+        任何一步失敗都整批捨棄，不會出現「只扣款沒入帳」的狀態；
+        任一帳戶的版本在讀取後改變時，兩個帳戶都重新讀取再算一次
+        """
+        # Step 1: 驗證金額（換算成分）
+        amount = to_minor(amount)
+        if amount <= 0:
+            raise ValueError("轉帳金額必須大於 0")
+        
+        # Step 2: 驗證不能轉給自己
+        if from_account_id == to_account_id:
+            raise ValueError("不能轉帳給自己")
+        fingerprint = request_fingerprint("transfer", from_account_id, to_account_id, amount)
+        
+        def attempt() -> Dict:
+            # Step 3: 取得兩個帳戶
+            from_account = self.account.get_account(from_account_id, minor_units=True)
+            to_account = self.account.get_account(to_account_id, minor_units=True)
+            if from_account is None:
+                raise ValueError(f"轉出帳戶不存在: {from_account_id}")
+            if to_account is None:
+                raise ValueError(f"轉入帳戶不存在: {to_account_id}")
+            
+            # Step 4: 檢查轉出帳戶餘額
+            if amount > from_account['balance']:
+                raise ValueError("餘額不足")
+            
+            # Step 5: 計算新餘額
+            from_new_balance = from_account['balance'] - amount
+            to_new_balance = to_account['balance'] + amount
+            
+            with self.account.data_manager.unit_of_work() as uow:
+                # Step 6: 更新兩個帳戶（兩者的版本號都與讀取時相同才寫入）
+                uow.update_balance(from_account_id, from_new_balance,
+                                   expected_version=from_account['version'])
+                uow.update_balance(to_account_id, to_new_balance,
+                                   expected_version=to_account['version'])
+                
+                # Step 7: 記錄兩筆交易（互相記錄對方帳號）
+                txn_out = self.history.log_transaction(
+                    account_id=from_account_id,
+                    transaction_type="TRANSFER_OUT",
+                    amount=amount,
+                    balance_after=from_new_balance,
+                    related_account=to_account_id,
+                    unit_of_work=uow,
+                    minor_units=True
+                )
+                self.history.log_transaction(
+                    account_id=to_account_id,
+                    transaction_type="TRANSFER_IN",
+                    amount=amount,
+                    balance_after=to_new_balance,
+                    related_account=from_account_id,
+                    unit_of_work=uow,
+                    minor_units=True
+                )
+                
+                # Step 8: 回傳結果（與冪等鍵一起寫入）
+                return self._remember(uow, idempotency_key, fingerprint, {
+                    "success": True,
+                    "from_balance": to_major(from_new_balance),
+                    "to_balance": to_major(to_new_balance),
+                    "transaction_id": txn_out
+                })
+        
+        with self._locked(idempotency_key):
+            replay = self._replay(idempotency_key, fingerprint)
+            if replay is not None:
+                return replay
+            return self._retry_on_conflict(attempt)
+    
+    def disburse(self, from_account_id: str, payments: List[Tuple[str, float]],
+                 all_or_nothing: bool = True,
+                 idempotency_key: Optional[str] = None) -> Dict:
+        """
+        一對多付款（薪資發放等）
+        
+        [已實作 100%]
+        
+        輸入：
+            from_account_id (str): 轉出帳號
+            payments (list): [(轉入帳號, 金額), ...]，同一個轉入帳號可出現多次
+            all_or_nothing (bool): True（預設）時任何一筆無效或總額超過餘額就整批拒絕；
+                False 時依序處理，無效的付款與餘額用完後的付款標記失敗，其餘照常入帳
+            idempotency_key (str, optional): 冪等鍵（同 deposit）
+        
+        輸出：
+            dict: {
+                "success": True,
+                "from_balance": 7000.0,
+                "total": 3000.0,             # 實際轉出的總額
+                "results": [                 # 與 payments 一一對應
+                    {"success": True, "to_account_id": "ACC0002",
+                     "to_balance": 1500.0, "transaction_id": "TXN0010"},
+                    {"success": False, "to_account_id": "ACC9999",
+                     "error": "轉入帳戶不存在: ACC9999"},
+                ]
+            }
+            best-effort 時沒有任何一筆成功則 "success" 為 False、"total" 為 0，
+            不寫入任何資料（轉出帳戶的版本也不變），失敗原因見 "results"
+        
+        例外：
+            ValueError: 轉出帳戶不存在、付款明細為空；
+                all_or_nothing=True 時另有任何一筆無效或餘額不足
+        
+        [設計決策]
+        - 轉出帳戶只讀取、檢查、寫入各一次，不是每筆付款各一次 transfer
+        - 每筆付款仍記錄一對 TRANSFER_OUT / TRANSFER_IN（互相記錄對方帳號），
+          轉出記錄的 balance_after 依付款順序遞減，與逐筆轉帳的歷史相同
+        - 所有餘額變更與交易記錄放在同一個工作單元，一次寫入；寫入失敗整批捨棄
+        - 任何一個帳戶的版本在讀取後改變時，整批重新讀取、驗證再算一次
+        
+        使用範例：
+            result = transaction_module.disburse("ACC0001", [
+                ("ACC0002", 1500.0),
+                ("ACC0003", 1500.0),
+            ])
+        """
+        if not payments:
+            raise ValueError("付款明細不能為空")
+        fingerprint = request_fingerprint("disburse", from_account_id, payments, all_or_nothing)
+        
+        def attempt() -> Dict:
+            from_account = self.account.get_account(from_account_id, minor_units=True)
+            if from_account is None:
+                raise ValueError(f"轉出帳戶不存在: {from_account_id}")
+            
+            # Step 1: 逐筆驗證金額與轉入帳戶（同一帳戶只讀取一次）
+            to_balances: Dict[str, int] = {}
+            to_versions: Dict[str, int] = {}
+            planned: List[Optional[Tuple[str, int]]] = []
+            results: List[Optional[Dict]] = []
+            for index, payment in enumerate(payments):
+                to_account_id = None
+                try:
+                    try:
+                        to_account_id, amount = payment
+                    except (TypeError, ValueError):
+                        raise ValueError(f"付款格式錯誤: {payment!r}") from None
+                    if not isinstance(to_account_id, str):
+                        raise ValueError(f"轉入帳號格式錯誤: {to_account_id!r}")
+                    amount = to_minor(amount)
+                    if amount <= 0:
+                        raise ValueError("轉帳金額必須大於 0")
+                    if to_account_id == from_account_id:
+                        raise ValueError("不能轉帳給自己")
+                    if to_account_id not in to_balances:
+                        to_account = self.account.get_account(to_account_id, minor_units=True)
+                        if to_account is None:
+                            raise ValueError(f"轉入帳戶不存在: {to_account_id}")
+                        to_balances[to_account_id] = to_account['balance']
+                        to_versions[to_account_id] = to_account['version']
+                except ValueError as e:
+                    if all_or_nothing:
+                        raise ValueError(f"第 {index + 1} 筆付款: {e}")
+                    planned.append(None)
+                    results.append({"success": False, "to_account_id": to_account_id, "error": str(e)})
+                    continue
+                planned.append((to_account_id, amount))
+                results.append(None)
+            
+            # Step 2: 總額與餘額只比較一次；best-effort 時依序付到餘額不足為止
+            from_balance = from_account['balance']
+            total = sum(payment[1] for payment in planned if payment is not None)
+            if total > from_balance:
+                if all_or_nothing:
+                    raise ValueError("餘額不足")
+                remaining = from_balance
+                for index, payment in enumerate(planned):
+                    if payment is None:
+                        continue
+                    if payment[1] > remaining:
+                        planned[index] = None
+                        results[index] = {"success": False, "to_account_id": payment[0], "error": "餘額不足"}
+                    else:
+                        remaining -= payment[1]
+            
+            # best-effort 且沒有任何一筆可付：不寫入（轉出帳戶的版本不變），也不記錄冪等鍵
+            if all(payment is None for payment in planned):
+                return {
+                    "success": False,
+                    "from_balance": to_major(from_balance),
+                    "total": to_major(0),
+                    "results": results
+                }
+            
+            # Step 3: 一個工作單元寫入所有餘額與成對的交易記錄
+            credited = set()
+            with self.account.data_manager.unit_of_work() as uow:
+                for index, payment in enumerate(planned):
+                    if payment is None:
+                        continue
+                    to_account_id, amount = payment
+                    from_balance -= amount
+                    to_balances[to_account_id] += amount
+                    credited.add(to_account_id)
+                    transaction_id = self.history.log_transaction(
+                        account_id=from_account_id,
+                        transaction_type="TRANSFER_OUT",
+                        amount=amount,
+                        balance_after=from_balance,
+                        related_account=to_account_id,
+                        unit_of_work=uow,
+                        minor_units=True
+                    )
+                    self.history.log_transaction(
+                        account_id=to_account_id,
+                        transaction_type="TRANSFER_IN",
+                        amount=amount,
+                        balance_after=to_balances[to_account_id],
+                        related_account=from_account_id,
+                        unit_of_work=uow,
+                        minor_units=True
+                    )
+                    results[index] = {
+                        "success": True,
+                        "to_account_id": to_account_id,
+                        "to_balance": to_major(to_balances[to_account_id]),
+                        "transaction_id": transaction_id
+                    }
+                uow.update_balance(from_account_id, from_balance,
+                                   expected_version=from_account['version'])
+                for to_account_id in credited:
+                    uow.update_balance(to_account_id, to_balances[to_account_id],
+                                       expected_version=to_versions[to_account_id])
+                
+                return self._remember(uow, idempotency_key, fingerprint, {
+                    "success": True,
+                    "from_balance": to_major(from_balance),
+                    "total": to_major(from_account['balance'] - from_balance),
+                    "results": results
+                })
+        
+        with self._locked(idempotency_key):
+            replay = self._replay(idempotency_key, fingerprint)
+            if replay is not None:
+                return replay
+            return self._retry_on_conflict(attempt)
+    
+    def apply_batch(self, ops: List[Dict]) -> List[Dict]:
         """
-        pass  # TODO: 請實作（預計 30-40行程式碼
\ No newline at end of file
+        批次處理多筆存款 / 提款 / 轉帳
+        
+        [已實作 100%]
+        
+        輸入：
+            ops (list): 操作列表，每筆為 dict：
+                {"op": "deposit", "account_id": "ACC0001", "amount": 100.0}
+                {"op": "withdraw", "account_id": "ACC0001", "amount": 50.0}
+                {"op": "transfer", "from_account_id": "ACC0001",
+                 "to_account_id": "ACC0002", "amount": 30.0}
+                每筆都可另外帶 "idempotency_key"（已用於不同參數的鍵該筆失敗）
+        
+        輸出：
+            list: 與 ops 一一對應的結果
+                成功：{"success": True, ...與單筆操作相同的欄位}
+                失敗：{"success": False, "error": "餘額不足"}
+        
+        [設計決策]
+        - 所有操作依序套用在同一份記憶體快照上，後面的操作看得到前面的結果
+        - 單筆失敗（ValueError、格式錯誤的操作）只記錄在該筆結果，不影響其他操作；
+          帳號 / 冪等鍵的型別在套用前先檢查，None 或 list 等值不會在套用途中
+          拋出 TypeError / AttributeError 讓整批回滾
+        - 全部處理完才由 DataManager 一次寫入，
+          成本與操作筆數成正比，而不是「筆數 × 檔案大小」
+        - 批次期間其他執行緒的寫入等待批次完成（DataManager.batch）；
+          同時鎖定所有分段，避免與持有冪等鍵鎖、等待批次的執行緒互相等待
+        
+        使用範例：
+            results = transaction_module.apply_batch([
+                {"op": "deposit", "account_id": "ACC0001", "amount": 100.0},
+                {"op": "withdraw", "account_id": "ACC0002", "amount": 999999.0},
+            ])
+            # results[1] == {"success": False, "error": "餘額不足"}
+        """
+        handlers = {
+            "deposit": lambda op: self.deposit(op["account_id"], op["amount"],
+                                               op.get("idempotency_key")),
+            "withdraw": lambda op: self.withdraw(op["account_id"], op["amount"],
+                                                 op.get("idempotency_key")),
+            "transfer": lambda op: self.transfer(op["from_account_id"], op["to_account_id"], op["amount"],
+                                                 op.get("idempotency_key")),
+        }
+        
+        results = []
+        # 冪等鍵隨資料在批次結束時一起寫入；批次失敗時冪等鍵儲存也捨棄記憶體中的鍵
+        # （離開順序與進入相反）
+        with self._locked_all(), self.idempotency.batch(), self.account.data_manager.batch():
+            for op in ops:
+                if not isinstance(op, dict):
+                    results.append({"success": False, "error": f"操作格式錯誤: {op!r}"})
+                    continue
+                name = op.get("op")
+                handler = handlers.get(name) if isinstance(name, str) else None
+                try:
+                    if handler is None:
+                        raise ValueError(f"不支援的操作: {name}")
+                    for field in _BATCH_STR_FIELDS[name]:
+                        if not isinstance(op[field], str):
+                            raise ValueError(f"欄位格式錯誤: {field}={op[field]!r}")
+                    key = op.get("idempotency_key")
+                    if key is not None and not isinstance(key, str):
+                        raise ValueError(f"欄位格式錯誤: idempotency_key={key!r}")
+                    results.append(handler(op))
+                except KeyError as e:
+                    results.append({"success": False, "error": f"缺少欄位: {e.args[0]}"})
+                except (ValueError, ConcurrentUpdateError) as e:
+                    results.append({"success": False, "error": str(e)})
+        return results
\ No newline at end of file
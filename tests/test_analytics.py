@@ -0,0 +1,196 @@
+"""
+Analytics 測試
+負責人：整合者
+
+測試涵蓋：
+- 依日期 / 帳戶 / 類型分組的加總、筆數、平均
+- 百分位數
+- 篩選條件（類型、帳戶、時間區間）
+- 增量載入與整份重建（覆寫後自動重建）
+- 三種儲存方式（json / log / sqlite）
+"""
+
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.analytics import TransactionAnalytics, np
+from modules.data_manager import DataManager
+from modules.history import HistoryModule
+
+
+def setup_test_env(**kwargs):
+    """建立測試環境"""
+    test_dir = "test_data_analytics"
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    data_manager = DataManager(data_dir=test_dir, **kwargs)
+    history_mod = HistoryModule(data_manager)
+    return history_mod, test_dir
+
+
+def cleanup_test_env(test_dir):
+    """清理測試環境"""
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+
+def make_transactions(count, start=1):
+    """產生跨帳戶、跨日期的交易記錄（金額以分保存）"""
+    return [
+        {"transaction_id": f"SEED{n:04d}", "account_id": f"ACC000{n % 3 + 1}",
+         "type": "DEPOSIT" if n % 4 else "WITHDRAW", "amount": n * 10, "balance_after": n * 100,
+         "timestamp": f"2025-10-{n // 24 + 1:02d}T{n % 24:02d}:00:00"}
+        for n in range(start, start + count)
+    ]
+
+
+def expected_groups(transactions, key):
+    """逐筆計算的分組結果（元）"""
+    groups = {}
+    for t in transactions:
+        groups.setdefault(key(t), []).append(t["amount"])
+    return groups
+
+
+# ==================== 測試案例 ====================
+
+def test_grouped_aggregates():
+    """測試：分組加總 / 筆數 / 平均與逐筆計算相同，三種儲存方式皆可用"""
+    print("測試：分組彙總...")
+    if np is None:
+        print("⚠️ 未安裝 numpy，略過")
+        return
+    transactions = make_transactions(200)
+    keys = {"day": lambda t: t["timestamp"][:10], "account": lambda t: t["account_id"],
+            "type": lambda t: t["type"]}
+    for storage in ("json", "log", "sqlite"):
+        if storage == "sqlite":
+            history_mod, test_dir = setup_test_env(backend="sqlite")
+        else:
+            history_mod, test_dir = setup_test_env(transaction_storage=storage)
+        history_mod.data_manager.save_transactions(transactions)
+        analytics = TransactionAnalytics(history_mod)
+
+        assert analytics.count() == 200, f"❌ {storage} 筆數錯誤"
+        assert analytics.sum() == sum(t["amount"] for t in transactions) / 100
+        for by, key in keys.items():
+            groups = expected_groups(transactions, key)
+            assert analytics.count(by=by) == {k: len(v) for k, v in groups.items()}, f"❌ {storage} {by}"
+            assert analytics.sum(by=by) == {k: sum(v) / 100 for k, v in groups.items()}
+            means = analytics.mean(by=by)
+            for k, v in groups.items():
+                assert abs(means[k] - sum(v) / len(v) / 100) < 1e-9, f"❌ {storage} {by} 平均錯誤"
+
+        # 篩選條件
+        withdrawals = [t for t in transactions if t["type"] == "WITHDRAW"]
+        assert analytics.sum(by="day", transaction_type="WITHDRAW") == \
+            {k: sum(v) / 100 for k, v in expected_groups(withdrawals, keys["day"]).items()}
+        window = [t for t in transactions if "2025-10-03" <= t["timestamp"] < "2025-10-05"
+                  and t["account_id"] == "ACC0002"]
+        assert analytics.count(account_id="ACC0002", start="2025-10-03", end="2025-10-05") == len(window)
+        assert analytics.sum(column="balance_after", account_id="ACC0002", start="2025-10-03",
+                             end="2025-10-05") == sum(t["balance_after"] for t in window) / 100
+        assert analytics.count(account_id="ACC9999") == 0
+        assert analytics.mean(transaction_type="TRANSFER_IN") is None
+        assert analytics.sum(by="account", transaction_type="TRANSFER_IN") == {}
+
+        history_mod.data_manager.close()
+        cleanup_test_env(test_dir)
+
+    print("✅ 測試通過")
+
+
+def test_percentile():
+    """測試：百分位數與 numpy 直接計算相同，不合法的參數拋出 ValueError"""
+    print("測試：百分位數...")
+    if np is None:
+        print("⚠️ 未安裝 numpy，略過")
+        return
+    history_mod, test_dir = setup_test_env()
+    transactions = make_transactions(101)
+    history_mod.data_manager.save_transactions(transactions)
+    analytics = TransactionAnalytics(history_mod)
+
+    amounts = [t["amount"] for t in transactions]
+    assert analytics.percentile(50) == float(np.percentile(amounts, 50)) / 100
+    assert analytics.percentile(0) == min(amounts) / 100
+    assert analytics.percentile(100) == max(amounts) / 100
+    per_account = analytics.percentile(95, by="account", transaction_type="DEPOSIT")
+    for account_id, values in expected_groups(
+            [t for t in transactions if t["type"] == "DEPOSIT"], lambda t: t["account_id"]).items():
+        assert per_account[account_id] == float(np.percentile(values, 95)) / 100, f"❌ {account_id}"
+
+    for bad in (lambda: analytics.percentile(101), lambda: analytics.sum(by="week"),
+                lambda: analytics.sum(column="timestamp")):
+        try:
+            bad()
+            assert False, "❌ 應拋出 ValueError"
+        except ValueError:
+            pass
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_incremental_refresh():
+    """測試：新增交易後只讀入新增部分，整份覆寫後可重建"""
+    print("測試：增量載入...")
+    if np is None:
+        print("⚠️ 未安裝 numpy，略過")
+        return
+    for storage in ("json", "log", "sqlite"):
+        if storage == "sqlite":
+            history_mod, test_dir = setup_test_env(backend="sqlite")
+        else:
+            history_mod, test_dir = setup_test_env(transaction_storage=storage, segment_max_bytes=2000)
+        dm = history_mod.data_manager
+        dm.save_transactions(make_transactions(50))
+        analytics = TransactionAnalytics(history_mod)
+        assert analytics.refresh() == 50 and analytics.refresh() == 0, f"❌ {storage} 重複讀入"
+
+        # 追加的交易在下次查詢時自動讀入
+        for txn in make_transactions(30, start=51):
+            dm.append_transaction(txn)
+        assert analytics.count() == 80, f"❌ {storage} 應讀入新增交易"
+        assert len(analytics) == 80 and analytics.refresh() == 0
+        history_mod.log_transaction("ACC0004", "DEPOSIT", 12.5, 12.5)
+        assert analytics.sum(account_id="ACC0004") == 12.5
+        assert analytics.accounts[-1] == "ACC0004"
+
+        # 整份覆寫後位置失效，下次查詢自動重建
+        dm.save_transactions(make_transactions(10))
+        assert analytics.count() == 10, f"❌ {storage} 覆寫後應自動重建"
+        assert analytics.rebuild() == 10 and analytics.count() == 10, f"❌ {storage} 重建錯誤"
+
+        # 清空後再新增
+        dm.clear_all_data()
+        for n in range(1, 4):
+            history_mod.log_transaction("ACC0001", "DEPOSIT", 10.0, 10.0 * n)
+        assert analytics.count() == 3, f"❌ {storage} 清空後應只剩新增的交易"
+        assert analytics.sum() == 30.0 and analytics.accounts == ["ACC0001"]
+        dm.close()
+        cleanup_test_env(test_dir)
+
+    print("✅ 測試通過")
+
+
+# ==================== 執行所有測試 ====================
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("開始測試 Analytics")
+    print("=" * 50)
+    print()
+
+    test_grouped_aggregates()
+    test_percentile()
+    test_incremental_refresh()
+
+    print()
+    print("=" * 50)
+    print("測試完成！")
+    print("=" * 50)
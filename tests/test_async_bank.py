@@ -0,0 +1,209 @@
+"""
+Async Bank 測試
+負責人：整合者
+
+測試涵蓋：
+- 非同步存款、提款、轉帳、查詢
+- 錯誤處理
+- 寫入合併為批次
+- 同批中單筆格式錯誤或整批失敗時，只有出錯的請求收到例外
+- 相同查詢合併
+- 大量請求時事件迴圈不被阻塞
+"""
+
+import asyncio
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.data_manager import DataManager
+from modules.account import AccountModule
+from modules.history import HistoryModule
+from modules.transaction import TransactionModule
+from modules.async_bank import AsyncBank
+
+
+def setup_test_env(**kwargs):
+    """建立測試環境"""
+    test_dir = "test_data_async"
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    data_manager = DataManager(data_dir=test_dir)
+    account_mod = AccountModule(data_manager)
+    transaction_mod = TransactionModule(account_mod, HistoryModule(data_manager))
+    bank = AsyncBank(transaction_mod, **kwargs)
+    return bank, account_mod, test_dir
+
+
+def cleanup_test_env(test_dir):
+    """清理測試環境"""
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+
+# ==================== 測試案例 ====================
+
+def test_async_operations():
+    """測試：非同步存款、提款、轉帳與查詢"""
+    print("測試：非同步基本操作...")
+    bank, account_mod, test_dir = setup_test_env()
+    acc_a = account_mod.create_account("A", 1000.0)
+    acc_b = account_mod.create_account("B", 0.0)
+
+    async def scenario():
+        async with bank:
+            result = await bank.deposit(acc_a, 500.0)
+            assert result["success"] is True and result["new_balance"] == 1500.0
+            result = await bank.withdraw(acc_a, 200.0)
+            assert result["new_balance"] == 1300.0
+            result = await bank.transfer(acc_a, acc_b, 300.0)
+            assert result["from_balance"] == 1000.0 and result["to_balance"] == 300.0
+
+            for call, message in ((bank.withdraw(acc_b, 9999.0), "餘額不足"),
+                                  (bank.deposit("ACC9999", 1.0), "帳戶不存在"),
+                                  (bank.transfer(acc_a, acc_a, 1.0), "不能轉帳給自己")):
+                try:
+                    await call
+                    assert False, f"❌ 應拋出 ValueError: {message}"
+                except ValueError as e:
+                    assert message in str(e), f"❌ 錯誤訊息不符: {e}"
+
+            assert (await bank.get_account(acc_b))["balance"] == 300.0
+            assert await bank.get_account("ACC9999") is None
+            history = await bank.get_history(acc_a, 10)
+            assert len(history) == 3, "❌ 交易記錄筆數錯誤"
+
+    asyncio.run(scenario())
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_async_coalescing():
+    """測試：同時送出的寫入合併為少數批次，相同查詢只讀一次"""
+    print("測試：非同步請求合併...")
+    bank, account_mod, test_dir = setup_test_env()
+    account_id = account_mod.create_account("A", 0.0)
+
+    batch_sizes = []
+    original_apply_batch = bank.transaction.apply_batch
+    bank.transaction.apply_batch = lambda ops: (batch_sizes.append(len(ops)), original_apply_batch(ops))[1]
+
+    reads = []
+    original_get_account = bank.account.get_account
+    def slow_get_account(account_id):
+        reads.append(account_id)
+        time.sleep(0.05)
+        return original_get_account(account_id)
+
+    async def scenario():
+        async with bank:
+            results = await asyncio.gather(*(bank.deposit(account_id, 1.0) for _ in range(300)))
+            assert all(r["success"] for r in results)
+            bank.account.get_account = slow_get_account
+            accounts = await asyncio.gather(*(bank.get_account(account_id) for _ in range(100)))
+            assert all(a["balance"] == 300.0 for a in accounts)
+
+    asyncio.run(scenario())
+    bank.account.get_account = original_get_account
+    assert sum(batch_sizes) == 300, f"❌ 操作數錯誤: {batch_sizes}"
+    assert len(batch_sizes) <= 3, f"❌ 寫入應合併為少數批次: {batch_sizes}"
+    assert len(reads) == 1, f"❌ 相同查詢應合併: {len(reads)} 次讀取"
+    assert account_mod.get_account(account_id)["balance"] == 300.0
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_async_loop_not_blocked():
+    """測試：上千個請求進行中時事件迴圈仍能即時回應"""
+    print("測試：事件迴圈不被阻塞...")
+    bank, account_mod, test_dir = setup_test_env(max_workers=2)
+    ids = [account_mod.create_account(f"user{i}", 1000.0) for i in range(20)]
+
+    async def heartbeat(stop, gaps):
+        last = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    async def scenario():
+        stop, gaps = asyncio.Event(), []
+        beat = asyncio.ensure_future(heartbeat(stop, gaps))
+        async with bank:
+            requests = []
+            for i in range(2000):
+                account_id = ids[i % len(ids)]
+                requests.append(bank.deposit(account_id, 1.0) if i % 2 else bank.get_account(account_id))
+            await asyncio.gather(*requests)
+        stop.set()
+        await beat
+        return gaps
+
+    gaps = asyncio.run(scenario())
+    assert max(gaps) < 0.5, f"❌ 事件迴圈被阻塞 {max(gaps):.3f} 秒"
+    total = sum(account_mod.get_account(i)["balance"] for i in ids)
+    assert total == 20 * 1000.0 + 1000, f"❌ 總金額錯誤: {total}"
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_async_bad_request_isolated():
+    """測試：同批中單筆格式錯誤或讓 apply_batch 整批失敗時，其他請求照常完成"""
+    print("測試：單筆錯誤不影響同批請求...")
+    test_dir = "test_data_async"
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    data_manager = DataManager(data_dir=test_dir, account_shards=4)
+    account_mod = AccountModule(data_manager)
+    bank = AsyncBank(TransactionModule(account_mod, HistoryModule(data_manager)))
+    account_id = account_mod.create_account("Y", 10.0)
+
+    async def scenario():
+        async with bank:
+            first = await asyncio.gather(bank.deposit(account_id, 1.0), bank.deposit(None, 1.0),
+                                         bank.deposit(account_id, 2.0), return_exceptions=True)
+            # 讓合併後的整批拋出例外，只有單獨重做仍失敗的那筆收到例外
+            original_apply_batch = bank.transaction.apply_batch
+            def flaky_apply_batch(ops):
+                if any(op["amount"] == 13.0 for op in ops):
+                    raise OSError("模擬寫檔錯誤")
+                return original_apply_batch(ops)
+            bank.transaction.apply_batch = flaky_apply_batch
+            second = await asyncio.gather(bank.deposit(account_id, 4.0), bank.deposit(account_id, 13.0),
+                                          bank.deposit(account_id, 8.0), return_exceptions=True)
+            bank.transaction.apply_batch = original_apply_batch
+            return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first[0]["success"] and first[2]["success"], f"❌ 正常請求應成功: {first}"
+    assert isinstance(first[1], ValueError), f"❌ 格式錯誤應拋出 ValueError: {first[1]!r}"
+    assert second[0]["success"] and second[2]["success"], f"❌ 正常請求應成功: {second}"
+    assert isinstance(second[1], OSError), f"❌ 出錯的請求應收到例外: {second[1]!r}"
+    balance = account_mod.get_account(account_id)["balance"]
+    assert balance == 25.0, f"❌ 餘額錯誤: {balance}"
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+# ==================== 執行所有測試 ====================
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("開始測試 Async Bank")
+    print("=" * 50)
+    print()
+
+    test_async_operations()
+    test_async_coalescing()
+    test_async_loop_not_blocked()
+    test_async_bad_request_isolated()
+
+    print()
+    print("=" * 50)
+    print("測試完成！")
+    print("=" * 50)
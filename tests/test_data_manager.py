@@ -0,0 +1,915 @@
+"""
+DataManager 測試
+負責人：整合者
+
+測試涵蓋：
+- log 模式追加與讀取
+- transactions.json 轉換為 log 模式
+- 記憶體快取與檔案變更偵測
+- SQLite 後端與 JSON 匯入
+- SQLite 舊版金額欄位轉換
+- 原子儲存與群組提交（回傳前落盤）
+- 批次 rollback（log 模式不留下追加）
+- 程序內共用鎖檔與寫者優先
+- 重新 mmap 不影響進行中的讀取
+- 帳戶交易索引
+- ID 區段配置
+- 序列化格式
+- 交易位置表
+- 帳戶分片
+- 工作單元
+- 預寫日誌（WAL）當機復原與 checkpoint
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.data_manager import ConcurrentUpdateError, DataManager
+from modules.account import AccountModule
+from modules.history import HistoryModule
+from modules.sqlite_backend import SQLiteDataManager
+from modules.serialization import available_codecs
+
+
+def setup_test_env(**kwargs):
+    """建立測試環境"""
+    test_dir = "test_data_manager"
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    data_manager = DataManager(data_dir=test_dir, **kwargs)
+    return data_manager, test_dir
+
+
+def cleanup_test_env(test_dir):
+    """清理測試環境"""
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+
+def make_txn(n, account_id="ACC0001", txn_type="DEPOSIT"):
+    """建立測試用交易記錄"""
+    return {
+        "transaction_id": f"TXN{n:04d}",
+        "account_id": account_id,
+        "type": txn_type,
+        "amount": 100.0,
+        "balance_after": 100.0 * n,
+        "timestamp": f"2025-10-20T12:00:{n:02d}"
+    }
+
+
+# ==================== 測試案例 ====================
+
+def test_log_append_and_iter():
+    """測試：log 模式追加後可依序讀回"""
+    print("測試：log 模式追加...")
+    dm, test_dir = setup_test_env(transaction_storage="log", segment_max_bytes=300)
+
+    for n in range(1, 6):
+        assert dm.append_transaction(make_txn(n)) is True
+
+    # 小的分段上限會產生多個分段檔
+    assert len(os.listdir(dm.segment_dir)) > 1, "❌ 應該輪替分段檔"
+
+    # 重新開啟同一目錄，自動沿用 log 模式
+    reopened = DataManager(data_dir=test_dir)
+    ids = [txn["transaction_id"] for txn in reopened.iter_transactions()]
+    assert ids == [f"TXN{n:04d}" for n in range(1, 6)], "❌ 讀回順序錯誤"
+    assert len(reopened.load_transactions()) == 5
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_log_ignores_partial_line():
+    """測試：當機留下的殘行會被忽略並在重開時截掉"""
+    print("測試：log 殘行處理...")
+    dm, test_dir = setup_test_env(transaction_storage="log")
+    dm.append_transaction(make_txn(1))
+
+    with open(dm._segment_path(dm._active_segment), 'ab') as f:
+        f.write(b'{"transaction_id":"TXN0002","acc')
+
+    reopened = DataManager(data_dir=test_dir)
+    reopened.append_transaction(make_txn(3))
+    ids = [txn["transaction_id"] for txn in reopened.iter_transactions()]
+    assert ids == ["TXN0001", "TXN0003"], f"❌ 殘行應被截掉，實際: {ids}"
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_migrate_transactions_to_log():
+    """測試：transactions.json 一次性轉換"""
+    print("測試：轉換為 log 模式...")
+    dm, test_dir = setup_test_env()
+    dm.save_transactions([make_txn(1), make_txn(2)])
+
+    count = dm.migrate_transactions_to_log()
+
+    assert count == 2, "❌ 轉換筆數錯誤"
+    assert dm.transaction_storage == "log"
+    assert os.path.exists(dm.transactions_file + ".migrated"), "❌ 應保留備份"
+    dm.append_transaction(make_txn(3))
+
+    reopened = DataManager(data_dir=test_dir)
+    assert reopened.transaction_storage == "log"
+    assert len(reopened.load_transactions()) == 3
+    with open(reopened.config_file, encoding='utf-8') as f:
+        assert json.load(f)["transaction_storage"] == "log"
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_cache_avoids_reparse():
+    """測試：穩定狀態下重複讀取不會重新解析檔案"""
+    print("測試：快取命中...")
+    dm, test_dir = setup_test_env()
+    dm.save_accounts({"ACC0001": {"name": "A", "balance": 1.0}})
+
+    first = dm.load_accounts()
+    assert dm.load_accounts() is first, "❌ 應直接回傳快取物件"
+    assert dm.get_next_account_id() == 1
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_cache_detects_external_change():
+    """測試：其他程序修改檔案後，快取會重新載入"""
+    print("測試：快取失效...")
+    dm, test_dir = setup_test_env()
+    dm.save_accounts({"ACC0001": {"name": "A", "balance": 1.0}})
+    assert "ACC0001" in dm.load_accounts()
+
+    other = DataManager(data_dir=test_dir)
+    other.save_accounts({"ACC0002": {"name": "Bobby", "balance": 20.0}})
+
+    accounts = dm.load_accounts()
+    assert "ACC0002" in accounts and "ACC0001" not in accounts, "❌ 應讀到外部修改"
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_sqlite_backend():
+    """測試：backend="sqlite" 建立 SQLite 後端，模組 API 不變"""
+    print("測試：SQLite 後端...")
+    dm, test_dir = setup_test_env(backend="sqlite")
+    assert isinstance(dm, SQLiteDataManager), "❌ 應建立 SQLiteDataManager"
+
+    account_mod = AccountModule(dm)
+    history_mod = HistoryModule(dm)
+    acc = account_mod.create_account("張三", 1000.0)
+    assert account_mod.update_balance(acc, 1500.0) is True
+    history_mod.log_transaction(acc, "DEPOSIT", 500.0, 1500.0)
+    history_mod.log_transaction("ACC9999", "DEPOSIT", 1.0, 1.0)
+
+    assert account_mod.get_account(acc)["balance"] == 1500.0
+    assert len(history_mod.get_history(acc)) == 1
+    assert dm.get_next_transaction_id() == 3
+    dm.close()
+
+    # 重開時依 bank.db 自動選擇 SQLite
+    reopened = DataManager(data_dir=test_dir)
+    assert isinstance(reopened, SQLiteDataManager)
+    assert reopened.get_account(acc)["name"] == "張三"
+    reopened.close()
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_sqlite_import_json_data():
+    """測試：匯入既有 JSON 資料目錄"""
+    print("測試：匯入 JSON 資料...")
+    source, source_dir = setup_test_env()
+    AccountModule(source).create_account("李四", 300.0)
+    source.append_transaction(make_txn(1))
+    source.append_transaction(make_txn(2, txn_type="WITHDRAW"))
+
+    target_dir = source_dir + "_sqlite"
+    cleanup_test_env(target_dir)
+    target = DataManager(data_dir=target_dir, backend="sqlite")
+    closed = []
+    original_close = DataManager.close
+    DataManager.close = lambda self: (closed.append(self.data_dir), original_close(self))[1]
+    try:
+        result = target.import_json_data(source_dir)
+    finally:
+        DataManager.close = original_close
+    assert closed == [source_dir], f"❌ 匯入後應關閉來源: {closed}"
+
+    assert result == {"accounts": 1, "transactions": 2}, f"❌ 匯入數量錯誤: {result}"
+    assert target.get_account("ACC0001")["name"] == "李四"
+    assert [t["type"] for t in target.get_account_transactions("ACC0001")] == ["DEPOSIT", "WITHDRAW"]
+    assert target.get_next_account_id() > 1, "❌ 不應重複配發已使用的帳號"
+    target.close()
+
+    print("✅ 測試通過")
+    cleanup_test_env(source_dir)
+    cleanup_test_env(target_dir)
+
+
+def test_sqlite_legacy_money_migration():
+    """測試：舊版 REAL（元）欄位的資料庫開啟時轉為 INTEGER（分）"""
+    print("測試：SQLite 舊版金額欄位...")
+    test_dir = "test_data_manager_legacy"
+    cleanup_test_env(test_dir)
+    os.makedirs(test_dir)
+    conn = sqlite3.connect(os.path.join(test_dir, "bank.db"))
+    conn.executescript(
+        "CREATE TABLE accounts (account_id TEXT PRIMARY KEY, name TEXT NOT NULL, "
+        "balance REAL NOT NULL, created_date TEXT);"
+        "CREATE TABLE transactions (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "transaction_id TEXT NOT NULL UNIQUE, account_id TEXT NOT NULL, type TEXT NOT NULL, "
+        "amount REAL NOT NULL, balance_after REAL NOT NULL, related_account TEXT, "
+        "timestamp TEXT NOT NULL);"
+        "CREATE INDEX idx_transactions_account ON transactions (account_id);"
+        "INSERT INTO accounts VALUES ('ACC0001', 'A', 1234.56, NULL);"
+        "INSERT INTO transactions (transaction_id, account_id, type, amount, balance_after, timestamp) "
+        "VALUES ('TXN0001', 'ACC0001', 'DEPOSIT', 0.3, 1234.56, '2025-01-01T00:00:00');"
+    )
+    conn.commit()
+    conn.close()
+
+    dm = DataManager(data_dir=test_dir, backend="sqlite")
+    assert dm.get_account("ACC0001")["balance"] == 123456, "❌ 餘額應換算為分"
+    assert dm.get_account("ACC0001")["version"] == 0, "❌ 舊帳戶的版本號應為 0"
+    txn = dm.get_account_transactions("ACC0001")[0]
+    assert (txn["amount"], txn["balance_after"]) == (30, 123456)
+    assert AccountModule(dm).get_account("ACC0001")["balance"] == 1234.56
+    dm.close()
+
+    # 再次開啟不會重複換算
+    dm = DataManager(data_dir=test_dir, backend="sqlite")
+    assert dm.get_account("ACC0001")["balance"] == 123456
+    dm.close()
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_atomic_save_keeps_old_file_on_failure():
+    """測試：寫入中途失敗時，原檔保持完整"""
+    print("測試：原子儲存...")
+    dm, test_dir = setup_test_env()
+    dm.save_accounts({"ACC0001": {"name": "A", "balance": 1.0}})
+
+    class Unserializable:
+        pass
+
+    # json.dump 會在寫到一半時失敗
+    ok = dm.save_accounts({"ACC0001": {"name": "A", "balance": 2.0}, "ACC0002": Unserializable()})
+    assert ok is False, "❌ 應回報儲存失敗"
+
+    with open(dm.accounts_file, encoding='utf-8') as f:
+        assert json.load(f) == {"ACC0001": {"name": "A", "balance": 1.0}}, "❌ 原檔不應被截斷"
+    assert not [n for n in os.listdir(test_dir) if n.endswith(".tmp")], "❌ 不應留下暫存檔"
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_group_commit_coalesces_saves():
+    """測試：群組提交視窗內多個執行緒的儲存合併為一次寫入，回傳時已落盤"""
+    print("測試：群組提交...")
+    dm, test_dir = setup_test_env(group_commit_window=0.2)
+    with dm.batch():
+        for n in range(1, 9):
+            dm.add_account(f"ACC{n:04d}", {"name": f"U{n}", "balance": 0, "version": 0})
+
+    writes = []
+    original = dm._write_atomic
+    def counting_write(filepath, data):
+        writes.append(os.path.basename(filepath))
+        return original(filepath, data)
+    dm._write_atomic = counting_write
+
+    results = []
+    threads = [threading.Thread(target=lambda n=n: results.append(dm.update_balance(f"ACC{n:04d}", n)))
+               for n in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [True] * 8
+    assert writes.count("accounts.json") <= 2, f"❌ 同一視窗的儲存應合併寫入: {writes}"
+    # 回傳 True 時已落盤，不需要再呼叫 flush()
+    with open(dm.accounts_file, encoding='utf-8') as f:
+        assert [a["balance"] for a in json.load(f).values()] == list(range(1, 9)), "❌ 回傳前應已落盤"
+
+    assert dm.save_transactions([make_txn(1)]) is True
+    assert len(DataManager(data_dir=test_dir).load_transactions()) == 1
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_group_commit_survives_crash():
+    """測試：群組提交回傳成功後程序立即結束（不 flush、不 close），資料仍在"""
+    print("測試：群組提交落盤...")
+    for kwargs in ({"group_commit_window": 0.05},
+                   {"group_commit_window": 0.05, "transaction_storage": "log"},
+                   {"group_commit_window": 0.05, "wal": True}):
+        dm, test_dir = setup_test_env(**kwargs)
+        dm.add_account("ACC0001", {"name": "A", "balance": 0, "version": 0})
+        dm.close()
+
+        code = ("import os, sys; sys.path.insert(0, '.');"
+                "from modules.data_manager import DataManager\n"
+                "dm = DataManager(%r, **%r)\n"
+                "assert dm.update_balance('ACC0001', 500)\n"
+                "assert dm.append_transaction(%r)\n"
+                "os._exit(0)" % (os.path.abspath(test_dir), kwargs, make_txn(1)))
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        assert subprocess.run([sys.executable, "-c", code], cwd=root).returncode == 0
+
+        recovered = DataManager(data_dir=test_dir)
+        assert recovered.get_account("ACC0001")["balance"] == 500, f"❌ 已回傳的儲存應已落盤 ({kwargs})"
+        assert [t["transaction_id"] for t in recovered.load_transactions()] == ["TXN0001"]
+        recovered.close()
+        cleanup_test_env(test_dir)
+
+    print("✅ 測試通過")
+
+
+def test_batch_rollback_discards_log_appends():
+    """測試：log 模式批次失敗時，分段檔與索引都不留下批次內的交易"""
+    print("測試：批次 rollback 捨棄追加...")
+    for kwargs in ({}, {"group_commit_window": 0.05}):
+        dm, test_dir = setup_test_env(transaction_storage="log", **kwargs)
+        dm.append_transaction(make_txn(1))
+        try:
+            with dm.batch():
+                dm.append_transaction(make_txn(2))
+                raise RuntimeError("中途失敗")
+        except RuntimeError:
+            pass
+        assert [t["transaction_id"] for t in dm.load_transactions()] == ["TXN0001"], \
+            f"❌ rollback 後不應留下交易 ({kwargs})"
+        assert dm.get_transaction("TXN0002") is None
+        assert [t["transaction_id"] for t in dm.get_account_transactions("ACC0001")] == ["TXN0001"]
+
+        # 之後的追加接在原本的位置，重開後內容與索引一致
+        dm.append_transaction(make_txn(3))
+        dm.close()
+        reopened = DataManager(data_dir=test_dir)
+        assert [t["transaction_id"] for t in reopened.load_transactions()] == ["TXN0001", "TXN0003"]
+        assert [t["transaction_id"] for t in reopened.get_account_transactions("ACC0001")] == \
+            ["TXN0001", "TXN0003"], "❌ 索引不應包含 rollback 的交易"
+        assert reopened.get_transaction("TXN0003")["transaction_id"] == "TXN0003"
+        reopened.close()
+        cleanup_test_env(test_dir)
+
+    print("✅ 測試通過")
+
+
+def test_account_index():
+    """測試：帳戶索引只讀取該帳戶的記錄，並可重建與補齊"""
+    print("測試：帳戶索引...")
+    dm, test_dir = setup_test_env(transaction_storage="log", segment_max_bytes=400)
+    for n in range(1, 11):
+        dm.append_transaction(make_txn(n, account_id="ACC0001" if n % 3 == 0 else "ACC0002"))
+
+    expected = ["TXN0003", "TXN0006", "TXN0009"]
+    ids = [t["transaction_id"] for t in dm.get_account_transactions("ACC0001")]
+    assert ids == expected, f"❌ 索引查詢錯誤: {ids}"
+    assert dm.get_account_transactions("ACC0404") == []
+
+    # 索引落後 log（例如寫入索引前當機）：重開時補齊
+    with open(dm.account_index_file, encoding='utf-8') as f:
+        lines = f.readlines()
+    with open(dm.account_index_file, 'w', encoding='utf-8') as f:
+        f.writelines(lines[:4])
+    reopened = DataManager(data_dir=test_dir)
+    ids = [t["transaction_id"] for t in reopened.get_account_transactions("ACC0001")]
+    assert ids == expected, f"❌ 索引應補齊: {ids}"
+
+    # 索引遺失：從 log 重建
+    os.remove(dm.account_index_file)
+    reopened = DataManager(data_dir=test_dir)
+    assert len(reopened.get_account_transactions("ACC0002")) == 7
+
+    # 舊格式索引（沒有類型欄）：重建後可用 (帳號, 類型) 複合索引查詢
+    with open(dm.account_index_file, encoding='utf-8') as f:
+        lines = f.readlines()
+    with open(dm.account_index_file, 'w', encoding='utf-8') as f:
+        f.writelines(line.rsplit("\t", 1)[0] + "\n" for line in lines)
+    reopened = DataManager(data_dir=test_dir)
+    ids = [t["transaction_id"] for t in reopened.get_account_transactions("ACC0001", "DEPOSIT")]
+    assert ids == expected, f"❌ 舊格式索引應重建: {ids}"
+    assert reopened.get_account_transactions("ACC0001", "WITHDRAW") == []
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_id_block_allocation():
+    """測試：ID 以區段預留，一次寫檔可配發多個 ID，重啟後不重複，關閉時歸還未用完的區段"""
+    print("測試：ID 區段配置...")
+    dm, test_dir = setup_test_env(id_block_size=3)
+
+    assert [dm.allocate_transaction_id() for _ in range(4)] == [1, 2, 3, 4]
+    with open(dm.config_file, encoding='utf-8') as f:
+        assert json.load(f)["next_transaction_id"] == 7, "❌ 應預留兩段"
+
+    # 重啟：未用完的 5、6 被跳過
+    reopened = DataManager(data_dir=test_dir, id_block_size=3)
+    assert reopened.allocate_transaction_id() == 7
+    assert dm.allocate_transaction_id() == 5, "❌ 原實例仍使用自己的區段"
+
+    # 超過 4 位數
+    config = reopened._load_json(reopened.config_file)
+    config["next_account_id"] = 9999
+    reopened._save_json(reopened.config_file, config)
+    ids = [f"ACC{reopened.allocate_account_id():04d}" for _ in range(2)]
+    assert ids == ["ACC9999", "ACC10000"], f"❌ 帳號格式錯誤: {ids}"
+
+    # 關閉時歸還未用完的區段；之後已被其他實例預留的區段不歸還
+    dm.close()
+    reopened.close()
+    config = reopened._load_json(reopened.config_file)
+    assert config["next_transaction_id"] == 8, f"❌ 應歸還 8、9: {config}"
+    assert config["next_account_id"] == 10001, f"❌ 應歸還 10001: {config}"
+    dm = DataManager(data_dir=test_dir)
+    assert dm.allocate_transaction_id() == 8 and dm.allocate_account_id() == 10001
+    dm.close()
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_codecs_round_trip():
+    """測試：每種可用格式都能寫入並讀回"""
+    print("測試：序列化格式...")
+    accounts = {"ACC0001": {"name": "張三", "balance": 12.5, "created_date": None}}
+    for codec in available_codecs():
+        dm, test_dir = setup_test_env(codec=codec)
+        dm.save_accounts(accounts)
+        dm.save_transactions([make_txn(1)])
+
+        reopened = DataManager(data_dir=test_dir)
+        assert reopened.codec.name == codec, f"❌ 應沿用 config 設定: {codec}"
+        assert reopened.load_accounts() == accounts, f"❌ {codec} 讀回內容不同"
+        assert reopened.load_transactions() == [make_txn(1)]
+        cleanup_test_env(test_dir)
+
+    print("✅ 測試通過")
+
+
+def test_codec_mixed_directory():
+    """測試：同一目錄混用不同格式時，依檔頭正確讀取"""
+    print("測試：混用格式...")
+    dm, test_dir = setup_test_env(codec="marshal")
+    dm.save_accounts({"ACC0001": {"name": "A", "balance": 1.0}})
+    with open(dm.accounts_file, 'rb') as f:
+        assert f.read().startswith(b"SBS1 marshal\n"), "❌ 二進位格式應有檔頭"
+
+    # 換成 compact JSON：舊的 marshal 檔仍可讀，下次儲存改寫為新格式
+    compact = DataManager(data_dir=test_dir, codec="json-compact")
+    assert compact.get_account("ACC0001")["name"] == "A"
+    compact.update_balance("ACC0001", 2.0)
+    with open(compact.accounts_file, encoding='utf-8') as f:
+        assert json.load(f)["ACC0001"]["balance"] == 2.0
+    # config.json 維持可讀的 JSON
+    with open(compact.config_file, encoding='utf-8') as f:
+        assert json.load(f)["codec"] == "json-compact"
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_offset_table_rebuild():
+    """測試：交易位置表遺失時從 log 重建，空號查不到"""
+    print("測試：交易位置表...")
+    dm, test_dir = setup_test_env(transaction_storage="log", segment_max_bytes=300)
+    for n in (1, 2, 5, 1200):
+        dm.append_transaction(make_txn(n))
+    dm.close()
+
+    os.remove(dm.offset_table_file)
+    reopened = DataManager(data_dir=test_dir)
+    assert reopened.get_transaction("TXN1200")["balance_after"] == 120000.0
+    assert reopened.get_transaction("TXN0005")["transaction_id"] == "TXN0005"
+    assert reopened.get_transaction("TXN0003") is None, "❌ 空號應回傳 None"
+    assert reopened.get_account_transactions("ACC0001")[-1]["transaction_id"] == "TXN1200"
+    reopened.close()
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_account_shards():
+    """測試：分片後更新餘額只重寫一個分片，重新分片不遺失帳戶"""
+    print("測試：帳戶分片...")
+    dm, test_dir = setup_test_env(account_shards=4)
+    account_mod = AccountModule(dm)
+    ids = [account_mod.create_account(f"user{n}", 100.0) for n in range(20)]
+
+    shard_files = sorted(os.listdir(dm.shard_dir))
+    assert len(shard_files) == 4, f"❌ 應有 4 個分片檔: {shard_files}"
+    sizes = [len(dm._load_json(os.path.join(dm.shard_dir, name))) for name in shard_files]
+    assert sum(sizes) == 20 and max(sizes) < 20, f"❌ 帳戶應分散到各分片: {sizes}"
+
+    target = ids[0]
+    before = {name: os.stat(os.path.join(dm.shard_dir, name)).st_mtime_ns for name in shard_files}
+    account_mod.update_balance(target, 250.0)
+    changed = [name for name in shard_files
+               if os.stat(os.path.join(dm.shard_dir, name)).st_mtime_ns != before[name]]
+    assert changed == [os.path.basename(dm._account_file(target))], f"❌ 只應重寫一個分片: {changed}"
+
+    # 跨分片更新
+    other = next(i for i in ids if dm._shard_of(i) != dm._shard_of(target))
+    assert dm.update_balance(target, 200.0) and dm.update_balance(other, 150.0)
+
+    # 重新分片為 3，再合併回單一檔案
+    resharded = DataManager(data_dir=test_dir, account_shards=3)
+    assert len(os.listdir(resharded.shard_dir)) == 3, "❌ 舊分片檔應刪除"
+    assert resharded.get_account(target)["balance"] == 200.0
+    merged = DataManager(data_dir=test_dir, account_shards=1)
+    accounts = merged.load_accounts()
+    assert len(accounts) == 20 and accounts[other]["balance"] == 150.0
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_unit_of_work_rollback():
+    """測試：工作單元失敗時整批捨棄，成功時每個檔案只寫一次"""
+    print("測試：工作單元...")
+    for storage in ("json", "log"):
+        dm, test_dir = setup_test_env(transaction_storage=storage)
+        dm.add_account("ACC0001", {"name": "A", "balance": 100.0})
+        dm.add_account("ACC0002", {"name": "B", "balance": 0.0})
+
+        # 區塊內拋出例外：什麼都不寫
+        try:
+            with dm.unit_of_work() as uow:
+                uow.update_balance("ACC0001", 40.0)
+                uow.append_transaction(make_txn(1))
+                raise RuntimeError("中途失敗")
+        except RuntimeError:
+            pass
+        assert dm.get_account("ACC0001")["balance"] == 100.0, "❌ 失敗後不應改變餘額"
+        assert dm.load_transactions() == [], "❌ 失敗後不應有交易"
+
+        # 套用時寫入失敗：已更新的餘額也要捨棄
+        original = dm.append_transactions
+        dm.append_transactions = lambda transactions: False
+        try:
+            with dm.unit_of_work() as uow:
+                uow.update_balance("ACC0001", 40.0)
+                uow.append_transaction(make_txn(1))
+            assert False, "❌ 應拋出 OSError"
+        except OSError:
+            pass
+        dm.append_transactions = original
+        assert dm.get_account("ACC0001")["balance"] == 100.0, "❌ 寫入失敗後應回復餘額"
+        dm.invalidate_cache()
+        assert dm.get_account("ACC0001")["balance"] == 100.0, "❌ 檔案不應被修改"
+
+        # 成功：每個檔案一次寫入
+        writes = []
+        original_write = dm._write_atomic
+        dm._write_atomic = lambda filepath, data: (writes.append(os.path.basename(filepath)),
+                                                   original_write(filepath, data))
+        with dm.unit_of_work() as uow:
+            uow.update_balance("ACC0001", 40.0)
+            uow.update_balance("ACC0002", 60.0)
+            uow.append_transaction(make_txn(1))
+            uow.append_transaction(make_txn(2, "ACC0002"))
+        assert writes.count("accounts.json") == 1, f"❌ 帳戶檔應只寫一次: {writes}"
+        assert writes.count("transactions.json") == (1 if storage == "json" else 0), f"❌ {writes}"
+        dm.invalidate_cache()
+        assert dm.get_account("ACC0002")["balance"] == 60.0
+        assert [t["transaction_id"] for t in dm.load_transactions()] == ["TXN0001", "TXN0002"]
+        dm.close()
+        cleanup_test_env(test_dir)
+
+    print("✅ 測試通過")
+
+
+def test_unit_of_work_concurrent_shards():
+    """測試：不同分片的工作單元同時提交（只鎖定涉及的檔案，不經過全域批次）"""
+    print("測試：工作單元並行提交...")
+    dm, test_dir = setup_test_env(account_shards=8)
+    by_shard = {}
+    n = 0
+    while len(by_shard) < 4:
+        n += 1
+        by_shard.setdefault(dm._shard_of(f"ACC{n:04d}"), f"ACC{n:04d}")
+    account_ids = list(by_shard.values())
+    for account_id in account_ids:
+        dm.add_account(account_id, {"name": "U", "balance": 0, "version": 0})
+
+    active, peak = [0], [0]
+    guard = threading.Lock()
+    original = dm._write_atomic
+    def slow_write(filepath, data):
+        if os.path.basename(filepath).startswith("shard_"):
+            with guard:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with guard:
+                active[0] -= 1
+        return original(filepath, data)
+    dm._write_atomic = slow_write
+
+    def commit(n, account_id):
+        with dm.unit_of_work() as uow:
+            uow.update_balance(account_id, 100, expected_version=0)
+            uow.append_transaction(make_txn(n, account_id))
+    threads = [threading.Thread(target=commit, args=(n, account_id))
+               for n, account_id in enumerate(account_ids, 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] > 1, "❌ 不同分片的工作單元應能同時寫入"
+    dm.invalidate_cache()
+    assert all(dm.get_account(a)["balance"] == 100 for a in account_ids)
+    assert sorted(t["transaction_id"] for t in dm.load_transactions()) == \
+        [f"TXN{n:04d}" for n in range(1, len(account_ids) + 1)]
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_wal_crash_recovery():
+    """測試：WAL 已提交、主檔尚未寫入時當機，重新開啟後重播"""
+    print("測試：WAL 當機復原...")
+    for storage in ("json", "log"):
+        dm, test_dir = setup_test_env(transaction_storage=storage, wal=True)
+        dm.add_account("ACC0001", {"name": "A", "balance": 10000, "version": 0})
+        dm.add_account("ACC0002", {"name": "B", "balance": 0, "version": 0})
+        with dm.unit_of_work() as uow:
+            uow.update_balance("ACC0001", 6000, expected_version=0)
+            uow.update_balance("ACC0002", 4000, expected_version=0)
+            uow.append_transaction(make_txn(1))
+            uow.append_transaction(make_txn(2, "ACC0002"))
+        dm.delete_account("ACC0002")
+
+        # 主檔延後寫入：磁碟上的 accounts.json 仍是初始內容
+        with open(dm.accounts_file, encoding='utf-8') as f:
+            assert json.load(f) == {}, "❌ checkpoint 前不應寫入主檔"
+        # 模擬當機：不 close（只放掉本程序的鎖），WAL 尾端留下寫到一半的記錄
+        dm.locks.close()
+        with open(dm.wal_file, 'ab') as f:
+            f.write(b'0badc0de [{"op":"delete_account","account_id":"ACC0001"')
+
+        recovered = DataManager(data_dir=test_dir)
+        assert recovered.get_account("ACC0001")["balance"] == 6000, "❌ 應重播餘額變更"
+        assert recovered.get_account("ACC0001")["version"] == 1
+        assert recovered.get_account("ACC0002") is None, "❌ 應重播刪除"
+        assert [t["transaction_id"] for t in recovered.load_transactions()] == ["TXN0001", "TXN0002"]
+        assert os.path.getsize(recovered.wal_file) == 0, "❌ 復原後應清空 WAL"
+
+        # 重播為冪等：主檔已包含變更時再重播一次，交易不重複
+        payload = json.dumps([{"op": "append_transactions",
+                               "transactions": [make_txn(2, "ACC0002")]}]).encode()
+        with open(dm.wal_file, 'wb') as f:
+            f.write(b"%08x %s\n" % (zlib.crc32(payload), payload))
+        again = DataManager(data_dir=test_dir)
+        assert len(again.load_transactions()) == 2, "❌ 重播不應重複新增交易"
+        again.close()
+        recovered.close()
+
+        # 交易已追加、WAL 尚未提交時當機：重開後交易與餘額變更都不應出現
+        code = ("import os, sys; sys.path.insert(0, '.');"
+                "from modules.data_manager import DataManager\n"
+                "dm = DataManager(%r, wal=True)\n"
+                "dm._wal_commit = lambda: os._exit(0)\n"
+                "with dm.unit_of_work() as uow:\n"
+                "    uow.update_balance('ACC0001', 9000)\n"
+                "    uow.append_transaction(%r)\n"
+                "sys.exit(1)" % (os.path.abspath(test_dir), make_txn(3)))
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        assert subprocess.run([sys.executable, "-c", code], cwd=root).returncode == 0
+        crashed = DataManager(data_dir=test_dir)
+        assert crashed.get_account("ACC0001")["balance"] == 6000, "❌ 未提交的餘額不應出現"
+        assert [t["transaction_id"] for t in crashed.load_transactions()] == ["TXN0001", "TXN0002"], \
+            "❌ 未提交的交易不應出現在分段檔"
+        crashed.close()
+        cleanup_test_env(test_dir)
+
+    print("✅ 測試通過")
+
+
+def test_wal_checkpoint_and_rollback():
+    """測試：WAL 超過上限時 checkpoint，批次失敗時保留已提交的變更"""
+    print("測試：WAL checkpoint...")
+    dm, test_dir = setup_test_env(wal=True, wal_checkpoint_bytes=2000)
+    dm.add_account("ACC0001", {"name": "A", "balance": 0, "version": 0})
+    for n in range(1, 101):
+        dm.update_balance("ACC0001", n)
+        assert os.path.getsize(dm.wal_file) < 2000 + 200, "❌ WAL 應定期截斷"
+    with open(dm.accounts_file, encoding='utf-8') as f:
+        assert json.load(f)["ACC0001"]["balance"] > 0, "❌ checkpoint 應寫入主檔"
+
+    # 批次失敗：只捨棄本批次，先前已提交（尚未 checkpoint）的變更仍在
+    try:
+        with dm.batch():
+            dm.update_balance("ACC0001", -1)
+            raise RuntimeError("中途失敗")
+    except RuntimeError:
+        pass
+    assert dm.get_account("ACC0001")["balance"] == 100, "❌ 應回到最後一次提交的內容"
+    try:
+        with dm.unit_of_work() as uow:
+            uow.update_balance("ACC0001", -1, expected_version=0)
+        assert False, "❌ 應拋出 ConcurrentUpdateError"
+    except ConcurrentUpdateError:
+        pass
+    assert dm.get_account("ACC0001")["version"] == 100
+
+    # WAL 模式獨佔資料目錄
+    code = ("import sys; sys.path.insert(0, '.');"
+            "from modules.data_manager import DataManager\n"
+            "try:\n    DataManager(%r)\nexcept OSError:\n    sys.exit(3)" % os.path.abspath(test_dir))
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    assert subprocess.run([sys.executable, "-c", code], cwd=root).returncode == 3, \
+        "❌ 其他程序不應能開啟 WAL 模式的目錄"
+    # 同一程序內也一樣，且開啟失敗不影響原本的實例
+    try:
+        DataManager(data_dir=test_dir)
+        assert False, "❌ 同一程序內也不應能開啟 WAL 模式的目錄"
+    except OSError:
+        pass
+    dm.update_balance("ACC0001", 100)
+    assert dm.get_account("ACC0001")["version"] == 101
+
+    assert dm.checkpoint() is True
+    assert os.path.getsize(dm.wal_file) == 0
+    with open(dm.accounts_file, encoding='utf-8') as f:
+        assert json.load(f)["ACC0001"]["balance"] == 100
+    dm.close()
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_shared_lock_file_per_process():
+    """測試：同一程序內的多個實例共用鎖檔狀態，close() 只釋放自己持有的區域"""
+    print("測試：程序內共用鎖檔...")
+    first, test_dir = setup_test_env()
+    second = DataManager(data_dir=test_dir)
+    second.close()
+    # first 的共用登記仍在：WAL 模式（需獨佔）無法開啟
+    try:
+        DataManager(data_dir=test_dir, wal=True)
+        assert False, "❌ 關閉另一個實例不應釋放 first 的登記"
+    except OSError:
+        pass
+
+    first.locks.acquire(3)
+    assert first.locks.acquire(3, blocking=False) is False, "❌ 同一區域應互斥"
+    other = DataManager(data_dir=test_dir)
+    assert other.locks.acquire(3, blocking=False) is False, "❌ 同一程序的其他實例也應互斥"
+    other.close()
+    first.locks.release(3)
+    first.close()
+
+    wal = DataManager(data_dir=test_dir, wal=True)
+    wal.close()
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_readers_do_not_starve_writers():
+    """測試：持續的讀取（共用鎖）不會讓寫入（獨佔鎖）一直等不到"""
+    print("測試：寫者優先...")
+    dm, test_dir = setup_test_env(transaction_storage="log")
+    dm.add_account("ACC0001", {"name": "A", "balance": 0, "version": 0})
+    dm.append_transaction(make_txn(1))
+    history = HistoryModule(dm)
+    stop = threading.Event()
+    region = 7
+
+    def read_history():
+        while not stop.is_set():
+            history.get_history("ACC0001", 5)
+
+    def hold_shared():
+        # 讀者的共用鎖彼此重疊，區域一直有人持有
+        while not stop.is_set():
+            with dm.locks.shared(region):
+                time.sleep(0.001)
+
+    readers = [threading.Thread(target=read_history) for _ in range(4)]
+    readers += [threading.Thread(target=hold_shared) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    try:
+        def write():
+            for n in range(2, 52):
+                assert dm.append_transaction(make_txn(n))
+            for _ in range(20):
+                with dm.locks.exclusive(region):
+                    pass
+
+        writer = threading.Thread(target=write)
+        started = time.monotonic()
+        writer.start()
+        writer.join(timeout=10)
+        assert not writer.is_alive(), "❌ 寫入被讀者餓死"
+        assert time.monotonic() - started < 10
+    finally:
+        stop.set()
+        for thread in readers:
+            thread.join()
+    assert len(history.get_history("ACC0001", 100)) == 51
+
+    print("✅ 測試通過")
+    dm.close()
+    cleanup_test_env(test_dir)
+
+
+def test_mmap_remap_concurrent_readers():
+    """測試：分段檔變長後重新 mmap，不會關掉其他執行緒正在讀取的 mmap"""
+    print("測試：mmap 並行讀取...")
+    dm, test_dir = setup_test_env(transaction_storage="log")
+    dm.add_account("ACC0001", {"name": "A", "balance": 0, "version": 0})
+    dm.append_transaction(make_txn(1))
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        try:
+            while not stop.is_set():
+                for txn in dm.get_account_transactions("ACC0001"):
+                    assert dm.get_transaction(txn["transaction_id"]) is not None
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    try:
+        for n in range(2, 502):
+            assert dm.append_transaction(make_txn(n))
+    finally:
+        stop.set()
+        for thread in readers:
+            thread.join()
+    assert not errors, f"❌ 讀取時發生錯誤: {errors[0]!r}"
+    assert dm.get_transaction("TXN0500")["balance_after"] == 50000.0
+
+    print("✅ 測試通過")
+    dm.close()
+    cleanup_test_env(test_dir)
+
+
+# ==================== 執行所有測試 ====================
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("開始測試 DataManager")
+    print("=" * 50)
+    print()
+
+    test_log_append_and_iter()
+    test_log_ignores_partial_line()
+    test_migrate_transactions_to_log()
+    test_cache_avoids_reparse()
+    test_cache_detects_external_change()
+    test_sqlite_backend()
+    test_sqlite_import_json_data()
+    test_sqlite_legacy_money_migration()
+    test_atomic_save_keeps_old_file_on_failure()
+    test_group_commit_coalesces_saves()
+    test_group_commit_survives_crash()
+    test_batch_rollback_discards_log_appends()
+    test_account_index()
+    test_id_block_allocation()
+    test_codecs_round_trip()
+    test_codec_mixed_directory()
+    test_offset_table_rebuild()
+    test_account_shards()
+    test_unit_of_work_rollback()
+    test_unit_of_work_concurrent_shards()
+    test_wal_crash_recovery()
+    test_wal_checkpoint_and_rollback()
+    test_shared_lock_file_per_process()
+    test_readers_do_not_starve_writers()
+    test_mmap_remap_concurrent_readers()
+
+    print()
+    print("=" * 50)
+    print("測試完成！")
+    print("=" * 50)
@@ -7,6 +7,10 @@ History Module 測試
 - 查詢交易記錄
 - 按類型查詢
 - 限制筆數
+- 依交易 ID 查詢
+- 串流走訪全部交易
+- 游標分頁
+- 時間區間查詢
 """
 
 import os
@@ -19,13 +23,13 @@ from modules.data_manager import DataManager
 from modules.history import HistoryModule
 
 
-def setup_test_env():
+def setup_test_env(**kwargs):
     """建立測試環境"""
     test_dir = "test_data_history"
     if os.path.exists(test_dir):
         shutil.rmtree(test_dir)
     
-    data_manager = DataManager(data_dir=test_dir)
+    data_manager = DataManager(data_dir=test_dir, **kwargs)
     history_mod = HistoryModule(data_manager)
     return history_mod, test_dir
 
@@ -79,48 +83,254 @@ def test_get_history():
     cleanup_test_env(test_dir)
 
 
-# ========== [留白] 請組員C補充以下測試 ==========
+def test_get_transaction():
+    """測試：依交易 ID 查詢單筆交易（json 與 log 模式）"""
+    print("測試：依交易 ID 查詢...")
+    for storage in ("json", "log"):
+        history_mod, test_dir = setup_test_env(transaction_storage=storage)
+        
+        ids = [history_mod.log_transaction("ACC0001", "DEPOSIT", 100.0 * n, 100.0 * n)
+               for n in range(1, 4)]
+        
+        txn = history_mod.get_transaction(ids[1])
+        assert txn is not None, f"❌ {storage}: 應查詢到交易"
+        assert txn["transaction_id"] == ids[1] and txn["amount"] == 200.0
+        
+        # 查詢後再新增的交易也查得到
+        new_id = history_mod.log_transaction("ACC0002", "WITHDRAW", 50.0, 0.0)
+        assert history_mod.get_transaction(new_id)["account_id"] == "ACC0002"
+        
+        assert history_mod.get_transaction("TXN9999") is None, "❌ 不存在應回傳 None"
+        assert history_mod.get_transaction("ABC") is None, "❌ 格式錯誤應回傳 None"
+        history_mod.data_manager.close()
+        cleanup_test_env(test_dir)
+    
+    print("✅ 測試通過")
+
+
+def test_iter_transactions():
+    """測試：串流走訪支援篩選與時間區間，get_all_transactions 回傳全部"""
+    print("測試：串流走訪交易...")
+    history_mod, test_dir = setup_test_env()
+    dm = history_mod.data_manager
+    dm.save_transactions([
+        {"transaction_id": f"TXN{n:04d}", "account_id": "ACC0001",
+         "type": "DEPOSIT" if n % 2 else "WITHDRAW", "amount": float(n),
+         "balance_after": 0.0, "timestamp": f"2025-10-{n:02d}T12:00:00"}
+        for n in range(1, 11)
+    ])
+    dm.invalidate_cache()
+    
+    ids = [t["transaction_id"] for t in history_mod.iter_transactions(
+        filter=lambda t: t["type"] == "WITHDRAW",
+        start="2025-10-03", end="2025-10-09")]
+    assert ids == ["TXN0004", "TXN0006", "TXN0008"], f"❌ 篩選結果錯誤: {ids}"
+    assert len(history_mod.get_all_transactions()) == 10
+    
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_iter_json_array_small_chunks():
+    """測試：增量解析器在極小的讀取區塊下仍正確（元素跨區塊）"""
+    print("測試：增量解析 JSON 陣列...")
+    history_mod, test_dir = setup_test_env()
+    dm = history_mod.data_manager
+    transactions = [
+        {"transaction_id": f"TXN{n:04d}", "account_id": "ACC0001", "type": "DEPOSIT",
+         "amount": n * 1.5, "balance_after": 12345, "timestamp": "2025-10-20T12:00:00", "note": "存款"}
+        for n in range(1, 20)
+    ]
+    dm.save_transactions(transactions)
+    
+    assert list(dm._iter_json_array(dm.transactions_file, chunk_size=7)) == transactions
+    dm.save_transactions([])
+    assert list(dm._iter_json_array(dm.transactions_file, chunk_size=1)) == []
+    
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
 
 def test_get_history_with_limit():
-    """
-    [留白] TODO: 請實作此測試
-    
-    測試目標：
-    1. 記錄 5 筆交易到同一個帳戶
-    2. 使用 get_history(account_id, limit=3)
-    3. 驗證只返回 3 筆
-    4. 驗證返回的是最新的 3 筆
-    """
+    """測試：限制返回筆數，返回最新的幾筆，且只讀取需要的記錄"""
     print("測試：限制返回筆數...")
-    # TODO: 請實作
-    pass
+    for storage in ("json", "log", "sqlite"):
+        if storage == "sqlite":
+            history_mod, test_dir = setup_test_env(backend="sqlite")
+        else:
+            history_mod, test_dir = setup_test_env(transaction_storage=storage)
+        for n in range(1, 6):
+            history_mod.log_transaction("ACC0001", "DEPOSIT", 100.0 * n, 100.0 * n)
+        history_mod.log_transaction("ACC0002", "DEPOSIT", 1.0, 1.0)
+        
+        history = history_mod.get_history("ACC0001", limit=3)
+        assert [t["amount"] for t in history] == [500.0, 400.0, 300.0], \
+            f"❌ {storage}: 應返回最新的 3 筆: {history}"
+        assert len(history_mod.get_history("ACC0001", limit=0)) == 5, "❌ limit=0 應返回全部"
+        
+        if storage == "log":
+            # 由尾端往回讀：只解析 limit 筆記錄
+            dm = history_mod.data_manager
+            reads = []
+            original = dm._read_mapped
+            dm._read_mapped = lambda position: (reads.append(position), original(position))[1]
+            history_mod.get_history("ACC0001", limit=2)
+            dm._read_mapped = original
+            assert len(reads) == 2, f"❌ 應只讀取 2 筆: {len(reads)}"
+        history_mod.data_manager.close()
+        cleanup_test_env(test_dir)
+    
+    print("✅ 測試通過")
 
 
 def test_get_history_empty():
-    """
-    [留白] TODO: 請實作此測試
-    
-    測試目標：
-    1. 查詢一個沒有任何交易的帳戶
-    2. 應該返回空列表
-    """
+    """測試：查詢沒有任何交易的帳戶返回空列表"""
     print("測試：查詢空記錄...")
-    # TODO: 請實作
-    pass
+    history_mod, test_dir = setup_test_env()
+    history_mod.log_transaction("ACC0001", "DEPOSIT", 100.0, 100.0)
+    
+    assert history_mod.get_history("ACC0404") == [], "❌ 應返回空列表"
+    assert history_mod.get_history_by_type("ACC0404", "DEPOSIT") == []
+    
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
 
 
 def test_get_history_by_type():
-    """
-    [留白] TODO: 請實作此測試
-    
-    測試目標：
-    1. 記錄多種類型的交易（DEPOSIT, WITHDRAW等）
-    2. 使用 get_history_by_type() 只查詢 DEPOSIT
-    3. 驗證返回的都是 DEPOSIT 類型
-    """
+    """測試：按類型查詢只返回該類型，最新的在前"""
     print("測試：按類型查詢...")
-    # TODO: 請實作
-    pass
+    for storage in ("json", "log", "sqlite"):
+        if storage == "sqlite":
+            history_mod, test_dir = setup_test_env(backend="sqlite")
+        else:
+            history_mod, test_dir = setup_test_env(transaction_storage=storage)
+        history_mod.log_transaction("ACC0001", "DEPOSIT", 500.0, 500.0)
+        history_mod.log_transaction("ACC0001", "WITHDRAW", 100.0, 400.0)
+        history_mod.log_transaction("ACC0001", "DEPOSIT", 50.0, 450.0)
+        history_mod.log_transaction("ACC0001", "TRANSFER_OUT", 50.0, 400.0, "ACC0002")
+        history_mod.log_transaction("ACC0002", "DEPOSIT", 9.0, 9.0)
+        
+        deposits = history_mod.get_history_by_type("ACC0001", "DEPOSIT")
+        assert [t["amount"] for t in deposits] == [50.0, 500.0], f"❌ {storage}: {deposits}"
+        assert all(t["type"] == "DEPOSIT" for t in deposits)
+        assert len(history_mod.get_history_by_type("ACC0001", "DEPOSIT", limit=1)) == 1
+        assert history_mod.get_history_by_type("ACC0001", "TRANSFER_IN") == []
+        try:
+            history_mod.get_history_by_type("ACC0001", "WITHDRAWAL")
+            assert False, "❌ 不合法的類型應拋出 ValueError"
+        except ValueError:
+            pass
+        
+        if storage == "log":
+            # 複合索引：只讀取符合類型的記錄；重新開啟後由索引檔載入
+            dm = history_mod.data_manager
+            reads = []
+            original = dm._read_at
+            dm._read_at = lambda positions: (reads.extend(positions), original(positions))[1]
+            dm.get_account_transactions("ACC0001", "WITHDRAW")
+            dm._read_at = original
+            assert len(reads) == 1, f"❌ 應只讀取 1 筆: {len(reads)}"
+            reopened = DataManager(data_dir=test_dir)
+            assert [t["amount"] for t in reopened.get_account_transactions("ACC0001", "DEPOSIT")] == [50000, 5000]
+            reopened.close()
+        history_mod.data_manager.close()
+        cleanup_test_env(test_dir)
+    
+    print("✅ 測試通過")
+
+
+def test_get_history_pagination():
+    """測試：游標分頁依序取得全部記錄，翻頁期間新增交易不影響頁面"""
+    print("測試：游標分頁...")
+    for storage in ("json", "log", "sqlite"):
+        if storage == "sqlite":
+            history_mod, test_dir = setup_test_env(backend="sqlite")
+        else:
+            history_mod, test_dir = setup_test_env(transaction_storage=storage)
+        ids = [history_mod.log_transaction("ACC0001", "DEPOSIT", float(n), float(n))
+               for n in range(1, 26)]
+        history_mod.log_transaction("ACC0002", "DEPOSIT", 1.0, 1.0)
+        
+        first = history_mod.get_history_page("ACC0001", limit=10)
+        assert [t["transaction_id"] for t in first["transactions"]] == ids[:-11:-1]
+        # 翻頁期間新增的交易只出現在最前面，不會讓後面的頁面錯位
+        history_mod.log_transaction("ACC0001", "WITHDRAW", 1.0, 0.0)
+        second = history_mod.get_history_page("ACC0001", 10, after=first["next_cursor"])
+        assert [t["transaction_id"] for t in second["transactions"]] == ids[-11:-21:-1], \
+            f"❌ {storage}: 第二頁錯誤"
+        
+        if storage == "log":
+            # 第 k 頁與第 1 頁相同：只讀取 limit 筆
+            dm = history_mod.data_manager
+            reads = []
+            original = dm._read_mapped
+            dm._read_mapped = lambda position: (reads.append(position), original(position))[1]
+            third = history_mod.get_history_page("ACC0001", 10, after=second["next_cursor"])
+            dm._read_mapped = original
+            assert len(reads) == 5, f"❌ 應只讀取 5 筆: {len(reads)}"
+        else:
+            third = history_mod.get_history_page("ACC0001", 10, after=second["next_cursor"])
+        assert [t["transaction_id"] for t in third["transactions"]] == ids[4::-1]
+        assert third["next_cursor"] is None, f"❌ {storage}: 最後一頁不應有游標"
+        assert history_mod.get_history("ACC0001", 3, after=first["next_cursor"])[0]["amount"] == 15.0
+        
+        for bad in ("not-a-cursor", first["next_cursor"][:-2]):
+            try:
+                history_mod.get_history_page("ACC0001", 10, after=bad)
+                assert False, "❌ 無效的游標應拋出 ValueError"
+            except ValueError:
+                pass
+        try:
+            history_mod.get_history_page("ACC0002", 10, after=first["next_cursor"])
+            assert False, "❌ 其他帳戶的游標應拋出 ValueError"
+        except ValueError:
+            pass
+        history_mod.data_manager.close()
+        cleanup_test_env(test_dir)
+    
+    print("✅ 測試通過")
+
+
+def test_get_history_range():
+    """測試：時間區間查詢與逐筆比對結果相同，且只讀取區間附近的記錄"""
+    print("測試：時間區間查詢...")
+    transactions = [
+        {"transaction_id": f"TXN{n:04d}", "account_id": f"ACC000{n % 3 + 1}",
+         "type": "DEPOSIT", "amount": n, "balance_after": n,
+         "timestamp": f"2025-10-{n // 10 + 1:02d}T{n % 10:02d}:00:00"}
+        for n in range(1, 300)
+    ]
+    windows = [("2025-10-05", "2025-10-09"), ("2025-10-03T04:00:00", "2025-10-03T07:00:00"),
+               (None, "2025-10-02"), ("2025-10-29", None), ("2025-12-01", None), (None, None)]
+    for storage in ("json", "log", "sqlite"):
+        if storage == "sqlite":
+            history_mod, test_dir = setup_test_env(backend="sqlite")
+        else:
+            history_mod, test_dir = setup_test_env(transaction_storage=storage, segment_max_bytes=2000)
+        dm = history_mod.data_manager
+        dm.save_transactions(transactions)
+        
+        for start, end in windows:
+            for account_id in (None, "ACC0002"):
+                expected = [t["transaction_id"] for t in transactions
+                            if (start is None or t["timestamp"] >= start)
+                            and (end is None or t["timestamp"] < end)
+                            and account_id in (None, t["account_id"])]
+                ids = [t["transaction_id"] for t in history_mod.get_history_range(account_id, start, end)]
+                assert ids == expected, f"❌ {storage} {account_id} [{start}, {end}): {ids}"
+        
+        if storage == "log":
+            # 二分搜尋：只讀取 O(log n) 筆定位，加上區間內與邊界放寬範圍的記錄
+            reads = []
+            original = dm._read_mapped
+            dm._read_mapped = lambda position: (reads.append(position), original(position))[1]
+            ids = list(history_mod.get_history_range("ACC0001", "2025-10-20", "2025-10-21"))
+            dm._read_mapped = original
+            assert len(ids) == 3 and len(reads) < 15, f"❌ 讀取過多: {len(reads)}"
+        history_mod.data_manager.close()
+        cleanup_test_env(test_dir)
+    
+    print("✅ 測試通過")
 
 
 # ==================== 執行所有測試 ====================
@@ -134,11 +344,14 @@ if __name__ == "__main__":
     # 已提供的測試
     test_log_transaction()
     test_get_history()
-    
-    # 留白的測試（組員補充）
-    # test_get_history_with_limit()
-    # test_get_history_empty()
-    # test_get_history_by_type()
+    test_get_transaction()
+    test_iter_transactions()
+    test_iter_json_array_small_chunks()
+    test_get_history_with_limit()
+    test_get_history_empty()
+    test_get_history_by_type()
+    test_get_history_pagination()
+    test_get_history_range()
     
     print()
     print("=" * 50)
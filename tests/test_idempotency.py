@@ -0,0 +1,199 @@
+"""
+Idempotency Store 測試
+負責人：整合者
+
+測試涵蓋：
+- 查詢與新增
+- LRU 上限與 TTL 過期
+- 持久化與重新載入
+- 檔案壓縮
+- 批次寫入與捨棄
+- 請求指紋比對
+- 由工作單元寫入的記錄（committed）
+"""
+
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.idempotency import IdempotencyStore, encode_records, request_fingerprint
+
+
+def setup_test_env(**kwargs):
+    """建立測試環境"""
+    test_dir = "test_data_idempotency"
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    os.makedirs(test_dir)
+
+    path = os.path.join(test_dir, "idempotency.jsonl")
+    return IdempotencyStore(path, **kwargs), path, test_dir
+
+
+def cleanup_test_env(test_dir):
+    """清理測試環境"""
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+
+# ==================== 測試案例 ====================
+
+def test_get_put_and_reload():
+    """測試：新增後可查詢，重新開啟後仍存在"""
+    print("測試：冪等鍵查詢與持久化...")
+    store, path, test_dir = setup_test_env()
+
+    assert store.get("req-1") is None
+    store.put("req-1", {"success": True, "transaction_id": "TXN0001", "new_balance": 1500.0})
+    assert store.get("req-1")["transaction_id"] == "TXN0001"
+
+    reopened = IdempotencyStore(path)
+    assert reopened.get("req-1") == {"success": True, "transaction_id": "TXN0001", "new_balance": 1500.0}
+    assert reopened.get("req-2") is None
+
+    # 另一個實例（模擬其他程序）新增的鍵，查不到時會補讀
+    store.put("req-2", {"success": True, "transaction_id": "TXN0002"})
+    assert reopened.get("req-2")["transaction_id"] == "TXN0002", "❌ 應讀到其他實例新增的鍵"
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_lru_and_ttl():
+    """測試：超過上限淘汰最久未使用的鍵，過期的鍵視為不存在"""
+    print("測試：LRU 上限與 TTL...")
+    store, path, test_dir = setup_test_env(max_entries=3)
+    for n in range(3):
+        store.put(f"k{n}", {"n": n})
+    assert store.get("k0") == {"n": 0}   # k0 變成最近使用
+    store.put("k3", {"n": 3})            # 淘汰 k1
+    assert store.get("k1") is None, "❌ 最久未使用的鍵應被淘汰"
+    assert store.get("k0") is not None and len(store) == 3
+
+    short, _, _ = setup_test_env(ttl=0.05)
+    short.put("k", {"n": 1})
+    assert short.get("k") is not None
+    time.sleep(0.1)
+    assert short.get("k") is None, "❌ 過期的鍵應視為不存在"
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_compaction_bounds_file():
+    """測試：大量鍵寫入後檔案行數仍有上限"""
+    print("測試：檔案壓縮...")
+    store, path, test_dir = setup_test_env(max_entries=50)
+    for n in range(1000):
+        store.put(f"k{n}", {"n": n})
+    with open(path, 'rb') as f:
+        lines = f.read().count(b"\n")
+    assert lines <= 2 * 50, f"❌ 檔案應被壓縮: {lines} 行"
+    assert len(store) == 50
+
+    reopened = IdempotencyStore(path, max_entries=50)
+    assert reopened.get("k999") == {"n": 999}
+    assert reopened.get("k0") is None
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_batch_commit_and_discard():
+    """測試：批次結束才寫入；批次中發生例外時捨棄"""
+    print("測試：冪等鍵批次...")
+    store, path, test_dir = setup_test_env()
+    with store.batch():
+        store.put("a", {"n": 1})
+        store.put("b", {"n": 2})
+        assert not os.path.exists(path), "❌ 批次中不應寫檔"
+    assert IdempotencyStore(path).get("b") == {"n": 2}
+
+    try:
+        with store.batch():
+            store.put("c", {"n": 3})
+            raise RuntimeError("中途失敗")
+    except RuntimeError:
+        pass
+    assert store.get("c") is None, "❌ 失敗的批次不應保留鍵"
+    assert IdempotencyStore(path).get("c") is None
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_fingerprint_mismatch():
+    """測試：同一個鍵帶著不同的請求指紋時拒絕；沒有指紋的舊記錄照常回傳"""
+    print("測試：請求指紋...")
+    store, path, test_dir = setup_test_env()
+    fingerprint = request_fingerprint("deposit", "ACC0001", 50000)
+    assert fingerprint == request_fingerprint("deposit", "ACC0001", 50000)
+    store.put("req-1", {"n": 1}, fingerprint)
+
+    assert store.get("req-1", fingerprint) == {"n": 1}
+    assert store.get("req-1") == {"n": 1}, "❌ 不帶指紋的查詢不比對"
+    try:
+        store.get("req-1", request_fingerprint("deposit", "ACC0001", 60000))
+        assert False, "❌ 指紋不同應拋出 ValueError"
+    except ValueError:
+        pass
+    try:
+        IdempotencyStore(path).get("req-1", request_fingerprint("withdraw", "ACC0001", 50000))
+        assert False, "❌ 重新載入後仍應比對指紋"
+    except ValueError:
+        pass
+
+    store.put("legacy", {"n": 2})
+    assert store.get("legacy", fingerprint) == {"n": 2}, "❌ 沒有指紋的記錄應接受"
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_committed_records():
+    """測試：已由其他人寫入檔案的記錄（工作單元）只登記，不重複寫入"""
+    print("測試：工作單元寫入的記錄...")
+    store, path, test_dir = setup_test_env()
+    record = store.record("a", {"n": 1}, "fp")
+    with open(path, 'ab') as f:
+        f.write(encode_records([record]))
+    store.committed([record])
+    assert store.get("a", "fp") == {"n": 1}
+    with open(path, 'rb') as f:
+        assert f.read().count(b"\n") == 1, "❌ 不應重複寫入"
+
+    try:
+        with store.batch():
+            store.committed([store.record("b", {"n": 2})])
+            assert store.get("b") == {"n": 2}
+            raise RuntimeError("中途失敗")
+    except RuntimeError:
+        pass
+    assert store.get("b") is None, "❌ 失敗的批次不應保留鍵"
+
+    print("✅ 測試通過")
+    cleanup_test_env(test_dir)
+
+
+# ==================== 執行所有測試 ====================
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("開始測試 Idempotency Store")
+    print("=" * 50)
+    print()
+
+    test_get_put_and_reload()
+    test_lru_and_ttl()
+    test_compaction_bounds_file()
+    test_batch_commit_and_discard()
+    test_fingerprint_mismatch()
+    test_committed_records()
+
+    print()
+    print("=" * 50)
+    print("測試完成！")
+    print("=" * 50)
@@ -0,0 +1,71 @@
+"""
+Money Module 測試
+負責人：整合者
+
+測試涵蓋：
+- 元 ↔ 分換算
+- 無效金額
+- 舊版 float 金額讀取
+"""
+
+import os
+import sys
+from decimal import Decimal
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.money import read_minor, to_major, to_minor
+
+
+# ==================== 測試案例 ====================
+
+def test_conversions():
+    """測試：元 ↔ 分換算沒有誤差"""
+    print("測試：金額換算...")
+    assert to_minor(1500) == 150000
+    assert to_minor(1500.5) == 150050
+    assert to_minor(0.1 + 0.2) == 30, "❌ float 誤差應捨入到最近的分"
+    assert to_minor(Decimal("19.99")) == 1999
+    assert to_minor(-0.01) == -1
+    assert to_major(30) == 0.3
+    assert to_major(to_minor(1234567.89)) == 1234567.89
+    print("✅ 測試通過")
+
+
+def test_invalid_amounts():
+    """測試：無法表示為整數分的金額拋出 ValueError"""
+    print("測試：無效金額...")
+    for amount in (0.001, Decimal("1.005"), float("nan"), float("inf"), "100", None, True):
+        try:
+            to_minor(amount)
+            assert False, f"❌ 應拋出 ValueError: {amount!r}"
+        except ValueError:
+            pass
+    print("✅ 測試通過")
+
+
+def test_read_legacy_values():
+    """測試：舊版 float（元）換算成分，int（分）原樣回傳"""
+    print("測試：讀取舊版金額...")
+    assert read_minor(100.1) == 10010
+    assert read_minor(1000.0) == 100000
+    assert read_minor(10010) == 10010
+    print("✅ 測試通過")
+
+
+# ==================== 執行所有測試 ====================
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("開始測試 Money Module")
+    print("=" * 50)
+    print()
+
+    test_conversions()
+    test_invalid_amounts()
+    test_read_legacy_values()
+
+    print()
+    print("=" * 50)
+    print("測試完成！")
+    print("=" * 50)
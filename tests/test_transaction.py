@@ -6,12 +6,19 @@ Transaction Module 測試
 - 存款
 - 提款
 - 轉帳
+- 一對多付款
+- 冪等鍵（參數比對、與資料同一個工作單元寫入）
+- 批次操作中型別錯誤的操作只讓該筆失敗
 - 錯誤處理
 """
 
+import multiprocessing
 import os
+import random
 import shutil
+import subprocess
 import sys
+import threading
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -21,13 +28,13 @@ from modules.history import HistoryModule
 from modules.transaction import TransactionModule
 
 
-def setup_test_env():
+def setup_test_env(**kwargs):
     """建立測試環境"""
     test_dir = "test_data_transaction"
     if os.path.exists(test_dir):
         shutil.rmtree(test_dir)
     
-    data_manager = DataManager(data_dir=test_dir)
+    data_manager = DataManager(data_dir=test_dir, **kwargs)
     account_mod = AccountModule(data_manager)
     history_mod = HistoryModule(data_manager)
     transaction_mod = TransactionModule(account_mod, history_mod)
@@ -148,6 +155,549 @@ def test_transfer_to_self():
     pass
 
 
+def test_transfer_rollback():
+    """測試：轉帳寫入失敗時兩個帳戶都不變"""
+    print("測試：轉帳失敗回滾...")
+    transaction_mod, account_mod, history_mod, test_dir = setup_test_env()
+    dm = account_mod.data_manager
+    
+    acc_a = account_mod.create_account("A", 1000.0)
+    acc_b = account_mod.create_account("B", 500.0)
+    
+    dm.append_transactions = lambda transactions: False
+    try:
+        transaction_mod.transfer(acc_a, acc_b, 300.0)
+        assert False, "❌ 寫入失敗時應拋出例外"
+    except OSError:
+        pass
+    del dm.append_transactions
+    
+    dm.invalidate_cache()
+    assert account_mod.get_account(acc_a)["balance"] == 1000.0, "❌ 轉出帳戶不應被扣款"
+    assert account_mod.get_account(acc_b)["balance"] == 500.0, "❌ 轉入帳戶不應入帳"
+    assert history_mod.get_all_transactions() == [], "❌ 不應留下交易記錄"
+    
+    result = transaction_mod.transfer(acc_a, acc_b, 300.0)
+    assert result["from_balance"] == 700.0 and result["to_balance"] == 800.0
+    transactions = history_mod.get_all_transactions()
+    assert [t["type"] for t in transactions] == ["TRANSFER_OUT", "TRANSFER_IN"], "❌ 應有兩筆交易"
+    
+    print("✅ 轉帳失敗回滾測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_idempotency_key():
+    """測試：相同 idempotency_key 重送不會重複入帳"""
+    print("測試：冪等鍵...")
+    transaction_mod, account_mod, history_mod, test_dir = setup_test_env()
+    acc_a = account_mod.create_account("A", 1000.0)
+    acc_b = account_mod.create_account("B", 0.0)
+    
+    first = transaction_mod.deposit(acc_a, 500.0, idempotency_key="dep-1")
+    retry = transaction_mod.deposit(acc_a, 500.0, idempotency_key="dep-1")
+    assert retry == first, "❌ 重送應回傳第一次的結果"
+    assert account_mod.get_account(acc_a)["balance"] == 1500.0, "❌ 重送不應重複存款"
+    
+    transaction_mod.withdraw(acc_a, 100.0, idempotency_key="wd-1")
+    transaction_mod.transfer(acc_a, acc_b, 400.0, idempotency_key="tr-1")
+    transaction_mod.transfer(acc_a, acc_b, 400.0, idempotency_key="tr-1")
+    assert account_mod.get_account(acc_a)["balance"] == 1000.0
+    assert account_mod.get_account(acc_b)["balance"] == 400.0
+    
+    # 失敗的操作不記錄：補足餘額後重送可成功
+    try:
+        transaction_mod.withdraw(acc_b, 600.0, idempotency_key="wd-2")
+        assert False, "❌ 餘額不足應失敗"
+    except ValueError:
+        pass
+    transaction_mod.deposit(acc_b, 200.0)
+    assert transaction_mod.withdraw(acc_b, 600.0, idempotency_key="wd-2")["new_balance"] == 0.0
+    
+    # 重新啟動後（新的模組實例）仍記得
+    restarted = TransactionModule(AccountModule(DataManager(data_dir=test_dir)),
+                                  HistoryModule(DataManager(data_dir=test_dir)))
+    assert restarted.deposit(acc_a, 500.0, idempotency_key="dep-1") == first, "❌ 重啟後應記得冪等鍵"
+    
+    # 批次中重送；dep-1 帶著不同的參數時該筆失敗
+    results = transaction_mod.apply_batch([
+        {"op": "deposit", "account_id": acc_b, "amount": 50.0, "idempotency_key": "dep-2"},
+        {"op": "deposit", "account_id": acc_b, "amount": 50.0, "idempotency_key": "dep-2"},
+        {"op": "deposit", "account_id": acc_b, "amount": 50.0, "idempotency_key": "dep-1"},
+    ])
+    assert results[0] == results[1]
+    assert results[2]["success"] is False and "dep-1" in results[2]["error"], "❌ 不同參數的重送應失敗"
+    assert account_mod.get_account(acc_b)["balance"] == 50.0, "❌ 批次中重送不應重複存款"
+    assert len(history_mod.get_all_transactions()) == 7, "❌ 交易筆數錯誤"  # 轉帳記兩筆
+    
+    # 同一個鍵用於不同的請求：拒絕，不回傳其他請求的結果
+    try:
+        transaction_mod.deposit(acc_a, 600.0, idempotency_key="dep-1")
+        assert False, "❌ 不同金額重送同一個鍵應拋出 ValueError"
+    except ValueError:
+        pass
+    try:
+        transaction_mod.withdraw(acc_a, 500.0, idempotency_key="dep-1")
+        assert False, "❌ 不同操作重送同一個鍵應拋出 ValueError"
+    except ValueError:
+        pass
+    assert account_mod.get_account(acc_a)["balance"] == 1000.0
+    assert transaction_mod.deposit(acc_a, 500, idempotency_key="dep-1") == first, "❌ 金額寫法不同仍是同一個請求"
+    
+    print("✅ 冪等鍵測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_idempotency_key_same_unit_of_work():
+    """測試：冪等鍵與餘額、交易在同一個工作單元寫入，當機時兩者同進退"""
+    print("測試：冪等鍵與資料一起提交...")
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    prelude = ("import os, sys; sys.path.insert(0, '.')\n"
+               "from modules.data_manager import DataManager\n"
+               "from modules.account import AccountModule\n"
+               "from modules.history import HistoryModule\n"
+               "from modules.transaction import TransactionModule\n"
+               "dm = DataManager(%r, **%r)\n"
+               "bank = TransactionModule(AccountModule(dm), HistoryModule(dm))\n")
+    
+    def reopen(test_dir):
+        data_manager = DataManager(data_dir=test_dir)
+        account_mod = AccountModule(data_manager)
+        history_mod = HistoryModule(data_manager)
+        return TransactionModule(account_mod, history_mod), account_mod, history_mod
+    
+    # 回傳後立即結束（不 close）：重開後重送回傳第一次的結果，不重複存款
+    for kwargs in ({}, {"transaction_storage": "log", "group_commit_window": 0.05},
+                   {"wal": True}, {"backend": "sqlite"}):
+        _, account_mod, history_mod, test_dir = setup_test_env(**kwargs)
+        acc = account_mod.create_account("A", 100.0)
+        account_mod.data_manager.close()
+        code = prelude % (os.path.abspath(test_dir), kwargs) + (
+            "print(bank.deposit(%r, 50.0, idempotency_key='dep-1')['transaction_id'])\n"
+            "os._exit(0)" % acc)
+        done = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True)
+        assert done.returncode == 0, done.stderr
+        
+        transaction_mod, account_mod, history_mod = reopen(test_dir)
+        retry = transaction_mod.deposit(acc, 50.0, idempotency_key="dep-1")
+        assert retry["transaction_id"] == done.stdout.strip(), f"❌ 重開後應記得冪等鍵 ({kwargs})"
+        assert account_mod.get_account(acc)["balance"] == 150.0, f"❌ 不應重複存款 ({kwargs})"
+        account_mod.data_manager.close()
+        cleanup_test_env(test_dir)
+    
+    # WAL 提交前當機：存款與冪等鍵都沒有寫入，重送照常處理一次
+    _, account_mod, history_mod, test_dir = setup_test_env(wal=True)
+    acc = account_mod.create_account("A", 100.0)
+    account_mod.data_manager.close()
+    code = prelude % (os.path.abspath(test_dir), {"wal": True}) + (
+        "dm._wal_commit = lambda: os._exit(0)\n"
+        "bank.deposit(%r, 50.0, idempotency_key='dep-1')\n"
+        "sys.exit(1)" % acc)
+    assert subprocess.run([sys.executable, "-c", code], cwd=root).returncode == 0
+    transaction_mod, account_mod, history_mod = reopen(test_dir)
+    assert account_mod.get_account(acc)["balance"] == 100.0
+    assert transaction_mod.idempotency.get("dep-1") is None, "❌ 未提交的冪等鍵不應存在"
+    first = transaction_mod.deposit(acc, 50.0, idempotency_key="dep-1")
+    assert transaction_mod.deposit(acc, 50.0, idempotency_key="dep-1") == first
+    assert account_mod.get_account(acc)["balance"] == 150.0
+    account_mod.data_manager.close()
+    cleanup_test_env(test_dir)
+    
+    print("✅ 冪等鍵與資料一起提交測試通過")
+
+
+def test_integer_money():
+    """測試：金額以整數分計算，不累積誤差；舊版 float 資料可直接使用"""
+    print("測試：整數金額...")
+    transaction_mod, account_mod, history_mod, test_dir = setup_test_env()
+    acc = account_mod.create_account("A", 0.0)
+    
+    # float 逐筆相加 1000 次 0.1 會得到 99.9999999999986
+    transaction_mod.apply_batch([{"op": "deposit", "account_id": acc, "amount": 0.1}] * 1000)
+    assert account_mod.get_account(acc)["balance"] == 100.0, "❌ 餘額應完全等於 100.0"
+    assert account_mod.get_account(acc, minor_units=True)["balance"] == 10000
+    stored = history_mod.data_manager.get_account_transactions(acc)[-1]
+    assert stored["amount"] == 10 and stored["balance_after"] == 10000, "❌ 儲存層應為整數分"
+    total = sum(t["amount"] for t in history_mod.iter_transactions(minor_units=True))
+    assert total == 10000 and isinstance(total, int)
+    
+    try:
+        transaction_mod.deposit(acc, 0.001)
+        assert False, "❌ 小於 1 分的金額應拋出 ValueError"
+    except ValueError:
+        pass
+    
+    # 舊版資料：餘額與交易金額為 float（元）
+    dm = account_mod.data_manager
+    legacy = account_mod.create_account("Legacy", 0.0)
+    dm.update_balance(legacy, 100.1)
+    dm.append_transaction({"transaction_id": "TXN9000", "account_id": legacy, "type": "DEPOSIT",
+                           "amount": 100.1, "balance_after": 100.1, "timestamp": "2025-01-01T00:00:00"})
+    assert account_mod.get_account(legacy)["balance"] == 100.1
+    assert transaction_mod.deposit(legacy, 0.2)["new_balance"] == 100.3
+    assert dm.get_account(legacy)["balance"] == 10030, "❌ 更新後應以整數分寫回"
+    assert [t["amount"] for t in history_mod.get_history(legacy, limit=0)] == [0.2, 100.1]
+    
+    print("✅ 整數金額測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_apply_batch():
+    """測試：批次操作（成功與失敗混合）"""
+    print("測試：批次操作...")
+    transaction_mod, account_mod, history_mod, test_dir = setup_test_env()
+    
+    acc_a = account_mod.create_account("A", 1000.0)
+    acc_b = account_mod.create_account("B", 500.0)
+    
+    results = transaction_mod.apply_batch([
+        {"op": "deposit", "account_id": acc_a, "amount": 100.0},
+        {"op": "withdraw", "account_id": acc_b, "amount": 9999.0},
+        {"op": "transfer", "from_account_id": acc_a, "to_account_id": acc_b, "amount": 600.0},
+        {"op": "withdraw", "account_id": acc_a, "amount": 600.0},
+        {"op": "refund", "account_id": acc_a, "amount": 1.0},
+        {"op": "deposit", "account_id": acc_a},
+        None,
+        ["deposit", acc_a, 1.0],
+    ])
+    
+    assert [r["success"] for r in results] == [True, False, True, False, False, False, False, False], \
+        "❌ 個別結果錯誤"
+    assert results[1]["error"] == "餘額不足", "❌ 失敗原因錯誤"
+    assert results[6]["error"].startswith("操作格式錯誤"), "❌ 非 dict 的操作應只讓該筆失敗"
+    assert results[3]["error"] == "餘額不足", "❌ 後面的操作應看到前面的結果"
+    
+    # 重新讀檔確認已寫入
+    account_mod.data_manager.invalidate_cache()
+    assert account_mod.get_account(acc_a)["balance"] == 500.0, "❌ A 餘額錯誤"
+    assert account_mod.get_account(acc_b)["balance"] == 1100.0, "❌ B 餘額錯誤"
+    assert len(history_mod.get_all_transactions()) == 3, "❌ 交易筆數錯誤"
+    
+    print("✅ 批次操作測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_apply_batch_bad_ids():
+    """測試：帳號為 None / list 等型別錯誤只讓該筆失敗，不回滾整批"""
+    print("測試：批次操作帳號型別錯誤...")
+    transaction_mod, account_mod, history_mod, test_dir = setup_test_env(account_shards=4)
+    
+    acc_a = account_mod.create_account("A", 1000.0)
+    
+    results = transaction_mod.apply_batch([
+        {"op": "deposit", "account_id": acc_a, "amount": 100.0},
+        {"op": "deposit", "account_id": None, "amount": 1.0},
+        {"op": "withdraw", "account_id": ["x"], "amount": 1.0},
+        {"op": "transfer", "from_account_id": acc_a, "to_account_id": {"x": 1}, "amount": 1.0},
+        {"op": ["deposit"], "account_id": acc_a, "amount": 1.0},
+        {"op": "deposit", "account_id": acc_a, "amount": 1.0, "idempotency_key": ["k"]},
+        {"op": "deposit", "account_id": acc_a, "amount": 50.0},
+    ])
+    
+    assert [r["success"] for r in results] == [True, False, False, False, False, False, True], \
+        f"❌ 個別結果錯誤: {results}"
+    assert "格式錯誤" in results[1]["error"], "❌ 失敗原因錯誤"
+    
+    account_mod.data_manager.invalidate_cache()
+    assert account_mod.get_account(acc_a)["balance"] == 1150.0, "❌ 有效的操作應寫入"
+    assert len(history_mod.get_all_transactions()) == 2, "❌ 交易筆數錯誤"
+    
+    print("✅ 批次操作帳號型別錯誤測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_apply_batch_single_persist():
+    """測試：批次操作只寫一次檔案"""
+    print("測試：批次操作寫檔次數...")
+    transaction_mod, account_mod, history_mod, test_dir = setup_test_env()
+    dm = account_mod.data_manager
+    
+    ids = [account_mod.create_account(f"user{i}", 1000.0) for i in range(5)]
+    ops = [{"op": "deposit", "account_id": ids[i % 5], "amount": 1.0} for i in range(200)]
+    
+    writes = []
+    original = dm._write_atomic
+    def counting_write(filepath, data):
+        writes.append(os.path.basename(filepath))
+        return original(filepath, data)
+    dm._write_atomic = counting_write
+    
+    results = transaction_mod.apply_batch(ops)
+    
+    assert all(r["success"] for r in results), "❌ 所有存款應成功"
+    assert writes.count("accounts.json") == 1, "❌ 帳戶檔應只寫一次"
+    assert writes.count("transactions.json") == 1, "❌ 交易檔應只寫一次"
+    assert account_mod.get_account(ids[0])["balance"] == 1040.0, "❌ 餘額錯誤"
+    
+    print("✅ 批次操作寫檔次數測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_group_commit_deposits():
+    """測試：群組提交時，多個執行緒的存款（工作單元）共用同一次寫入"""
+    print("測試：群組提交存款...")
+    transaction_mod, account_mod, history_mod, test_dir = setup_test_env(group_commit_window=0.2)
+    dm = account_mod.data_manager
+    with dm.batch():
+        ids = [account_mod.create_account(f"user{i}", 0.0) for i in range(10)]
+    
+    writes = []
+    original = dm._write_atomic
+    def counting_write(filepath, data):
+        writes.append(os.path.basename(filepath))
+        return original(filepath, data)
+    dm._write_atomic = counting_write
+    
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.append(transaction_mod.deposit(ids[i], 10.0)))
+               for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(results) == 10 and all(r["success"] for r in results), "❌ 所有存款應成功"
+    assert writes.count("accounts.json") <= 2, f"❌ 帳戶檔應合併寫入: {writes}"
+    assert writes.count("transactions.json") <= 2, f"❌ 交易檔應合併寫入: {writes}"
+    
+    # 回傳時已落盤
+    reopened = DataManager(data_dir=test_dir)
+    assert all(reopened.get_account(i)["balance"] == 1000 for i in ids), "❌ 存款應已落盤"
+    assert len(reopened.load_transactions()) == 10
+    
+    print("✅ 群組提交存款測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_disburse():
+    """測試：一對多付款，整批或盡力處理"""
+    print("測試：一對多付款...")
+    transaction_mod, account_mod, history_mod, test_dir = setup_test_env()
+    dm = account_mod.data_manager
+    payer = account_mod.create_account("Payer", 1000.0)
+    ids = [account_mod.create_account(f"user{i}", 0.0) for i in range(200)]
+    
+    writes = []
+    original = dm._write_atomic
+    def counting_write(filepath, data):
+        writes.append(os.path.basename(filepath))
+        return original(filepath, data)
+    dm._write_atomic = counting_write
+    
+    result = transaction_mod.disburse(payer, [(account_id, 2.5) for account_id in ids] + [(ids[0], 0.5)])
+    dm._write_atomic = original
+    assert result["from_balance"] == 499.5 and result["total"] == 500.5
+    assert all(r["success"] for r in result["results"])
+    assert result["results"][-1]["to_balance"] == 3.0, "❌ 同一帳戶多筆付款應累加"
+    assert account_mod.get_account(ids[0])["balance"] == 3.0
+    assert writes.count("accounts.json") == 1 and writes.count("transactions.json") == 1, \
+        f"❌ 應只寫一次檔案: {writes}"
+    out = history_mod.get_transaction(result["results"][0]["transaction_id"])
+    assert out["type"] == "TRANSFER_OUT" and out["related_account"] == ids[0]
+    assert out["balance_after"] == 997.5
+    assert len(history_mod.get_all_transactions()) == 2 * 201
+    
+    # 整批：任何一筆無效或總額超過餘額都不動任何帳戶
+    for payments, message in (([(ids[1], 10.0), ("ACC9999", 1.0)], "轉入帳戶不存在"),
+                              ([(ids[1], 10.0), (payer, 1.0)], "不能轉帳給自己"),
+                              ([(ids[1], 400.0), (ids[2], 200.0)], "餘額不足")):
+        try:
+            transaction_mod.disburse(payer, payments)
+            assert False, f"❌ 應拋出 ValueError: {message}"
+        except ValueError as e:
+            assert message in str(e), f"❌ 錯誤訊息不符: {e}"
+    assert account_mod.get_account(payer)["balance"] == 499.5
+    assert account_mod.get_account(ids[1])["balance"] == 2.5
+    
+    # 盡力處理：無效與餘額用完後的付款失敗，其餘入帳
+    result = transaction_mod.disburse(payer, [(ids[1], 300.0), ("ACC9999", 1.0),
+                                              (ids[2], 300.0), (ids[3], 199.5)],
+                                      all_or_nothing=False)
+    assert [r["success"] for r in result["results"]] == [True, False, False, True]
+    assert result["results"][2]["error"] == "餘額不足"
+    assert result["from_balance"] == 0.0 and result["total"] == 499.5
+    assert account_mod.get_account(ids[2])["balance"] == 2.5
+    
+    # 格式錯誤的付款明細：整批時拋出 ValueError，盡力處理時只讓該筆失敗
+    try:
+        transaction_mod.disburse(payer, [(ids[1],)])
+        assert False, "❌ 應拋出 ValueError: 付款格式錯誤"
+    except ValueError as e:
+        assert "付款格式錯誤" in str(e), f"❌ 錯誤訊息不符: {e}"
+    
+    # 盡力處理但沒有任何一筆成功：回報失敗，不寫入、轉出帳戶版本不變
+    version = account_mod.get_account(payer)["version"]
+    result = transaction_mod.disburse(payer, [(ids[1],), None, (["x"], 1.0), (ids[4], 1.0)],
+                                      all_or_nothing=False)
+    assert result["success"] is False and result["total"] == 0.0, f"❌ 應回報失敗: {result}"
+    assert [r["success"] for r in result["results"]] == [False, False, False, False]
+    assert result["results"][3]["error"] == "餘額不足"
+    assert account_mod.get_account(payer)["version"] == version, "❌ 沒有付款時不應寫入轉出帳戶"
+    assert len(history_mod.get_all_transactions()) == 2 * 201 + 2 * 2
+    
+    print("✅ 一對多付款測試通過")
+    cleanup_test_env(test_dir)
+
+
+def test_optimistic_concurrency():
+    """測試：帳戶版本號 compare-and-swap，衝突時重新讀取後重試"""
+    print("測試：樂觀並行控制...")
+    for backend in ("json", "sqlite"):
+        transaction_mod, account_mod, history_mod, test_dir = setup_test_env(backend=backend)
+        acc = account_mod.create_account("A", 100.0)
+        other = account_mod.create_account("B", 0.0)
+        
+        account = account_mod.get_account(acc)
+        assert account["version"] == 0
+        assert account_mod.update_balance(acc, 150.0, expected_version=0) is True
+        assert account_mod.update_balance(acc, 999.0, expected_version=0) is False, \
+            f"❌ 版本不符不應寫入 ({backend})"
+        assert account_mod.get_account(acc) == dict(account, balance=150.0, version=1)
+        
+        # 讀取帳戶之後、寫入之前，另一個寫入者把餘額改成 200：存款應以 200 重算
+        original = account_mod.get_account
+        interfered = []
+        def racing_get_account(account_id, minor_units=False):
+            result = original(account_id, minor_units)
+            if not interfered:
+                interfered.append(account_id)
+                account_mod.update_balance(acc, 200.0)
+            return result
+        account_mod.get_account = racing_get_account
+        result = transaction_mod.deposit(acc, 10.0)
+        assert result["new_balance"] == 210.0, f"❌ 衝突後應重試 ({backend}): {result}"
+        
+        interfered.clear()
+        result = transaction_mod.transfer(acc, other, 10.0)
+        account_mod.get_account = original
+        assert (result["from_balance"], result["to_balance"]) == (190.0, 10.0), \
+            f"❌ 轉帳衝突後應重試 ({backend}): {result}"
+        assert account_mod.get_account(acc)["version"] == 5
+        balances = [t["balance_after"] for t in history_mod.get_history(acc, limit=0)]
+        assert balances == [190.0, 210.0], f"❌ 交易記錄錯誤 ({backend}): {balances}"
+        
+        if backend == "sqlite":
+            account_mod.data_manager.close()
+        cleanup_test_env(test_dir)
+    
+    print("✅ 樂觀並行控制測試通過")
+
+
+def test_concurrent_operations_conserve_money():
+    """測試：多執行緒同時存款 / 轉帳，總金額守恆且不遺失更新"""
+    print("測試：多執行緒壓力測試...")
+    for backend in ("json", "sqlite"):
+        transaction_mod, account_mod, history_mod, test_dir = setup_test_env(backend=backend)
+        ids = [account_mod.create_account(f"user{i}", 1000.0) for i in range(6)]
+        hot = ids[0]
+        num_threads, ops_per_thread = 8, 40
+        deposited = []
+        errors = []
+        
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(ops_per_thread):
+                    if rng.random() < 0.3:
+                        # 所有執行緒都對同一個帳戶存款：檢查不會遺失更新
+                        transaction_mod.deposit(hot, 1.0)
+                        deposited.append(1.0)
+                    else:
+                        src, dst = rng.sample(ids, 2)
+                        try:
+                            transaction_mod.transfer(src, dst, float(rng.randint(1, 300)))
+                        except ValueError:
+                            pass  # 餘額不足
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert errors == [], f"❌ 執行緒發生例外: {errors}"
+        account_mod.data_manager.invalidate_cache()
+        total = sum(account_mod.get_account(i)["balance"] for i in ids)
+        assert total == 6000.0 + sum(deposited), f"❌ 總金額不守恆 ({backend}): {total}"
+        assert all(account_mod.get_account(i)["balance"] >= 0 for i in ids), "❌ 餘額不應為負"
+        
+        # 每筆交易的 balance_after 依序相接：同一帳戶沒有交錯的讀寫（儲存層為整數分）
+        for account_id in ids:
+            balance = 100000
+            for txn in history_mod.data_manager.get_account_transactions(account_id):
+                sign = 1 if txn["type"] in ("DEPOSIT", "TRANSFER_IN") else -1
+                balance += sign * txn["amount"]
+                assert txn["balance_after"] == balance, f"❌ 交易記錄不連續: {txn}"
+            assert balance == account_mod.get_account(account_id, minor_units=True)["balance"]
+        
+        if backend == "sqlite":
+            account_mod.data_manager.close()
+        cleanup_test_env(test_dir)
+    
+    print("✅ 多執行緒壓力測試通過")
+
+
+def _process_worker(test_dir, kwargs, shared_account, num_accounts, num_deposits, queue):
+    """子程序：建立帳戶並對共用帳戶存款，回傳建立的帳號"""
+    data_manager = DataManager(data_dir=test_dir, **kwargs)
+    account_mod = AccountModule(data_manager)
+    transaction_mod = TransactionModule(account_mod, HistoryModule(data_manager))
+    created = []
+    for i in range(max(num_accounts, num_deposits)):
+        if i < num_accounts:
+            created.append(account_mod.create_account(f"worker{os.getpid()}", 0.0))
+        if i < num_deposits:
+            transaction_mod.deposit(shared_account, 1.0)
+    data_manager.close()
+    queue.put(created)
+
+
+def test_multiprocess_no_duplicate_ids_or_lost_updates():
+    """測試：多個程序共用資料目錄，ID 不重複、存款不遺失"""
+    print("測試：多程序共用資料目錄...")
+    num_processes, num_accounts, num_deposits = 4, 10, 25
+    for kwargs in ({"id_block_size": 3}, {"id_block_size": 3, "transaction_storage": "log"},
+                   {"backend": "sqlite"}):
+        transaction_mod, account_mod, history_mod, test_dir = setup_test_env(**kwargs)
+        shared_account = account_mod.create_account("shared", 0.0)
+        account_mod.data_manager.close()
+        
+        queue = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=_process_worker,
+                args=(test_dir, kwargs, shared_account, num_accounts, num_deposits, queue)
+            )
+            for _ in range(num_processes)
+        ]
+        for process in processes:
+            process.start()
+        created = [account_id for _ in processes for account_id in queue.get(timeout=60)]
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0, f"❌ 子程序異常結束 ({kwargs})"
+        
+        data_manager = DataManager(data_dir=test_dir)
+        account_mod = AccountModule(data_manager)
+        transactions = data_manager.load_transactions()
+        transaction_ids = [txn["transaction_id"] for txn in transactions]
+        
+        assert len(set(created)) == num_processes * num_accounts, f"❌ 帳號重複 ({kwargs})"
+        assert len(data_manager.load_accounts()) == num_processes * num_accounts + 1, \
+            f"❌ 帳戶遺失 ({kwargs})"
+        assert len(set(transaction_ids)) == len(transaction_ids) == num_processes * num_deposits, \
+            f"❌ 交易 ID 重複或遺失 ({kwargs})"
+        assert account_mod.get_account(shared_account)["balance"] == num_processes * num_deposits, \
+            f"❌ 存款遺失 ({kwargs})"
+        assert len(data_manager.get_account_transactions(shared_account)) == num_processes * num_deposits
+        
+        data_manager.close()
+        cleanup_test_env(test_dir)
+    
+    print("✅ 多程序共用資料目錄測試通過")
+
+
 # ==================== 執行所有測試 ====================
 
 if __name__ == "__main__":
@@ -159,6 +709,18 @@ if __name__ == "__main__":
     # 已提供的測試
     test_deposit()
     test_deposit_invalid_amount()
+    test_transfer_rollback()
+    test_idempotency_key()
+    test_idempotency_key_same_unit_of_work()
+    test_integer_money()
+    test_apply_batch()
+    test_apply_batch_bad_ids()
+    test_apply_batch_single_persist()
+    test_group_commit_deposits()
+    test_disburse()
+    test_optimistic_concurrency()
+    test_concurrent_operations_conserve_money()
+    test_multiprocess_no_duplicate_ids_or_lost_updates()
     
     # 留白的測試（組員補充）
     # test_withdraw()